@@ -0,0 +1,350 @@
+"""
+Streaming CSV and Excel exports of milk lots, payment bills, invoices and
+milk transfers.
+
+Each export is a DATASETS entry: the model, the date field its from/to
+filters apply to, the other filters it accepts and its columns as
+``values_list`` lookups. Rows are read with ``.iterator(chunk_size=...)``,
+which uses a server-side cursor on PostgreSQL, and each chunk is encoded and
+handed to the StreamingHttpResponse before the next is read. Memory stays
+the same for a day or a year of rows, and bytes keep flowing, so a long
+export does not hit the worker timeout.
+
+CSV starts with a UTF-8 byte order mark so Excel opens it with the right
+encoding. Text cells that a spreadsheet would run as a formula (starting with
+=, +, -, @, tab or carriage return; supplier names and remarks are user input)
+are prefixed with an apostrophe. XLSX is written without a spreadsheet library. A workbook is a zip
+of a few small XML parts plus one sheet, so the sheet XML is deflated into
+the zip as it is produced. zipfile supports unseekable output by writing
+sizes after each entry. Cells are inline strings and plain numbers, so no
+style or shared-string tables need to be held in memory.
+"""
+import csv
+import re
+import zipfile
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+from xml.sax.saxutils import escape
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from accounting.models import MilkPaymentInvoice
+from dairy_project.conf import AppSettings, chunked
+from distribution.models import MilkTransfer
+from suppliers.models import MilkLot, PaymentBill
+
+DEFAULTS = {
+    "CHUNK_SIZE": 2000,
+}
+
+
+_setting = AppSettings("EXPORTS", DEFAULTS)
+
+
+class InvalidFilter(ValueError):
+    pass
+
+
+def _integer(value: str) -> int:
+    try:
+        return int(value)
+    except ValueError:
+        raise InvalidFilter(f"Expected a number, got {value!r}")
+
+
+def _boolean(value: str) -> bool:
+    if value.lower() in ("1", "true", "yes"):
+        return True
+    if value.lower() in ("0", "false", "no"):
+        return False
+    raise InvalidFilter(f"Expected true or false, got {value!r}")
+
+
+def _text(value: str) -> str:
+    return value
+
+
+@dataclass
+class Dataset:
+    title: str
+    model: type
+    date_lookup: str
+    columns: List[Tuple[str, str]]
+    # query parameter -> (lookup, parser)
+    filters: Dict[str, Tuple[str, Callable[[str], object]]] = field(default_factory=dict)
+
+
+DATASETS = {
+    "milk-lots": Dataset(
+        title="Milk lots",
+        model=MilkLot,
+        date_lookup="date_created",
+        columns=[
+            ("Lot", "pk"),
+            ("Date", "date_created"),
+            ("Supplier", "supplier__user__username"),
+            ("Route", "supplier__route__name"),
+            ("Volume (L)", "volume_l"),
+            ("Fat %", "fat_percent"),
+            ("SNF %", "snf"),
+            ("Protein %", "protein_percent"),
+            ("Lactose %", "lactose_percent"),
+            ("Total solids %", "total_solids"),
+            ("MUN (mg/dL)", "urea_nitrogen"),
+            ("Bacterial count", "bacterial_count"),
+            ("Added water %", "added_water_percent"),
+            ("Status", "status"),
+            ("Price per litre", "price_per_litre"),
+            ("Total price", "total_price"),
+            ("Bill", "bill_id"),
+            ("Needs retest", "needs_retest"),
+            ("Retest reason", "retest_reason"),
+        ],
+        filters={
+            "supplier": ("supplier_id", _integer),
+            "route": ("supplier__route_id", _integer),
+            "status": ("status", _text),
+        },
+    ),
+    "payment-bills": Dataset(
+        title="Payment bills",
+        model=PaymentBill,
+        date_lookup="date",
+        columns=[
+            ("Bill", "pk"),
+            ("Date", "date"),
+            ("Supplier", "supplier__user__username"),
+            ("Route", "supplier__route__name"),
+            ("Volume (L)", "total_volume_l"),
+            ("Value", "total_value"),
+            ("Paid", "is_paid"),
+            ("Payment date", "payment_date"),
+        ],
+        filters={
+            "supplier": ("supplier_id", _integer),
+            "route": ("supplier__route_id", _integer),
+            "paid": ("is_paid", _boolean),
+        },
+    ),
+    "invoices": Dataset(
+        title="Milk payment invoices",
+        model=MilkPaymentInvoice,
+        date_lookup="invoice_date",
+        columns=[
+            ("Invoice", "pk"),
+            ("Prefix", "invoice_prefix"),
+            ("Number", "invoice_num"),
+            ("Date", "invoice_date"),
+            ("Supplier", "supplier__user__username"),
+            ("Route", "supplier__route__name"),
+            ("Value", "total_value"),
+            ("Paid", "total_amount_paid"),
+            ("Payment status", "payment_status"),
+            ("Paid on", "invoice_paid_date"),
+            ("Cancelled", "is_cancelled"),
+            ("Cancel reason", "cancel_reason"),
+        ],
+        filters={
+            "supplier": ("supplier_id", _integer),
+            "route": ("supplier__route_id", _integer),
+            "status": ("payment_status", _text),
+            "cancelled": ("is_cancelled", _boolean),
+        },
+    ),
+    "milk-transfers": Dataset(
+        title="Milk transfers",
+        model=MilkTransfer,
+        date_lookup="transfer_date__date",
+        columns=[
+            ("Transfer", "pk"),
+            ("Dispatched", "transfer_date"),
+            ("Arrived", "arrival_datetime"),
+            ("Status", "status"),
+            ("Source", "source_type"),
+            ("Vehicle", "vehicle__vehicle_id"),
+            ("Destination", "destination__name"),
+            ("Silo", "silo__name"),
+            ("Departure weight (kg)", "departure_weight_kg"),
+            ("Arrival weight (kg)", "arrival_weight_kg"),
+            ("Volume (L)", "total_volume"),
+            ("Remarks", "remarks"),
+        ],
+        filters={
+            "status": ("status", _text),
+            "source": ("source_type", _text),
+            "vehicle": ("vehicle_id", _integer),
+            "destination": ("destination_id", _integer),
+        },
+    ),
+}
+
+
+def rows(dataset: Dataset, params) -> Iterator[tuple]:
+    """The dataset's rows matching the query ``params``, oldest first, streamed in chunks."""
+    lookups = {}
+    for param, suffix in (("from", "gte"), ("to", "lte")):
+        if params.get(param):
+            try:
+                day = parse_date(params[param])
+            except ValueError:
+                day = None
+            if day is None:
+                raise InvalidFilter(f"Invalid {param} date: {params[param]!r}")
+            lookups[f"{dataset.date_lookup}__{suffix}"] = day
+    for param, (lookup, parse) in dataset.filters.items():
+        if params.get(param):
+            lookups[lookup] = parse(params[param])
+
+    queryset = (
+        dataset.model.objects.filter(**lookups)
+        .order_by(dataset.date_lookup.split("__")[0], "pk")
+        .values_list(*(lookup for _, lookup in dataset.columns))
+    )
+    return queryset.iterator(chunk_size=_setting("CHUNK_SIZE"))
+
+
+def _plain(value):
+    if isinstance(value, datetime):
+        if timezone.is_aware(value):
+            value = timezone.localtime(value)
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+# A leading one of these makes Excel and LibreOffice evaluate a CSV cell as a formula.
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _csv_cell(value):
+    value = _plain(value)
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+class _Echo:
+    """File-like object whose write returns what was written, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(dataset: Dataset, data: Iterable[tuple]) -> Iterator[bytes]:
+    writer = csv.writer(_Echo())
+    yield ("\ufeff" + writer.writerow([header for header, _ in dataset.columns])).encode("utf-8")
+    for chunk in chunked(data, _setting("CHUNK_SIZE")):
+        yield "".join(writer.writerow([_csv_cell(value) for value in row]) for row in chunk).encode("utf-8")
+
+
+# Characters XML 1.0 does not allow, even escaped.
+_INVALID_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+_XLSX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        "</Types>"
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        "</Relationships>"
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        "</Relationships>"
+    ),
+}
+
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>'
+    "</workbook>"
+)
+
+
+def _cell(value) -> str:
+    value = _plain(value)
+    if value is None:
+        return "<c/>"
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float, Decimal)):
+        return f"<c><v>{value}</v></c>"
+    text = escape(_INVALID_XML.sub("", str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(number: int, values) -> str:
+    return f'<row r="{number}">{"".join(_cell(value) for value in values)}</row>'
+
+
+class _Pipe:
+    """Unseekable file that collects what zipfile writes until it is drained."""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data, self.parts = b"".join(self.parts), []
+        return data
+
+
+def stream_xlsx(dataset: Dataset, data: Iterable[tuple]) -> Iterator[bytes]:
+    pipe = _Pipe()
+    with zipfile.ZipFile(pipe, "w", compression=zipfile.ZIP_DEFLATED) as workbook:
+        for name, content in _XLSX_PARTS.items():
+            workbook.writestr(name, content)
+        workbook.writestr("xl/workbook.xml", _WORKBOOK.format(name=escape(dataset.title[:31])))
+        yield pipe.drain()
+
+        # Size unknown up front, so allow Zip64 in case the sheet passes 4 GB.
+        with workbook.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                f"{_xlsx_row(1, [header for header, _ in dataset.columns])}".encode("utf-8")
+            )
+            number = 1
+            for chunk in chunked(data, _setting("CHUNK_SIZE")):
+                parts = []
+                for row in chunk:
+                    number += 1
+                    parts.append(_xlsx_row(number, row))
+                sheet.write("".join(parts).encode("utf-8"))
+                yield pipe.drain()
+            sheet.write(b"</sheetData></worksheet>")
+    yield pipe.drain()
+
+
+FORMATS = {
+    "csv": ("text/csv; charset=utf-8", stream_csv),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", stream_xlsx),
+}
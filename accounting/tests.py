@@ -1,3 +1,22 @@
-from django.test import TestCase
+import csv
+from decimal import Decimal
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from .exports import DATASETS, stream_csv
+
+
+class StreamCsvTests(SimpleTestCase):
+    def _rows(self, data):
+        text = b"".join(stream_csv(DATASETS["payment-bills"], data)).decode("utf-8-sig")
+        return list(csv.reader(text.splitlines()))[1:]
+
+    def test_text_that_would_run_as_a_formula_is_quoted(self):
+        rows = self._rows([("=HYPERLINK(\"http://example.com\")", "+1", "-2+3", "@SUM(A1)", "\tcmd")])
+
+        self.assertEqual(rows, [["'=HYPERLINK(\"http://example.com\")", "'+1", "'-2+3", "'@SUM(A1)", "'\tcmd"]])
+
+    def test_numbers_and_plain_text_are_unchanged(self):
+        rows = self._rows([("Farmer", -12.5, Decimal("-4.20"), 3)])
+
+        self.assertEqual(rows, [["Farmer", "-12.5", "-4.20", "3"]])
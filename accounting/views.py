@@ -1,8 +1,39 @@
+from django.http import Http404, HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import render
+from django.utils import timezone
+from django.views.decorators.http import require_GET
+
+from accounts.utils import jwt_login_required
+
+from . import exports
 
 
 def accounting_dashboard(request):
     return render(request, "accounting/accounting_dashboard.html")
 
 def billing_and_payment(request):
-    return render(request, "accounting/billing_and_payment.html")
\ No newline at end of file
+    return render(request, "accounting/billing_and_payment.html")
+
+
+@require_GET
+@jwt_login_required
+def export_view(request, dataset, fmt):
+    """
+    Stream ``dataset`` (milk-lots, payment-bills, invoices, milk-transfers) as
+    CSV or XLSX. ``from``/``to`` dates and the dataset's filters come from the query string.
+    """
+    if dataset not in exports.DATASETS or fmt not in exports.FORMATS:
+        raise Http404("Unknown export")
+    spec = exports.DATASETS[dataset]
+    content_type, stream = exports.FORMATS[fmt]
+    try:
+        data = exports.rows(spec, request.GET)
+    except exports.InvalidFilter as e:
+        return HttpResponseBadRequest(str(e))
+
+    response = StreamingHttpResponse(stream(spec, data), content_type=content_type)
+    filename = f"{dataset}-{timezone.localdate():%Y%m%d}.{fmt}"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    # Ask nginx-style proxies not to buffer the whole file first.
+    response["X-Accel-Buffering"] = "no"
+    return response
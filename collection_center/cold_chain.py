@@ -0,0 +1,174 @@
+"""
+Streaming cold-chain breach detection for bulk coolers and on-farm tanks.
+
+Temperature readings are evaluated one at a time as they arrive (telemetry
+batches, lot-assignment mutations). Each vessel keeps one ColdChainState row:
+when its current excursion above MAX_TEMPERATURE started, the peak temperature
+and whether a breach was already raised for it. The rows are read and written
+under select_for_update, so concurrent batches for the same vessel (HTTP and
+websocket ingestion, several workers) are applied one after the other instead
+of overwriting each other's excursion. A
+reading at or above CRITICAL_TEMPERATURE breaches immediately. Otherwise an
+excursion that lasts SUSTAINED_MINUTES breaches. The excursion only ends once
+the temperature is back RECOVERY_HYSTERESIS below the limit, so a vessel
+hovering at the limit is not re-alerted on every crossing.
+
+A breach marks every non-rejected MilkLot in the vessel for retest and is
+broadcast on the "notifications" channel group.
+"""
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+from dairy_project.conf import AppSettings
+from suppliers.models import MilkLot
+
+from .models import ColdChainState
+
+logger = logging.getLogger(__name__)
+
+BULK_COOLER = "bulk_cooler"
+ONFARM_TANK = "onfarm_tank"
+
+# vessel type -> MilkLot foreign key holding its lots
+LOT_FIELDS = {
+    BULK_COOLER: "bulk_cooler_id",
+    ONFARM_TANK: "on_farm_tank_id",
+}
+
+DEFAULTS = {
+    "MAX_TEMPERATURE": 4.0,
+    "CRITICAL_TEMPERATURE": 8.0,
+    "SUSTAINED_MINUTES": 30,
+    "RECOVERY_HYSTERESIS": 0.5,
+}
+
+_setting = AppSettings("COLD_CHAIN", DEFAULTS)
+
+STATE_FIELDS = ["last_at", "excursion_started", "peak", "breached"]
+
+
+@dataclass
+class BreachEvent:
+    vessel_type: str
+    vessel_id: int
+    started_at: datetime
+    detected_at: datetime
+    peak: float
+    reason: str
+
+
+class BreachRules:
+    def __init__(self):
+        self.limit = _setting("MAX_TEMPERATURE")
+        self.critical = _setting("CRITICAL_TEMPERATURE")
+        self.sustained = timedelta(minutes=_setting("SUSTAINED_MINUTES"))
+        self.recovered = self.limit - _setting("RECOVERY_HYSTERESIS")
+
+    def evaluate(self, state: ColdChainState, at: datetime, temperature: float) -> Optional[str]:
+        """Advance ``state`` by one reading; returns a reason the first time the excursion breaches."""
+        if state.last_at is not None and at <= state.last_at:
+            return None  # duplicate or out-of-order reading
+        state.last_at = at
+
+        if temperature <= self.recovered:
+            state.excursion_started = state.peak = None
+            state.breached = False
+            return None
+        if temperature <= self.limit and state.excursion_started is None:
+            return None
+
+        if state.excursion_started is None:
+            state.excursion_started, state.peak = at, temperature
+        else:
+            state.peak = max(state.peak, temperature)
+
+        if state.breached:
+            return None
+        if temperature >= self.critical:
+            state.breached = True
+            return f"reached {temperature:.1f}°C (critical limit {self.critical:.1f}°C)"
+        if at - state.excursion_started >= self.sustained:
+            state.breached = True
+            return (
+                f"above {self.limit:.1f}°C for {int((at - state.excursion_started).total_seconds() // 60)} minutes "
+                f"(peak {state.peak:.1f}°C)"
+            )
+        return None
+
+
+def process(vessel_type: str, readings: Iterable[Tuple[int, datetime, float]]) -> List[BreachEvent]:
+    """
+    Evaluate (vessel_id, measured_at, temperature) readings for one vessel
+    type against the touched vessels' states, locked and saved in one query
+    each, and raise any breaches found.
+    """
+    by_vessel = {}
+    for vessel_id, measured_at, temperature in readings:
+        if temperature is not None:
+            by_vessel.setdefault(vessel_id, []).append((measured_at, temperature))
+    if not by_vessel:
+        return []
+
+    rules = BreachRules()
+    events = []
+    with transaction.atomic():
+        ColdChainState.objects.bulk_create(
+            [ColdChainState(vessel_type=vessel_type, vessel_id=vessel_id) for vessel_id in by_vessel],
+            ignore_conflicts=True,
+        )
+        # Locked in vessel order so batches touching the same vessels cannot deadlock.
+        states = list(
+            ColdChainState.objects.select_for_update()
+            .filter(vessel_type=vessel_type, vessel_id__in=by_vessel)
+            .order_by("vessel_id")
+        )
+        for state in states:
+            for measured_at, temperature in sorted(by_vessel[state.vessel_id], key=lambda reading: reading[0]):
+                reason = rules.evaluate(state, measured_at, temperature)
+                if reason:
+                    events.append(
+                        BreachEvent(
+                            vessel_type=vessel_type,
+                            vessel_id=state.vessel_id,
+                            started_at=state.excursion_started,
+                            detected_at=measured_at,
+                            peak=state.peak,
+                            reason=reason,
+                        )
+                    )
+        ColdChainState.objects.bulk_update(states, STATE_FIELDS)
+
+        for event in events:
+            raise_breach(event)
+    return events
+
+
+def raise_breach(event: BreachEvent) -> int:
+    """Flag the vessel's lots for retest and broadcast the breach; returns the number of lots flagged."""
+    label = event.vessel_type.replace("_", " ")
+    reason = f"Cold-chain breach in {label} {event.vessel_id}: {event.reason}"
+    flagged = (
+        MilkLot.objects.filter(**{LOT_FIELDS[event.vessel_type]: event.vessel_id})
+        .exclude(status="rejected")
+        .update(needs_retest=True, retest_reason=reason[:255])
+    )
+    logger.warning("%s; %s milk lots flagged for retest", reason, flagged)
+
+    try:
+        async_to_sync(get_channel_layer().group_send)(
+            "notifications",
+            {
+                "type": "send_notification",
+                "message": f"{reason} since {event.started_at:%H:%M}. {flagged} milk lots marked for retest.",
+            },
+        )
+    except Exception:
+        # The lots are already flagged; a channel layer outage must not fail ingestion.
+        logger.exception("Could not broadcast cold-chain breach for %s %s", event.vessel_type, event.vessel_id)
+    return flagged
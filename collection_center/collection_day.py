@@ -0,0 +1,149 @@
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import List, Optional
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Subquery
+from django.utils import timezone
+
+from distribution.models import Route
+from suppliers.models import OnFarmTank
+
+from .models import BulkCooler
+
+MAX_SANITATION_AGE_HOURS = 96
+
+# Equipment state carried over from yesterday's vessel; volumes and fill times start empty.
+CLONED_FIELDS = (
+    "name",
+    "capacity_liters",
+    "temperature_celsius",
+    "last_cleaned_at",
+    "last_sanitized_at",
+    "last_serviced_at",
+    "last_calibration_date",
+    "service_interval_days",
+)
+
+
+@dataclass
+class VesselWarning:
+    vessel_type: str
+    vessel_id: int
+    name: str
+    message: str
+
+
+@dataclass
+class CollectionDay:
+    day: date
+    bulk_coolers: List[BulkCooler] = field(default_factory=list)
+    onfarm_tanks: List[OnFarmTank] = field(default_factory=list)
+    warnings: List[VesselWarning] = field(default_factory=list)
+
+
+def _previous_generation(queryset, day):
+    """Vessels of the most recent collection day before ``day``."""
+    previous_day = queryset.filter(collection_day__lt=day).order_by("-collection_day").values("collection_day")[:1]
+    return queryset.filter(collection_day=Subquery(previous_day))
+
+
+def _clone_vessels(model, vessel_type, sources, duplicate_of, owner_field, day, now, confirm, result):
+    """
+    Copy ``sources`` into ``day`` with one bulk_create. Each source row comes
+    back annotated with whether it was already cloned today, so the duplicate
+    and sanitation checks need no further queries.
+    """
+    sources = sources.annotate(already_started=Exists(duplicate_of))
+    clones = []
+    for vessel in sources:
+        warning = None
+        skip = False
+        if vessel.already_started:
+            warning, skip = f"{vessel.name} has already been started for {day}.", True
+        elif vessel.last_sanitized_at is None:
+            warning, skip = f"{vessel.name} has no sanitization record.", True
+        else:
+            age = now - vessel.last_sanitized_at
+            if age > timedelta(hours=MAX_SANITATION_AGE_HOURS):
+                warning = (
+                    f"{vessel.name} was last sanitized {age.days} day(s) ago. "
+                    f"Sanitation must be within {MAX_SANITATION_AGE_HOURS} hours."
+                )
+                skip = not confirm
+                if skip:
+                    warning += " Re-sanitize before use or confirm override."
+
+        if warning:
+            result.warnings.append(VesselWarning(vessel_type, vessel.id, vessel.name, warning))
+        if skip:
+            continue
+
+        owner_id = f"{owner_field}_id"
+        clone = model(collection_day=day, current_volume_liters=0.0, **{owner_id: getattr(vessel, owner_id)})
+        for name in CLONED_FIELDS:
+            setattr(clone, name, getattr(vessel, name))
+        clones.append(clone)
+
+    return model.objects.bulk_create(clones)
+
+
+def start_collection_day(route_id: int, confirm: bool = False, day: Optional[date] = None) -> CollectionDay:
+    """
+    Clone a route's bulk coolers and its suppliers' on-farm tanks from the
+    previous collection day into ``day`` (today by default).
+
+    Vessels already started today are skipped. So are vessels with no
+    sanitation record, and vessels sanitized more than
+    MAX_SANITATION_AGE_HOURS ago unless ``confirm`` is set. Each skip is
+    reported as a warning instead of failing the whole route.
+    """
+    day = day or timezone.localdate()
+    now = timezone.now()
+    result = CollectionDay(day=day)
+
+    with transaction.atomic():
+        # Serialises concurrent starts of the same route.
+        route = Route.objects.select_for_update().get(pk=route_id)
+
+        coolers = BulkCooler.objects.filter(route=route)
+        result.bulk_coolers = _clone_vessels(
+            BulkCooler,
+            "bulk_cooler",
+            _previous_generation(coolers, day),
+            coolers.filter(collection_day=day, name=OuterRef("name")),
+            "route",
+            day,
+            now,
+            confirm,
+            result,
+        )
+
+        tanks = OnFarmTank.objects.filter(supplier__route=route)
+        result.onfarm_tanks = _clone_vessels(
+            OnFarmTank,
+            "onfarm_tank",
+            _previous_generation(tanks, day),
+            tanks.filter(collection_day=day, supplier=OuterRef("supplier"), name=OuterRef("name")),
+            "supplier",
+            day,
+            now,
+            confirm,
+            result,
+        )
+
+    if result.bulk_coolers or result.onfarm_tanks:
+        channel_layer = get_channel_layer()
+        async_to_sync(channel_layer.group_send)(
+            "notifications",
+            {
+                "type": "send_notification",
+                "message": (
+                    f"Collection day {day} started on {route.name}: "
+                    f"{len(result.bulk_coolers)} bulk coolers, {len(result.onfarm_tanks)} on-farm tanks."
+                ),
+            },
+        )
+    return result
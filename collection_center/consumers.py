@@ -0,0 +1,73 @@
+import asyncio
+import json
+import logging
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from dairy_project.conf import AppSettings
+
+from .telemetry import DEFAULTS, ingest, is_authorized, parse_json_readings
+
+logger = logging.getLogger(__name__)
+
+_setting = AppSettings("COOLER_TELEMETRY", DEFAULTS)
+
+
+class CoolerTelemetryConsumer(AsyncWebsocketConsumer):
+    """
+    Streaming counterpart of the telemetry HTTP endpoint. Controllers connect
+    to ``ws/telemetry/coolers/?token=<token>`` and send readings as JSON
+    frames; they are buffered and upserted every FLUSH_INTERVAL seconds or
+    BATCH_SIZE readings, whichever comes first, and each flush is acknowledged.
+    """
+
+    async def connect(self):
+        token = parse_qs(self.scope.get("query_string", b"").decode()).get("token", [None])[0]
+        if not is_authorized(token):
+            await self.close(code=4401)
+            return
+
+        self.batch_size = _setting("BATCH_SIZE")
+        self.flush_interval = _setting("WS_FLUSH_INTERVAL")
+        self.buffer = []
+        self.flush_lock = asyncio.Lock()
+        self.flusher = asyncio.create_task(self.flush_periodically())
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        flusher = getattr(self, "flusher", None)
+        if flusher is None:
+            return
+        flusher.cancel()
+        await self.flush(acknowledge=False)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            readings = parse_json_readings(json.loads(text_data or bytes_data))
+        except (ValueError, TypeError) as e:
+            await self.send(text_data=json.dumps({"error": str(e)}))
+            return
+
+        self.buffer.extend(readings)
+        if len(self.buffer) >= self.batch_size:
+            await self.flush()
+
+    async def flush_periodically(self):
+        # A failed flush (database unavailable, socket gone) drops that batch
+        # but must not end the loop, or nothing is written until disconnect.
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Periodic cooler telemetry flush failed")
+
+    async def flush(self, acknowledge=True):
+        async with self.flush_lock:
+            if not self.buffer:
+                return
+            readings, self.buffer = self.buffer, []
+            result = await database_sync_to_async(ingest)(readings)
+        if acknowledge:
+            await self.send(text_data=json.dumps(result.as_dict()))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from collection_center.rollups import prune, rollup
+
+
+class Command(BaseCommand):
+    help = (
+        "Roll raw bulk cooler logs into 5-minute and hourly buckets, then apply retention. "
+        "Run every few minutes (cron / Render cron job); use --since once to backfill."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", help="ISO datetime to rebuild buckets from (default: the configured lookback).")
+        parser.add_argument("--no-prune", action="store_true", help="Skip deleting data past its retention.")
+
+    def handle(self, *args, **options):
+        since = None
+        if options["since"]:
+            since = parse_datetime(options["since"])
+            if since is None:
+                raise CommandError(f"Invalid --since datetime: {options['since']}")
+
+        result = rollup(since=since)
+        self.stdout.write(
+            f"Rolled up {result['since']:%Y-%m-%d %H:%M} – {result['until']:%Y-%m-%d %H:%M}: "
+            f"{result['5m']} five-minute and {result['1h']} hourly buckets."
+        )
+        if not options["no_prune"]:
+            deleted = prune()
+            self.stdout.write(f"Pruned {deleted}.")
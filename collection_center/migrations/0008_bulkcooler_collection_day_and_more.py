@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-19 16:38
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+
+def backfill_collection_day(apps, schema_editor):
+    BulkCooler = apps.get_model("collection_center", "BulkCooler")
+    BulkCooler.objects.update(collection_day=TruncDate("created_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collection_center', '0007_bulkcooler_is_stirred'),
+        ('distribution', '0019_vehicledriver_route'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bulkcooler',
+            name='collection_day',
+            field=models.DateField(default=django.utils.timezone.localdate, help_text='Collection day this vessel record belongs to; one generation per day.'),
+        ),
+        migrations.RunPython(backfill_collection_day, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='bulkcooler',
+            index=models.Index(fields=['route', 'collection_day'], name='bulkcooler_route_day_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-19 16:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collection_center', '0008_bulkcooler_collection_day_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BulkCoolerLogRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('5m', '5 minutes'), ('1h', '1 hour')], max_length=2)),
+                ('bucket_start', models.DateTimeField()),
+                ('samples', models.PositiveIntegerField()),
+                ('temperature_min', models.FloatField()),
+                ('temperature_max', models.FloatField()),
+                ('temperature_avg', models.FloatField()),
+                ('volume_min', models.FloatField()),
+                ('volume_max', models.FloatField()),
+                ('volume_avg', models.FloatField()),
+                ('bulk_cooler', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='log_rollups', to='collection_center.bulkcooler')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('bulk_cooler', 'resolution', 'bucket_start'), name='bulkcoolerlogrollup_bucket_uniq')],
+            },
+        ),
+    ]
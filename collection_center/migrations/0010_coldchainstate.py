@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-19 18:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collection_center', '0009_bulkcoolerlogrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ColdChainState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vessel_type', models.CharField(choices=[('bulk_cooler', 'Bulk cooler'), ('onfarm_tank', 'On-farm tank')], max_length=20)),
+                ('vessel_id', models.PositiveIntegerField()),
+                ('last_at', models.DateTimeField(blank=True, null=True)),
+                ('excursion_started', models.DateTimeField(blank=True, null=True)),
+                ('peak', models.FloatField(blank=True, null=True)),
+                ('breached', models.BooleanField(default=False)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('vessel_type', 'vessel_id'), name='coldchainstate_vessel_uniq')],
+            },
+        ),
+    ]
@@ -1,5 +1,6 @@
 
 from django.db import models
+from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 from suppliers.models import MilkLot
 
@@ -30,6 +31,69 @@ class BulkCoolerLog(models.Model):
         return f"{self.bulk_cooler.name} log – {self.log_date}"
 
 
+class BulkCoolerLogRollup(models.Model):
+    """Min/max/avg of a cooler's raw logs over a fixed time bucket (see collection_center.rollups)."""
+
+    RESOLUTION_CHOICES = [
+        ("5m", "5 minutes"),
+        ("1h", "1 hour"),
+    ]
+
+    bulk_cooler = models.ForeignKey(
+        'collection_center.BulkCooler',
+        on_delete=models.CASCADE,
+        related_name="log_rollups"
+    )
+    resolution = models.CharField(max_length=2, choices=RESOLUTION_CHOICES)
+    bucket_start = models.DateTimeField()
+    samples = models.PositiveIntegerField()
+
+    temperature_min = models.FloatField()
+    temperature_max = models.FloatField()
+    temperature_avg = models.FloatField()
+    volume_min = models.FloatField()
+    volume_max = models.FloatField()
+    volume_avg = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["bulk_cooler", "resolution", "bucket_start"],
+                name="bulkcoolerlogrollup_bucket_uniq",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.bulk_cooler_id} {self.resolution} rollup – {self.bucket_start}"
+
+
+class ColdChainState(models.Model):
+    """A vessel's current temperature excursion (see collection_center.cold_chain)."""
+
+    VESSEL_TYPE_CHOICES = [
+        ("bulk_cooler", "Bulk cooler"),
+        ("onfarm_tank", "On-farm tank"),
+    ]
+
+    vessel_type = models.CharField(max_length=20, choices=VESSEL_TYPE_CHOICES)
+    vessel_id = models.PositiveIntegerField()
+    last_at = models.DateTimeField(null=True, blank=True)
+    excursion_started = models.DateTimeField(null=True, blank=True)
+    peak = models.FloatField(null=True, blank=True)
+    breached = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["vessel_type", "vessel_id"],
+                name="coldchainstate_vessel_uniq",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.vessel_type} {self.vessel_id} cold-chain state"
+
+
 class BulkCooler(models.Model):
     route = models.ForeignKey(
         "distribution.Route",
@@ -59,33 +123,33 @@ class BulkCooler(models.Model):
 
     last_calibration_date = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    collection_day = models.DateField(
+        default=timezone.localdate,
+        help_text="Collection day this vessel record belongs to; one generation per day."
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["route", "collection_day"], name="bulkcooler_route_day_idx"),
+        ]
 
     def add_lots(self, *milk_lots):
-        already_in_this_cooler = [lot for lot in milk_lots\
-                                if lot.bulk_cooler_id == self.id]
-        if already_in_this_cooler:
+        from suppliers.storage import LotsAlreadyAssignedError, StorageCapacityError, assign_lots
+
+        try:
+            assignment = assign_lots(self, [lot.pk for lot in milk_lots])
+        except LotsAlreadyAssignedError:
             raise ValueError(
                 "Cannot add same milk lots twice "
                 "you have already assigned selected milk lot to the bulk cooler."
             )
-
-        candidates = [
-            lot for lot in milk_lots
-            if lot.status == 'pending'
-            and lot.bulk_cooler_id is None  
-        ]
-
-        proposed_volume = sum(lot.volume_l for lot in candidates)
-        if self.current_volume_liters + proposed_volume > self.capacity_liters:
+        except StorageCapacityError:
             return 0
 
-        for lot in candidates:
-            lot.bulk_cooler = self
-        MilkLot.objects.bulk_update(candidates, ['bulk_cooler'])
-
-        self.current_volume_liters += proposed_volume
-        self.save(update_fields=['current_volume_liters'])
-        return len(candidates) 
+        for lot in milk_lots:
+            if lot.pk in assignment.claimed_ids:
+                lot.bulk_cooler = self
+        return assignment.count
     
     
     def is_in_use(self):
@@ -0,0 +1,230 @@
+"""
+Downsampling and retention for bulk cooler telemetry.
+
+Raw BulkCoolerLog readings are folded into 5-minute BulkCoolerLogRollup
+buckets, and those into hourly buckets. ``rollup()`` recomputes every bucket
+in a window from its source rows and upserts it, so re-running it over the
+same window (as the periodic job does with its lookback) is safe and picks
+up late or re-sent readings. ``prune()`` then drops raw rows and 5-minute
+buckets past their retention; hourly buckets are kept.
+
+``series()`` serves charts: it picks the finest resolution that is still
+retained for the requested range and stays under MAX_CHART_POINTS.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+from django.utils import timezone as django_timezone
+
+from dairy_project.conf import AppSettings
+
+from .models import BulkCoolerLog, BulkCoolerLogRollup
+
+RAW = "raw"
+FIVE_MINUTES = "5m"
+HOURLY = "1h"
+
+BUCKET_WIDTHS = {
+    FIVE_MINUTES: timedelta(minutes=5),
+    HOURLY: timedelta(hours=1),
+}
+
+DEFAULTS = {
+    "READING_INTERVAL_SECONDS": 30,
+    "RAW_RETENTION_DAYS": 7,
+    "FIVE_MINUTE_RETENTION_DAYS": 90,
+    "ROLLUP_LOOKBACK_HOURS": 2,
+    "MAX_CHART_POINTS": 2000,
+}
+
+
+_setting = AppSettings("COOLER_TELEMETRY", DEFAULTS)
+
+
+@dataclass
+class TelemetryPoint:
+    bucket_start: datetime
+    samples: int
+    temperature_min: float
+    temperature_max: float
+    temperature_avg: float
+    volume_min: float
+    volume_max: float
+    volume_avg: float
+
+
+class _Bucket:
+    __slots__ = ("samples", "t_min", "t_max", "t_sum", "v_min", "v_max", "v_sum")
+
+    def __init__(self):
+        self.samples = 0
+        self.t_min = self.v_min = float("inf")
+        self.t_max = self.v_max = float("-inf")
+        self.t_sum = self.v_sum = 0.0
+
+    def add(self, samples, t_min, t_max, t_avg, v_min, v_max, v_avg):
+        self.samples += samples
+        self.t_min = min(self.t_min, t_min)
+        self.t_max = max(self.t_max, t_max)
+        self.t_sum += t_avg * samples
+        self.v_min = min(self.v_min, v_min)
+        self.v_max = max(self.v_max, v_max)
+        self.v_sum += v_avg * samples
+
+
+def floor_to(moment: datetime, width: timedelta) -> datetime:
+    seconds = int(width.total_seconds())
+    return datetime.fromtimestamp(int(moment.timestamp()) // seconds * seconds, tz=timezone.utc)
+
+
+def _fold(rows, width):
+    """rows: (cooler_id, moment, samples, t_min, t_max, t_avg, v_min, v_max, v_avg)."""
+    buckets = {}
+    for cooler_id, moment, *stats in rows:
+        key = (cooler_id, floor_to(moment, width))
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = _Bucket()
+        bucket.add(*stats)
+    return buckets
+
+
+def _store(resolution, buckets) -> int:
+    BulkCoolerLogRollup.objects.bulk_create(
+        [
+            BulkCoolerLogRollup(
+                bulk_cooler_id=cooler_id,
+                resolution=resolution,
+                bucket_start=start,
+                samples=b.samples,
+                temperature_min=b.t_min,
+                temperature_max=b.t_max,
+                temperature_avg=b.t_sum / b.samples,
+                volume_min=b.v_min,
+                volume_max=b.v_max,
+                volume_avg=b.v_sum / b.samples,
+            )
+            for (cooler_id, start), b in buckets.items()
+        ],
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=["bulk_cooler", "resolution", "bucket_start"],
+        update_fields=[
+            "samples",
+            "temperature_min",
+            "temperature_max",
+            "temperature_avg",
+            "volume_min",
+            "volume_max",
+            "volume_avg",
+        ],
+    )
+    return len(buckets)
+
+
+_ROLLUP_COLUMNS = (
+    "bulk_cooler_id",
+    "bucket_start",
+    "samples",
+    "temperature_min",
+    "temperature_max",
+    "temperature_avg",
+    "volume_min",
+    "volume_max",
+    "volume_avg",
+)
+
+
+def rollup(since: Optional[datetime] = None, until: Optional[datetime] = None) -> dict:
+    """
+    Recompute the 5-minute and hourly buckets between ``since`` (default:
+    ROLLUP_LOOKBACK_HOURS ago) and ``until`` (default: now). ``since`` is
+    floored to the hour so every hourly bucket is rebuilt from all its parts.
+    """
+    until = until or django_timezone.now()
+    since = since or until - timedelta(hours=_setting("ROLLUP_LOOKBACK_HOURS"))
+    since = floor_to(since, BUCKET_WIDTHS[HOURLY])
+
+    raw = (
+        BulkCoolerLog.objects.filter(log_date__gte=since, log_date__lt=until)
+        .values_list("bulk_cooler_id", "log_date", "temperature_celsius", "volume_liters")
+        .iterator(chunk_size=5000)
+    )
+    five_minute = _fold(
+        ((cooler_id, moment, 1, t, t, t, v, v, v) for cooler_id, moment, t, v in raw),
+        BUCKET_WIDTHS[FIVE_MINUTES],
+    )
+    stored_five_minute = _store(FIVE_MINUTES, five_minute)
+
+    # Hourly buckets are built from the 5-minute ones just written, not the raw rows again.
+    parts = BulkCoolerLogRollup.objects.filter(
+        resolution=FIVE_MINUTES, bucket_start__gte=since, bucket_start__lt=until
+    ).values_list(*_ROLLUP_COLUMNS)
+    stored_hourly = _store(HOURLY, _fold(parts.iterator(chunk_size=5000), BUCKET_WIDTHS[HOURLY]))
+
+    return {"since": since, "until": until, FIVE_MINUTES: stored_five_minute, HOURLY: stored_hourly}
+
+
+def retention(resolution) -> Optional[timedelta]:
+    days = {
+        RAW: _setting("RAW_RETENTION_DAYS"),
+        FIVE_MINUTES: _setting("FIVE_MINUTE_RETENTION_DAYS"),
+    }.get(resolution)
+    return timedelta(days=days) if days else None
+
+
+def prune(now: Optional[datetime] = None) -> dict:
+    """Delete raw logs and 5-minute buckets older than their retention."""
+    now = now or django_timezone.now()
+    deleted = {}
+    raw_retention = retention(RAW)
+    if raw_retention:
+        deleted[RAW], _ = BulkCoolerLog.objects.filter(log_date__lt=now - raw_retention).delete()
+    five_minute_retention = retention(FIVE_MINUTES)
+    if five_minute_retention:
+        deleted[FIVE_MINUTES], _ = BulkCoolerLogRollup.objects.filter(
+            resolution=FIVE_MINUTES, bucket_start__lt=now - five_minute_retention
+        ).delete()
+    return deleted
+
+
+def choose_resolution(start: datetime, end: datetime, max_points: Optional[int] = None) -> str:
+    """Finest resolution still retained at ``start`` whose point count for the range fits ``max_points``."""
+    max_points = max_points or _setting("MAX_CHART_POINTS")
+    span = end - start
+    oldest_needed = django_timezone.now() - start
+    intervals = (
+        (RAW, timedelta(seconds=_setting("READING_INTERVAL_SECONDS"))),
+        (FIVE_MINUTES, BUCKET_WIDTHS[FIVE_MINUTES]),
+    )
+    for resolution, interval in intervals:
+        kept_for = retention(resolution)
+        if span / interval <= max_points and (kept_for is None or oldest_needed <= kept_for):
+            return resolution
+    return HOURLY
+
+
+def series(
+    bulk_cooler_id: int, start: datetime, end: datetime, max_points: Optional[int] = None
+) -> Tuple[str, List[TelemetryPoint]]:
+    resolution = choose_resolution(start, end, max_points)
+    if resolution == RAW:
+        readings = (
+            BulkCoolerLog.objects.filter(bulk_cooler_id=bulk_cooler_id, log_date__gte=start, log_date__lt=end)
+            .order_by("log_date")
+            .values_list("log_date", "temperature_celsius", "volume_liters")
+        )
+        return resolution, [TelemetryPoint(moment, 1, t, t, t, v, v, v) for moment, t, v in readings]
+
+    buckets = (
+        BulkCoolerLogRollup.objects.filter(
+            bulk_cooler_id=bulk_cooler_id,
+            resolution=resolution,
+            bucket_start__gte=floor_to(start, BUCKET_WIDTHS[resolution]),
+            bucket_start__lt=end,
+        )
+        .order_by("bucket_start")
+        .values_list(*_ROLLUP_COLUMNS[1:])
+    )
+    return resolution, [TelemetryPoint(*row) for row in buckets]
@@ -2,15 +2,24 @@ from datetime import date, datetime
 from typing import List, Optional
 
 import strawberry
-from django.db.models import Max
-from django.utils.timezone import make_aware
+from django.db.models import Subquery
+from django.utils.timezone import make_aware, now
 from graphql import GraphQLError
 from strawberry.permission import BasePermission
 from strawberry.types import Info
 
-from dairy_project.graphql_types.collection import BulkCoolerType
+from dairy_project.graphql_types.collection import (
+    BulkCoolerType,
+    CollectionDayWarningType,
+    CoolerTelemetryType,
+    StartCollectionDayPayload,
+    TelemetryPointType,
+)
+from distribution.models import Route
 from suppliers.models import MilkLot
 
+from . import cold_chain, rollups
+from .collection_day import start_collection_day
 from .models import BulkCooler
 
 
@@ -31,21 +40,11 @@ class AssignLotsPayload:
 class Query:
     @strawberry.field
     def bulk_coolers_by_route(self, route_id: int) -> list[BulkCoolerType]:
-        latest_date = (
-        BulkCooler.objects
-        .filter(route_id=route_id)
-        .aggregate(latest=Max('created_at'))['latest']
-    )
-
-        if not latest_date:
-            return []
-
-        latest_date_only = latest_date.date()
-
-        coolers = BulkCooler.objects.filter(
-            route_id=route_id,
-            created_at__date=latest_date_only
-        ).order_by('-created_at')
+        route_coolers = BulkCooler.objects.filter(route_id=route_id)
+        latest_day = route_coolers.order_by('-collection_day').values('collection_day')[:1]
+        coolers = route_coolers.filter(
+            collection_day=Subquery(latest_day)
+        ).select_related('route').order_by('-created_at')
 
         return [
             BulkCoolerType(
@@ -105,6 +104,22 @@ class Query:
             )
             for c in coolers
         ]
+
+    @strawberry.field
+    def cooler_telemetry(
+        self,
+        bulk_cooler_id: int,
+        start: datetime,
+        end: datetime,
+        max_points: Optional[int] = None,
+    ) -> CoolerTelemetryType:
+        if end <= start:
+            raise GraphQLError("end must be after start")
+        resolution, points = rollups.series(bulk_cooler_id, start, end, max_points)
+        return CoolerTelemetryType(
+            resolution=resolution,
+            points=[TelemetryPointType(**vars(point)) for point in points],
+        )
     
 @strawberry.type
 class Mutation:
@@ -137,7 +152,13 @@ class Mutation:
             if last_serviced_at:
                 cooler.last_serviced_at = last_serviced_at
 
-            cooler.save()
+            # current_volume_liters is maintained by add_lots with F() updates;
+            # writing the in-memory copy back would undo concurrent assignments.
+            cooler.save(update_fields=[
+                "temperature_celsius", "last_cleaned_at", "last_sanitized_at",
+                "last_calibration_date", "service_interval_days", "last_serviced_at",
+            ])
+            cold_chain.process(cold_chain.BULK_COOLER, [(cooler.id, now(), temperature_celsius)])
 
             return AssignLotsPayload(
                 success=True,
@@ -161,7 +182,7 @@ class Mutation:
         today = date.today()
         already_exists = BulkCooler.objects.filter(
             name=original_cooler.name,
-            created_at__date=today
+            collection_day=today
         ).exists()
 
         if already_exists:
@@ -204,5 +225,28 @@ class Mutation:
         return new_cooler
 
 
+    @strawberry.mutation
+    def start_collection_day(self, info: Info, route_id: int, confirm: bool = False) -> StartCollectionDayPayload:
+        try:
+            day = start_collection_day(route_id, confirm=confirm)
+        except Route.DoesNotExist:
+            raise GraphQLError("Route not found")
+
+        return StartCollectionDayPayload(
+            collection_day=day.day,
+            bulk_coolers=day.bulk_coolers,
+            onfarm_tanks=day.onfarm_tanks,
+            warnings=[
+                CollectionDayWarningType(
+                    vessel_type=w.vessel_type,
+                    vessel_id=w.vessel_id,
+                    name=w.name,
+                    message=w.message,
+                )
+                for w in day.warnings
+            ],
+        )
+
+
 
 schema = strawberry.Schema(query=Query, mutation=Mutation)
\ No newline at end of file
@@ -0,0 +1,179 @@
+"""
+Batched ingestion of bulk cooler controller readings into BulkCoolerLog.
+
+Readings arrive as JSON objects (HTTP body or websocket frames) or CSV rows
+with the columns in READING_FIELDS. A batch is validated in plain Python,
+duplicates of the same (bulk_cooler_id, log_date) are coalesced to the last
+one received, and the rest is written with a single upserting bulk_create
+per BATCH_SIZE rows, so a re-sent reading overwrites instead of failing the
+unique_together constraint.
+"""
+import csv
+import hmac
+import io
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Tuple
+
+from django.utils.dateparse import parse_datetime
+
+from dairy_project.conf import AppSettings
+
+from . import cold_chain
+from .models import BulkCooler, BulkCoolerLog
+
+DEFAULTS = {
+    "BATCH_SIZE": 1000,
+    "WS_FLUSH_INTERVAL": 1.0,
+    "INGEST_TOKEN": "",
+}
+
+READING_FIELDS = ("bulk_cooler_id", "log_date", "volume_liters", "temperature_celsius")
+OPTIONAL_TIMESTAMPS = (
+    "filled_at",
+    "emptied_at",
+    "last_cleaned_at",
+    "last_sanitized_at",
+    "last_calibration_date",
+    "last_serviced_at",
+)
+UPDATE_FIELDS = ["volume_liters", "temperature_celsius", *OPTIONAL_TIMESTAMPS]
+
+
+_setting = AppSettings("COOLER_TELEMETRY", DEFAULTS)
+
+
+class InvalidReading(ValueError):
+    pass
+
+
+@dataclass
+class IngestResult:
+    received: int = 0
+    coalesced: int = 0
+    rejected: List[dict] = field(default_factory=list)
+    logs: List[BulkCoolerLog] = field(default_factory=list)
+
+    @property
+    def stored(self):
+        return len(self.logs)
+
+    def as_dict(self):
+        return {
+            "received": self.received,
+            "stored": self.stored,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+        }
+
+
+def _timestamp(value, name):
+    if value in (None, ""):
+        return None
+    if isinstance(value, datetime):
+        parsed = value
+    elif isinstance(value, (int, float)):
+        parsed = datetime.fromtimestamp(value, tz=timezone.utc)
+    else:
+        parsed = parse_datetime(str(value))
+        if parsed is None:
+            raise InvalidReading(f"{name} is not an ISO 8601 datetime: {value!r}")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def _number(value, name):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise InvalidReading(f"{name} must be a number, got {value!r}")
+
+
+def clean_reading(raw: dict) -> BulkCoolerLog:
+    missing = [name for name in READING_FIELDS if raw.get(name) in (None, "")]
+    if missing:
+        raise InvalidReading(f"Missing {', '.join(missing)}")
+    try:
+        cooler_id = int(raw["bulk_cooler_id"])
+    except (TypeError, ValueError):
+        raise InvalidReading(f"bulk_cooler_id must be an integer, got {raw['bulk_cooler_id']!r}")
+
+    return BulkCoolerLog(
+        bulk_cooler_id=cooler_id,
+        log_date=_timestamp(raw["log_date"], "log_date"),
+        volume_liters=_number(raw["volume_liters"], "volume_liters"),
+        temperature_celsius=_number(raw["temperature_celsius"], "temperature_celsius"),
+        **{name: _timestamp(raw.get(name), name) for name in OPTIONAL_TIMESTAMPS},
+    )
+
+
+def parse_json_readings(payload) -> List[dict]:
+    """Accepts a single reading, a list of readings or ``{"readings": [...]}``."""
+    if isinstance(payload, dict):
+        payload = payload.get("readings", [payload])
+    if not isinstance(payload, list):
+        raise InvalidReading("Expected a reading, a list of readings or {\"readings\": [...]}.")
+    return payload
+
+
+def parse_csv_readings(text: str) -> List[dict]:
+    reader = csv.DictReader(io.StringIO(text))
+    missing = [name for name in READING_FIELDS if name not in (reader.fieldnames or ())]
+    if missing:
+        raise InvalidReading(f"CSV header is missing {', '.join(missing)}")
+    return list(reader)
+
+
+def ingest(readings: Iterable[dict], batch_size=None) -> IngestResult:
+    """Validate, coalesce and upsert ``readings``; bad rows are reported, not raised."""
+    batch_size = batch_size or _setting("BATCH_SIZE")
+    result = IngestResult()
+    latest: Dict[Tuple[int, datetime], BulkCoolerLog] = {}
+
+    for index, raw in enumerate(readings):
+        result.received += 1
+        if not isinstance(raw, dict):
+            result.rejected.append({"index": index, "error": "Reading must be an object"})
+            continue
+        try:
+            log = clean_reading(raw)
+        except InvalidReading as e:
+            result.rejected.append({"index": index, "error": str(e)})
+            continue
+        key = (log.bulk_cooler_id, log.log_date)
+        if key in latest:
+            result.coalesced += 1
+        latest[key] = log
+
+    known_coolers = set(
+        BulkCooler.objects.filter(pk__in={cooler_id for cooler_id, _ in latest}).values_list("pk", flat=True)
+    )
+    logs = []
+    for (cooler_id, log_date), log in latest.items():
+        if cooler_id in known_coolers:
+            logs.append(log)
+        else:
+            result.rejected.append(
+                {"bulk_cooler_id": cooler_id, "log_date": log_date.isoformat(), "error": "Unknown bulk cooler"}
+            )
+
+    if logs:
+        result.logs = BulkCoolerLog.objects.bulk_create(
+            logs,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=["bulk_cooler", "log_date"],
+            update_fields=UPDATE_FIELDS,
+        )
+        cold_chain.process(
+            cold_chain.BULK_COOLER,
+            ((log.bulk_cooler_id, log.log_date, log.temperature_celsius) for log in result.logs),
+        )
+    return result
+
+
+def is_authorized(token) -> bool:
+    """Controllers authenticate with the shared COOLER_TELEMETRY["INGEST_TOKEN"]; unset disables ingestion."""
+    expected = _setting("INGEST_TOKEN")
+    return bool(expected) and bool(token) and hmac.compare_digest(str(token), expected)
@@ -1,3 +1,218 @@
-from django.test import TestCase
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from distribution.models import Route
+from suppliers.models import OnFarmTank
+from suppliers.models import MilkLot
+from suppliers.tests import make_lots, make_supplier
+
+from . import cold_chain
+from .collection_day import start_collection_day
+from .consumers import CoolerTelemetryConsumer
+from .models import BulkCooler, BulkCoolerLog, ColdChainState
+
+
+class StartCollectionDayTests(TestCase):
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.yesterday = self.today - timedelta(days=1)
+        self.route = Route.objects.create(name="North")
+        sanitized = timezone.now() - timedelta(hours=12)
+        for number in range(3):
+            BulkCooler.objects.create(
+                route=self.route,
+                name=f"Cooler-{number}",
+                capacity_liters=2000,
+                current_volume_liters=500.0,
+                last_sanitized_at=sanitized,
+                collection_day=self.yesterday,
+            )
+            OnFarmTank.objects.create(
+                supplier=make_supplier(f"farmer{number}", self.route),
+                name="Tank-1",
+                capacity_liters=2000,
+                current_volume_liters=300.0,
+                last_sanitized_at=sanitized,
+                collection_day=self.yesterday,
+            )
+
+    def test_query_count_does_not_grow_with_the_vessels(self):
+        # Savepoint and release, the route lock, then one read and one bulk
+        # insert per vessel type.
+        with self.assertNumQueries(7):
+            result = start_collection_day(self.route.pk)
+
+        self.assertEqual(len(result.bulk_coolers), 3)
+        self.assertEqual(len(result.onfarm_tanks), 3)
+        self.assertEqual(result.warnings, [])
+
+    def test_clones_start_empty_with_the_same_owners(self):
+        start_collection_day(self.route.pk)
+
+        tanks = OnFarmTank.objects.filter(collection_day=self.today)
+        self.assertEqual(
+            sorted(tanks.values_list("supplier__user__username", "current_volume_liters")),
+            [("farmer0", 0.0), ("farmer1", 0.0), ("farmer2", 0.0)],
+        )
+        self.assertFalse(BulkCooler.objects.filter(collection_day=self.today).exclude(route=self.route).exists())
+
+    def test_a_second_start_clones_nothing(self):
+        start_collection_day(self.route.pk)
+        result = start_collection_day(self.route.pk)
+
+        self.assertEqual((result.bulk_coolers, result.onfarm_tanks), ([], []))
+        self.assertEqual(len(result.warnings), 6)
+
+
+TELEMETRY = {"INGEST_TOKEN": "secret", "BATCH_SIZE": 2, "WS_FLUSH_INTERVAL": 0.05}
+READ_AT = datetime(2026, 1, 5, 6, 0, tzinfo=dt_timezone.utc)
+
+
+def reading(cooler, minutes=0, temperature=4.0, volume=800.0):
+    return {
+        "bulk_cooler_id": cooler.pk,
+        "log_date": (READ_AT + timedelta(minutes=minutes)).isoformat(),
+        "volume_liters": volume,
+        "temperature_celsius": temperature,
+    }
+
+
+def make_cooler():
+    return BulkCooler.objects.create(route=Route.objects.create(name="North"), name="Cooler-1", capacity_liters=2000)
+
+
+@override_settings(COOLER_TELEMETRY=TELEMETRY)
+class TelemetryEndpointTests(TestCase):
+    def setUp(self):
+        self.cooler = make_cooler()
+
+    def _post(self, body, token="secret", content_type="application/json"):
+        return self.client.post(
+            "/bmcu/telemetry/", body, content_type=content_type, headers={"authorization": f"Bearer {token}"}
+        )
+
+    def test_wrong_token_is_refused(self):
+        response = self._post(json.dumps([reading(self.cooler)]), token="guess")
+
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(BulkCoolerLog.objects.exists())
+
+    @override_settings(COOLER_TELEMETRY={**TELEMETRY, "INGEST_TOKEN": ""})
+    def test_ingestion_is_disabled_without_a_token(self):
+        self.assertEqual(self._post(json.dumps([reading(self.cooler)]), token="").status_code, 401)
+
+    def test_resent_readings_overwrite_the_stored_ones(self):
+        self._post(json.dumps([reading(self.cooler, 0, volume=800.0), reading(self.cooler, 1)]))
+        response = self._post(
+            json.dumps({"readings": [reading(self.cooler, 0, volume=900.0), reading(self.cooler, 0, volume=950.0)]})
+        )
+
+        self.assertEqual(response.json(), {"received": 2, "stored": 1, "coalesced": 1, "rejected": []})
+        self.assertEqual(
+            list(BulkCoolerLog.objects.order_by("log_date").values_list("volume_liters", flat=True)), [950.0, 800.0]
+        )
+
+    def test_csv_readings_and_unknown_coolers(self):
+        csv_body = "bulk_cooler_id,log_date,volume_liters,temperature_celsius\n"
+        csv_body += f"{self.cooler.pk},{READ_AT.isoformat()},700,3.5\n"
+        csv_body += f"{self.cooler.pk + 1},{READ_AT.isoformat()},700,3.5\n"
+
+        result = self._post(csv_body, content_type="text/csv").json()
+
+        self.assertEqual((result["stored"], len(result["rejected"])), (1, 1))
+        self.assertEqual(BulkCoolerLog.objects.get().temperature_celsius, 3.5)
+
+
+@override_settings(COOLER_TELEMETRY=TELEMETRY)
+class TelemetryConsumerTests(TransactionTestCase):
+    def setUp(self):
+        self.cooler = make_cooler()
+
+    async def _connect(self, token="secret"):
+        communicator = WebsocketCommunicator(
+            CoolerTelemetryConsumer.as_asgi(), f"/ws/telemetry/coolers/?token={token}"
+        )
+        connected, code = await communicator.connect()
+        return communicator, connected, code
+
+    async def test_wrong_token_is_closed(self):
+        communicator, connected, code = await self._connect(token="guess")
+
+        self.assertFalse(connected)
+        self.assertEqual(code, 4401)
+
+    async def test_a_full_batch_is_upserted_and_acknowledged(self):
+        communicator, connected, _ = await self._connect()
+        self.assertTrue(connected)
+
+        await communicator.send_json_to([reading(self.cooler, 0, volume=800.0), reading(self.cooler, 1)])
+        self.assertEqual((await communicator.receive_json_from())["stored"], 2)
+        await communicator.send_json_to([reading(self.cooler, 0, volume=900.0), reading(self.cooler, 2)])
+        self.assertEqual((await communicator.receive_json_from())["stored"], 2)
+        await communicator.disconnect()
+
+        volumes = BulkCoolerLog.objects.order_by("log_date").values_list("volume_liters", flat=True)
+        self.assertEqual(await database_sync_to_async(list)(volumes), [900.0, 800.0, 800.0])
+
+    async def test_a_failed_periodic_flush_does_not_stop_later_ones(self):
+        communicator, _, _ = await self._connect()
+
+        with mock.patch("collection_center.consumers.ingest", side_effect=RuntimeError("database down")):
+            with self.assertLogs("collection_center.consumers", "ERROR"):
+                await communicator.send_json_to(reading(self.cooler, 0))
+                await asyncio.sleep(0.2)
+        await communicator.send_json_to(reading(self.cooler, 1))
+
+        self.assertEqual((await communicator.receive_json_from(timeout=2))["stored"], 1)
+        await communicator.disconnect()
+
+
+class ColdChainTests(TestCase):
+    def setUp(self):
+        self.cooler = make_cooler()
+        make_lots(make_supplier("farmer"), 2, bulk_cooler=self.cooler)
+
+    def _readings(self, *temperatures, start=0, step=10):
+        return [
+            (self.cooler.pk, READ_AT + timedelta(minutes=start + index * step), temperature)
+            for index, temperature in enumerate(temperatures)
+        ]
+
+    def _flagged(self):
+        return MilkLot.objects.filter(bulk_cooler=self.cooler, needs_retest=True).count()
+
+    def test_a_sustained_excursion_flags_the_lots(self):
+        # 20 minutes above the limit in one batch, the remaining 10 in the next.
+        cold_chain.process(cold_chain.BULK_COOLER, self._readings(5.0, 5.5, 6.0))
+        self.assertEqual(self._flagged(), 0)
+
+        [event] = cold_chain.process(cold_chain.BULK_COOLER, self._readings(5.0, start=30))
+
+        self.assertEqual((event.started_at, event.peak), (READ_AT, 6.0))
+        self.assertEqual(self._flagged(), 2)
+
+    def test_a_short_excursion_does_not(self):
+        events = cold_chain.process(cold_chain.BULK_COOLER, self._readings(5.0, 6.0, 3.0, 5.0, 3.0))
+
+        self.assertEqual(events, [])
+        self.assertEqual(self._flagged(), 0)
+        state = ColdChainState.objects.get(vessel_type=cold_chain.BULK_COOLER, vessel_id=self.cooler.pk)
+        self.assertIsNone(state.excursion_started)
+
+    def test_a_critical_reading_flags_at_once_and_only_once(self):
+        self.assertEqual(len(cold_chain.process(cold_chain.BULK_COOLER, self._readings(9.0))), 1)
+        self.assertEqual(cold_chain.process(cold_chain.BULK_COOLER, self._readings(9.5, start=10)), [])
+        self.assertEqual(self._flagged(), 2)
+
+    def test_replayed_readings_are_ignored(self):
+        cold_chain.process(cold_chain.BULK_COOLER, self._readings(5.0, 5.0, 5.0))
+
+        self.assertEqual(cold_chain.process(cold_chain.BULK_COOLER, self._readings(5.0, 5.0, 5.0, step=5)), [])
+        self.assertEqual(self._flagged(), 0)
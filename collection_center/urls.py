@@ -1,8 +1,9 @@
 from django.urls import path
-from .views import assign_cooler_tank
+from .views import assign_cooler_tank, ingest_cooler_telemetry
 app_name = "bmcu"
 
 urlpatterns = [
     path('assign-cooler-tank/', assign_cooler_tank, name='cooler_tank'),
+    path('telemetry/', ingest_cooler_telemetry, name='cooler_telemetry'),
 
-]
\ No newline at end of file
+]
@@ -1,4 +1,35 @@
+import json
+
+from django.http import JsonResponse
 from django.shortcuts import render
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from .telemetry import InvalidReading, ingest, is_authorized, parse_csv_readings, parse_json_readings
+
 
 def assign_cooler_tank(request):
     return render(request, 'collection_center/assign_cooler_tank.html')
+
+
+@csrf_exempt
+@require_POST
+def ingest_cooler_telemetry(request):
+    """
+    Bulk cooler readings from controllers, as a JSON array or CSV
+    (Content-Type: text/csv). Authenticated with ``Authorization: Bearer <token>``.
+    """
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not is_authorized(token):
+        return JsonResponse({"error": "Invalid telemetry token"}, status=401)
+
+    try:
+        if request.content_type == "text/csv":
+            readings = parse_csv_readings(request.body.decode("utf-8"))
+        else:
+            readings = parse_json_readings(json.loads(request.body))
+    except (InvalidReading, UnicodeDecodeError, json.JSONDecodeError) as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    result = ingest(readings)
+    return JsonResponse(result.as_dict(), status=200 if result.stored or not result.rejected else 400)
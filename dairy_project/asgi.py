@@ -8,20 +8,25 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 import os
 from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "dairy_project.settings")
+
+# Set up Django before importing consumers that use the ORM.
+django_asgi_app = get_asgi_application()
+
 from channels.routing import ProtocolTypeRouter, URLRouter
 from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
 from channels.auth import AuthMiddlewareStack
+import collection_center.routing
 import notifications.routing
 
-os.environ.setdefault("DJANGO_SETTINGS_MODULE", "dairy_project.settings")
-
 application = ASGIStaticFilesHandler(ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    "http": django_asgi_app,
     "websocket": AuthMiddlewareStack(
         URLRouter(
             notifications.routing.websocket_urlpatterns
+            + collection_center.routing.websocket_urlpatterns
         )
     ),
 })
 )
-
@@ -0,0 +1,158 @@
+"""
+Project caching layer on top of Django's cache framework.
+
+``CacheNamespace`` prefixes keys with a name and a version number stored in the
+shared backend; ``invalidate()`` bumps the version so every key written
+under the old one is orphaned at once, across all workers. A missing version
+(never set, evicted or flushed) is seeded from the clock rather than 1, so it
+never comes back to a version whose entries may still be cached. ``memoize``
+caches a function's results in a namespace, and ``request_memoize`` caches them
+only for the current request.
+"""
+import contextvars
+import functools
+import hashlib
+import time
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+
+DEFAULT_TIMEOUT = 300
+
+_MISSING = object()
+
+_request_cache = contextvars.ContextVar("request_cache", default=None)
+
+
+def digest(*values) -> str:
+    """Stable short key for arbitrary (repr-able) values, unlike the per-process ``hash()``."""
+    return hashlib.md5(repr(values).encode("utf-8")).hexdigest()
+
+
+class CacheNamespace:
+    def __init__(self, name, timeout=DEFAULT_TIMEOUT, alias=DEFAULT_CACHE_ALIAS):
+        self.name = name
+        self.timeout = timeout
+        self.alias = alias
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    @property
+    def _version_key(self):
+        return f"ns:{self.name}"
+
+    def version(self) -> int:
+        version = self.backend.get(self._version_key)
+        if version is None:
+            seed = time.time_ns()
+            self.backend.add(self._version_key, seed, timeout=None)
+            version = self.backend.get(self._version_key, seed)
+        return version
+
+    def invalidate(self) -> None:
+        """Orphan every key currently stored in this namespace."""
+        try:
+            self.backend.incr(self._version_key)
+        except ValueError:
+            self.backend.set(self._version_key, time.time_ns(), timeout=None)
+
+    def make_key(self, key) -> str:
+        return f"{self.name}:v{self.version()}:{key}"
+
+    def _timeout(self, timeout):
+        return self.timeout if timeout is _MISSING else timeout
+
+    def get(self, key, default=None):
+        return self.backend.get(self.make_key(key), default)
+
+    def set(self, key, value, timeout=_MISSING) -> None:
+        self.backend.set(self.make_key(key), value, timeout=self._timeout(timeout))
+
+    def add(self, key, value, timeout=_MISSING) -> bool:
+        return self.backend.add(self.make_key(key), value, timeout=self._timeout(timeout))
+
+    def delete(self, key) -> None:
+        self.backend.delete(self.make_key(key))
+
+    def get_or_set(self, key, default, timeout=_MISSING):
+        return self.backend.get_or_set(self.make_key(key), default, timeout=self._timeout(timeout))
+
+    def get_many(self, keys) -> dict:
+        """Fetch several keys in one round trip; missing keys are left out."""
+        prefix = self.make_key("")
+        found = self.backend.get_many([f"{prefix}{key}" for key in keys])
+        return {key: found[f"{prefix}{key}"] for key in keys if f"{prefix}{key}" in found}
+
+    def set_many(self, mapping, timeout=_MISSING) -> None:
+        prefix = self.make_key("")
+        self.backend.set_many(
+            {f"{prefix}{key}": value for key, value in mapping.items()}, timeout=self._timeout(timeout)
+        )
+
+    def incr(self, key, delta=1, timeout=_MISSING) -> int:
+        """Increment a counter, creating it (with this namespace's timeout) when missing."""
+        cache_key = self.make_key(key)
+        if self.backend.add(cache_key, delta, timeout=self._timeout(timeout)):
+            return delta
+        try:
+            return self.backend.incr(cache_key, delta)
+        except ValueError:
+            self.backend.set(cache_key, delta, timeout=self._timeout(timeout))
+            return delta
+
+
+def memoize(namespace: CacheNamespace, timeout=_MISSING):
+    """Cache a function's return value in ``namespace``, keyed on its arguments."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = f"{func.__qualname__}:{digest(args, sorted(kwargs.items()))}"
+            result = namespace.get(key, _MISSING)
+            if result is _MISSING:
+                result = func(*args, **kwargs)
+                namespace.set(key, result, timeout=timeout)
+            return result
+
+        wrapper.namespace = namespace
+        return wrapper
+
+    return decorator
+
+
+def request_memoize(func):
+    """
+    Cache a function's return value for the rest of the current request.
+    Outside a request (shell, management commands) it simply calls through.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        store = _request_cache.get()
+        if store is None:
+            return func(*args, **kwargs)
+        key = (func.__module__, func.__qualname__, args, tuple(sorted(kwargs.items())))
+        try:
+            return store[key]
+        except KeyError:
+            result = store[key] = func(*args, **kwargs)
+            return result
+        except TypeError:  # unhashable arguments
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+class RequestCacheMiddleware:
+    """Gives every request its own ``request_memoize`` store."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _request_cache.set({})
+        try:
+            return self.get_response(request)
+        finally:
+            _request_cache.reset(token)
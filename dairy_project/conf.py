@@ -0,0 +1,32 @@
+"""
+Helpers shared by the apps' service modules.
+
+``AppSettings`` reads one feature's settings dict (e.g. ``EXPORTS = {...}``
+in settings.py) with the module's own defaults, so a deployment only lists
+what it changes. It looks the dict up on every call, so ``override_settings``
+and settings changed at runtime take effect.
+"""
+from typing import Any, Dict, Iterable, Iterator, List
+
+from django.conf import settings
+
+
+class AppSettings:
+    def __init__(self, name: str, defaults: Dict[str, Any]):
+        self.name = name
+        self.defaults = defaults
+
+    def __call__(self, key: str) -> Any:
+        return getattr(settings, self.name, {}).get(key, self.defaults[key])
+
+
+def chunked(items: Iterable, size: int) -> Iterator[List]:
+    """``items`` as consecutive lists of ``size`` (the last one may be shorter)."""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,52 @@
+"""
+Database connection latency benchmark.
+
+Simulates requests the way Django's handlers do (request_started, one
+representative query, request_finished) from N threads at once and reports
+per-request latency, so CONN_MAX_AGE, health checks and the psycopg pool can be
+compared against the configured database:
+
+    python manage.py db_benchmark --concurrency 1 8 32 --requests 500
+    DB_CONN_MAX_AGE=60 DB_POOL=False python manage.py db_benchmark
+"""
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.signals import request_finished, request_started
+from django.db import connection
+
+
+def _simulated_request(query) -> float:
+    started = time.perf_counter()
+    request_started.send(sender=None)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(query)
+            cursor.fetchall()
+    finally:
+        request_finished.send(sender=None)
+    return (time.perf_counter() - started) * 1000
+
+
+def _percentile(samples, percent) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run(concurrency, requests, query):
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        started = time.perf_counter()
+        latencies = list(executor.map(lambda _: _simulated_request(query), range(requests)))
+        elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "throughput": requests / elapsed,
+        "p50": _percentile(latencies, 50),
+        "p95": _percentile(latencies, 95),
+        "p99": _percentile(latencies, 99),
+        "mean": statistics.fmean(latencies),
+    }
+
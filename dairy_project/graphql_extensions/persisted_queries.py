@@ -0,0 +1,103 @@
+import hashlib
+from collections.abc import Iterator
+from typing import Optional
+
+from graphql import GraphQLError
+from strawberry.extensions import ParserCache, SchemaExtension, ValidationCache
+
+from dairy_project.cache import CacheNamespace
+from dairy_project.conf import AppSettings
+
+DEFAULTS = {
+    "DOCUMENT_CACHE_SIZE": 256,
+    "REGISTRY_TIMEOUT": 7 * 24 * 3600,
+    "GET_MAX_AGE": 0,
+}
+
+PERSISTED_QUERY_NOT_FOUND = "PersistedQueryNotFound"
+
+
+_setting = AppSettings("GRAPHQL_PERSISTED_QUERIES", DEFAULTS)
+
+
+def query_hash(query: str) -> str:
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+
+class PersistedQueryRegistry:
+    """
+    sha256 -> query text, kept in the shared cache so a document registered
+    through one worker can be served by hash from every other worker. Any
+    client can register documents, so they expire REGISTRY_TIMEOUT seconds
+    after registration; a client holding an expired hash gets
+    PersistedQueryNotFound and registers it again.
+    """
+
+    def __init__(self):
+        self.documents = CacheNamespace("graphql_apq")
+
+    @property
+    def timeout(self) -> int:
+        return _setting("REGISTRY_TIMEOUT")
+
+    def get(self, sha256_hash: str) -> Optional[str]:
+        return self.documents.get(sha256_hash)
+
+    def register(self, query: str) -> str:
+        sha256_hash = query_hash(query)
+        self.documents.set(sha256_hash, query, timeout=self.timeout)
+        return sha256_hash
+
+
+registry = PersistedQueryRegistry()
+
+
+class PersistedQueries(SchemaExtension):
+    """
+    Automatic persisted queries (Apollo APQ protocol).
+
+    A client sends ``extensions.persistedQuery.sha256Hash`` without the query
+    text. Unknown hashes answer ``PersistedQueryNotFound``, and the client
+    retries once with both the query and the hash, which registers it.
+    """
+
+    def on_operation(self) -> Iterator[None]:
+        execution_context = self.execution_context
+        persisted_query = (execution_context.operation_extensions or {}).get("persistedQuery")
+
+        if persisted_query:
+            sha256_hash = persisted_query.get("sha256Hash")
+            if persisted_query.get("version", 1) != 1 or not sha256_hash:
+                raise GraphQLError(
+                    "Unsupported persisted query.",
+                    extensions={"code": "PERSISTED_QUERY_NOT_SUPPORTED"},
+                )
+
+            if execution_context.query:
+                if query_hash(execution_context.query) != sha256_hash:
+                    raise GraphQLError(
+                        "Provided sha256Hash does not match query.",
+                        extensions={"code": "PERSISTED_QUERY_HASH_MISMATCH"},
+                    )
+                registry.register(execution_context.query)
+            else:
+                query = registry.get(sha256_hash)
+                if query is None:
+                    raise GraphQLError(
+                        PERSISTED_QUERY_NOT_FOUND,
+                        extensions={"code": "PERSISTED_QUERY_NOT_FOUND"},
+                    )
+                execution_context.query = query
+        yield
+
+
+def document_cache_extensions() -> list:
+    """
+    Process-wide LRU caches of parsed documents and their validation results,
+    so the dashboards' hot queries skip both steps after the first request.
+    """
+    maxsize = _setting("DOCUMENT_CACHE_SIZE")
+    return [
+        lambda: ParserCache(maxsize=maxsize),
+        lambda: ValidationCache(maxsize=maxsize),
+    ]
@@ -0,0 +1,258 @@
+from collections.abc import Iterator
+from typing import Optional
+
+from graphql import (
+    ExecutionResult,
+    FieldNode,
+    FragmentSpreadNode,
+    GraphQLError,
+    GraphQLList,
+    GraphQLNonNull,
+    InlineFragmentNode,
+    OperationDefinitionNode,
+    get_named_type,
+    is_composite_type,
+)
+from graphql.utilities import get_operation_ast, value_from_ast_untyped
+from strawberry.extensions import SchemaExtension
+
+from dairy_project.cache import CacheNamespace
+from dairy_project.conf import AppSettings
+
+DEFAULTS = {
+    "MAX_COST": 5000,
+    "MAX_DEPTH": 10,
+    "DEFAULT_LIST_SIZE": 20,
+    "FIELD_COSTS": {},
+    "LIST_SIZES": {},
+    "THROTTLE_BUDGET": 0,
+    "THROTTLE_WINDOW": 60,
+}
+
+# Extra cost for fields whose resolver runs its own query, keyed "Type.field"
+# by GraphQL (camelCase) names. Composite fields default to 1, leaves to 0.
+FIELD_COSTS = {
+    "Query.invoices": 25,
+    "Query.milkLotVolumeStatsCurrentMonth": 5,
+    "Query.milkLotVolumeByRoute": 5,
+    "Query.supplierMilkVolumeStatsCurrentMonth": 5,
+    "Query.billSummaryCurrentMonth": 5,
+    "Query.getApprovedInstantGateTransfersByPlant": 10,
+    "Query.pricingSimulation": 25,
+    "MilkTransferType.relatedCompositeSamples": 5,
+    "MilkTransferType.gateSamplesCount": 2,
+    "MilkTransferType.gatePass": 2,
+    "BulkCoolerType.milkLots": 2,
+    "BulkCoolerType.relatedMilkTransfers": 2,
+    "BulkCoolerType.sampleCount": 2,
+    "OnFarmTankType.milkLots": 2,
+    "OnFarmTankType.relatedMilkTransfers": 2,
+    "OnFarmTankType.sampleCount": 2,
+    "SiloType.completedTransfers": 2,
+    "VehicleType.isOccupied": 1,
+}
+
+# Expected rows for list fields that take no size argument.
+LIST_SIZES = {
+    "Query.plants": 10,
+    "Query.allRoutes": 50,
+    "Query.allDistributors": 50,
+    "Query.testers": 50,
+    "Query.silosByPlant": 20,
+    "BulkCoolerType.milkLots": 50,
+    "OnFarmTankType.milkLots": 50,
+    "MilkTransferType.relatedCompositeSamples": 30,
+    "GatePassType.seals": 5,
+    "Query.routePlans": 1,
+    "RoutePlanType.trips": 10,
+    "RoutePlanTripType.stops": 40,
+    "UserType.groups": 5,
+    "EmployeeType.routes": 5,
+}
+
+# Argument names that bound how many rows a list field returns.
+SIZE_ARGUMENTS = ("first", "last", "limit", "perPage", "per_page")
+
+budget_cache = CacheNamespace("graphql_cost")
+
+
+_setting = AppSettings("GRAPHQL_QUERY_COST", DEFAULTS)
+
+
+def _is_list_type(graphql_type) -> bool:
+    if isinstance(graphql_type, GraphQLNonNull):
+        graphql_type = graphql_type.of_type
+    return isinstance(graphql_type, GraphQLList)
+
+
+class QueryCost:
+    """
+    Static cost of one operation: every composite field costs 1 (or its
+    FIELD_COSTS entry) and list fields multiply the cost of their children
+    by the expected number of rows.
+    """
+
+    def __init__(self, schema, document, operation_name=None, variables=None):
+        self.schema = schema
+        self.document = document
+        self.operation_name = operation_name
+        self.variables = variables or {}
+        self.field_costs = {**FIELD_COSTS, **_setting("FIELD_COSTS")}
+        self.list_sizes = {**LIST_SIZES, **_setting("LIST_SIZES")}
+        self.default_list_size = _setting("DEFAULT_LIST_SIZE")
+        self.fragments = {
+            definition.name.value: definition
+            for definition in document.definitions
+            if definition.kind == "fragment_definition"
+        }
+        self.cost = 0
+        self.depth = 0
+
+    def analyze(self) -> "QueryCost":
+        operation: Optional[OperationDefinitionNode] = get_operation_ast(
+            self.document, self.operation_name
+        )
+        if operation is None:
+            return self
+        root_type = self.schema.get_root_type(operation.operation)
+        if root_type is None:
+            return self
+        self.cost = self._selection_cost(operation.selection_set, root_type, 1, None, set())
+        return self
+
+    def _selection_cost(self, selection_set, parent_type, depth, size_hint, visited) -> int:
+        if selection_set is None:
+            return 0
+        self.depth = max(self.depth, depth)
+        total = 0
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                total += self._field_cost(selection, parent_type, depth, size_hint, visited)
+            elif isinstance(selection, InlineFragmentNode):
+                fragment_type = parent_type
+                if selection.type_condition is not None:
+                    fragment_type = self.schema.get_type(selection.type_condition.name.value) or parent_type
+                total += self._selection_cost(
+                    selection.selection_set, fragment_type, depth, size_hint, visited
+                )
+            elif isinstance(selection, FragmentSpreadNode):
+                name = selection.name.value
+                fragment = self.fragments.get(name)
+                if fragment is None or name in visited:
+                    continue
+                fragment_type = self.schema.get_type(fragment.type_condition.name.value) or parent_type
+                total += self._selection_cost(
+                    fragment.selection_set, fragment_type, depth, size_hint, visited | {name}
+                )
+        return total
+
+    def _field_cost(self, node: FieldNode, parent_type, depth, size_hint, visited) -> int:
+        name = node.name.value
+        if name.startswith("__") or not hasattr(parent_type, "fields"):
+            return 0
+        field = parent_type.fields.get(name)
+        if field is None:
+            return 0
+
+        key = f"{parent_type.name}.{name}"
+        field_type = get_named_type(field.type)
+        if not is_composite_type(field_type):
+            return self.field_costs.get(key, 0)
+
+        arguments = self._arguments(node)
+        requested_size = self._requested_size(arguments)
+        if _is_list_type(field.type):
+            multiplier = requested_size or size_hint or self.list_sizes.get(key, self.default_list_size)
+            child_hint = None
+        else:
+            multiplier = 1
+            child_hint = requested_size or size_hint
+
+        children = self._selection_cost(node.selection_set, field_type, depth + 1, child_hint, visited)
+        return multiplier * (self.field_costs.get(key, 1) + children)
+
+    def _arguments(self, node: FieldNode) -> dict:
+        return {
+            argument.name.value: value_from_ast_untyped(argument.value, self.variables)
+            for argument in node.arguments or ()
+        }
+
+    def _requested_size(self, arguments: dict) -> Optional[int]:
+        for value in arguments.values():
+            if isinstance(value, dict):
+                nested = self._requested_size(value)
+                if nested:
+                    return nested
+        for name in SIZE_ARGUMENTS:
+            value = arguments.get(name)
+            if isinstance(value, int) and value > 0:
+                return value
+        return None
+
+
+class QueryCostAnalyzer(SchemaExtension):
+    """
+    Rejects operations whose static cost or depth is over the configured
+    limits, charges the cost against a per-client budget and reports it
+    under ``extensions.cost`` in the response.
+    """
+
+    def __init__(self, *, execution_context=None):
+        super().__init__(execution_context=execution_context)
+        self.query_cost: Optional[QueryCost] = None
+
+    def on_execute(self) -> Iterator[None]:
+        execution_context = self.execution_context
+        if execution_context.graphql_document is not None and not execution_context.pre_execution_errors:
+            self.query_cost = QueryCost(
+                execution_context.schema._schema,
+                execution_context.graphql_document,
+                execution_context.operation_name,
+                execution_context.variables,
+            ).analyze()
+            error = self._check_limits(self.query_cost)
+            if error is not None:
+                execution_context.result = ExecutionResult(data=None, errors=[error])
+        yield
+
+    def _check_limits(self, query_cost: QueryCost) -> Optional[GraphQLError]:
+        max_depth = _setting("MAX_DEPTH")
+        if max_depth and query_cost.depth > max_depth:
+            return GraphQLError(
+                f"Query depth {query_cost.depth} exceeds the maximum allowed depth of {max_depth}."
+            )
+
+        max_cost = _setting("MAX_COST")
+        if max_cost and query_cost.cost > max_cost:
+            return GraphQLError(
+                f"Query cost {query_cost.cost} exceeds the maximum allowed cost of {max_cost}."
+            )
+
+        budget = _setting("THROTTLE_BUDGET")
+        if budget and query_cost.cost:
+            window = _setting("THROTTLE_WINDOW")
+            spent = budget_cache.incr(self._client_key(), query_cost.cost, timeout=window)
+            if spent > budget:
+                return GraphQLError(
+                    f"Query cost budget of {budget} per {window}s exhausted. Try again shortly."
+                )
+        return None
+
+    def _client_key(self) -> str:
+        request = getattr(self.execution_context.context, "request", None)
+        user = getattr(request, "user", None)
+        if user is not None and user.is_authenticated:
+            return f"user_{user.pk}"
+        meta = getattr(request, "META", {})
+        return f"ip_{meta.get('REMOTE_ADDR', 'unknown')}"
+
+    def get_results(self) -> dict:
+        if self.query_cost is None:
+            return {}
+        return {
+            "cost": {
+                "requested": self.query_cost.cost,
+                "depth": self.query_cost.depth,
+                "maximum": _setting("MAX_COST"),
+            }
+        }
@@ -0,0 +1,232 @@
+"""
+Selection-aware queryset optimizer.
+
+Any resolver that returns an unevaluated QuerySet gets it rewritten from the
+fields the operation selects below it:
+
+* forward foreign keys / one-to-ones -> ``select_related`` (nested),
+* reverse foreign keys / many-to-manys -> ``prefetch_related`` with a
+  ``Prefetch`` whose queryset is planned the same way,
+* plain columns -> ``only()``, but only when every selected field on that
+  type is a model field; a custom resolver may read any attribute, and a
+  deferred attribute would cost a query per row.
+
+Fields with custom resolvers are matched to a model relation by name when it
+is single-valued. Resolvers that follow other paths are described in HINTS,
+keyed like FIELD_COSTS by "Type.field":
+
+    ("select", "milk_transfer__vehicle")   returns that related object
+    ("prefetch", "seals")                  returns that relation's .all()
+    ("prefetch", "seals", ["position"])    ... and filters on these columns
+    ("needs", ["vehicle", "bulk_cooler"])  reads these relations itself
+
+Resolvers that fetch a single instance can call ``optimize(queryset, info)``
+before ``.get()``.
+"""
+from typing import Dict, List, Optional, Set
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch, QuerySet
+from django.db.models.query import ModelIterable
+from graphql import (
+    FieldNode,
+    FragmentSpreadNode,
+    GraphQLObjectType,
+    InlineFragmentNode,
+    get_named_type,
+)
+from strawberry.extensions import SchemaExtension
+
+HINTS = {
+    "GatePassType.vehicle": ("select", "milk_transfer__vehicle"),
+    "GatePassType.seals": ("prefetch", "seals"),
+    "MilkTransferType.gatePass": ("prefetch", "gate_passes"),
+    "SiloType.completedTransfers": ("prefetch", "incoming_transfers", ["status"]),
+    "MilkTransferType.gateSamplesCount": ("needs", ["vehicle"]),
+    "MilkTransferType.relatedCompositeSamples": (
+        "needs",
+        ["vehicle", "bulk_cooler", "on_farm_tank", "can_collection"],
+    ),
+}
+
+
+class Plan:
+    def __init__(self):
+        self.only: Optional[Set[str]] = set()
+        self.select_related: Set[str] = set()
+        self.prefetch_related: Dict[str, Prefetch] = {}
+
+    def defer_nothing(self):
+        self.only = None
+
+    def merge(self, child: "Plan", prefix: str):
+        """Fold a select_related child's plan in under ``prefix``."""
+        self.select_related.add(prefix)
+        self.select_related.update(f"{prefix}__{lookup}" for lookup in child.select_related)
+        for lookup, prefetch in child.prefetch_related.items():
+            path = f"{prefix}__{lookup}"
+            self.prefetch_related[path] = Prefetch(path, queryset=prefetch.queryset)
+        if self.only is not None:
+            if child.only is None:
+                self.only = None
+            else:
+                self.only.add(prefix)
+                self.only.update(f"{prefix}__{name}" for name in child.only)
+
+    def apply(self, queryset: QuerySet) -> QuerySet:
+        joined = queryset.query.select_related
+        if joined is True:
+            self.defer_nothing()
+        elif joined and self.only is not None:
+            # Relations the resolver already joins must not be deferred.
+            self.only.update(_lookups(joined))
+        if self.select_related:
+            queryset = queryset.select_related(*sorted(self.select_related))
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related.values())
+        if self.only:
+            queryset = queryset.only(*sorted(self.only | {queryset.model._meta.pk.name}))
+        return queryset
+
+
+def _lookups(joined: dict, prefix="") -> Set[str]:
+    """Flatten Query.select_related's nested dict into ``a``, ``a__b`` lookups."""
+    lookups = set()
+    for name, nested in joined.items():
+        lookups.add(prefix + name)
+        lookups.update(_lookups(nested, f"{prefix}{name}__"))
+    return lookups
+
+
+def _subfields(field_nodes, fragments, object_type) -> Dict[str, List[FieldNode]]:
+    """Selected subfields by schema field name, fragments flattened and aliases merged."""
+    fields: Dict[str, List[FieldNode]] = {}
+
+    def collect(selection_set):
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                fields.setdefault(selection.name.value, []).append(selection)
+            elif isinstance(selection, InlineFragmentNode):
+                condition = selection.type_condition
+                if condition is None or condition.name.value == object_type.name:
+                    collect(selection.selection_set)
+            elif isinstance(selection, FragmentSpreadNode):
+                fragment = fragments.get(selection.name.value)
+                fragment = getattr(fragment, "definition", fragment)
+                if fragment is not None and fragment.type_condition.name.value == object_type.name:
+                    collect(fragment.selection_set)
+
+    for node in field_nodes:
+        if node.selection_set:
+            collect(node.selection_set)
+    return fields
+
+
+def _relation(model, lookup):
+    """Model field at the end of an ``a__b`` relation lookup."""
+    *hops, last = lookup.split("__")
+    for name in hops:
+        model = model._meta.get_field(name).related_model
+    return model._meta.get_field(last)
+
+
+def _plan(model, object_type, field_nodes, fragments) -> Plan:
+    plan = Plan()
+    for name, nodes in _subfields(field_nodes, fragments, object_type).items():
+        if name == "__typename":
+            continue
+        graphql_field = object_type.fields.get(name)
+        definition = graphql_field and graphql_field.extensions.get("strawberry-definition")
+        if definition is None:
+            plan.defer_nothing()
+            continue
+
+        child_type = get_named_type(graphql_field.type)
+        hint = HINTS.get(f"{object_type.name}.{name}")
+        if hint is not None:
+            _apply_hint(plan, model, hint, child_type, nodes, fragments)
+            continue
+
+        custom = definition.base_resolver is not None
+        if custom:
+            plan.defer_nothing()
+        model_name = getattr(definition, "django_name", None) or definition.python_name
+        try:
+            model_field = model._meta.get_field(model_name)
+        except FieldDoesNotExist:
+            plan.defer_nothing()
+            continue
+
+        if not model_field.is_relation:
+            if plan.only is not None:
+                plan.only.add(model_field.name)
+            continue
+        if not isinstance(child_type, GraphQLObjectType):
+            if plan.only is not None and model_field.concrete:
+                plan.only.add(model_field.name)
+            continue
+
+        if model_field.many_to_one or model_field.one_to_one:
+            plan.merge(_plan(model_field.related_model, child_type, nodes, fragments), model_field.name)
+        elif not custom:
+            plan.prefetch_related[model_name] = Prefetch(
+                model_name,
+                queryset=_child_queryset(model_field, child_type, nodes, fragments),
+            )
+    return plan
+
+
+def _apply_hint(plan, model, hint, child_type, nodes, fragments):
+    kind, lookups, *columns = hint
+    plan.defer_nothing()
+    if kind == "needs":
+        plan.select_related.update(lookups)
+        return
+    model_field = _relation(model, lookups)
+    if kind == "select":
+        child = Plan()
+        if isinstance(child_type, GraphQLObjectType):
+            child = _plan(model_field.related_model, child_type, nodes, fragments)
+        plan.merge(child, lookups)
+    elif kind == "prefetch":
+        plan.prefetch_related[lookups] = Prefetch(
+            lookups, queryset=_child_queryset(model_field, child_type, nodes, fragments, *columns)
+        )
+
+
+def _child_queryset(model_field, child_type, nodes, fragments, columns=()) -> QuerySet:
+    queryset = model_field.related_model._default_manager.all()
+    if not isinstance(child_type, GraphQLObjectType):
+        return queryset
+    child = _plan(model_field.related_model, child_type, nodes, fragments)
+    if child.only is not None and model_field.one_to_many:
+        # The prefetch joins rows back to their parent through this column.
+        child.only.add(model_field.field.name)
+    if child.only is not None:
+        child.only.update(columns)
+    return child.apply(queryset)
+
+
+def optimize(queryset: QuerySet, info) -> QuerySet:
+    """Apply the selection-derived select_related/prefetch_related/only to ``queryset``."""
+    info = getattr(info, "_raw_info", info)
+    if (
+        queryset._result_cache is not None
+        or queryset._iterable_class is not ModelIterable
+        or queryset.query.combinator
+    ):
+        return queryset
+    object_type = get_named_type(info.return_type)
+    if not isinstance(object_type, GraphQLObjectType):
+        return queryset
+    return _plan(queryset.model, object_type, info.field_nodes, info.fragments).apply(queryset)
+
+
+class QuerySetOptimizer(SchemaExtension):
+    """Runs ``optimize`` on every QuerySet a resolver returns, before it is iterated."""
+
+    def resolve(self, _next, root, info, *args, **kwargs):
+        result = _next(root, info, *args, **kwargs)
+        if isinstance(result, QuerySet):
+            return optimize(result, info)
+        return result
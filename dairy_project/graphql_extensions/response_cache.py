@@ -0,0 +1,130 @@
+import functools
+import logging
+
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from strawberry.types import Info
+
+from dairy_project.cache import CacheNamespace, digest
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 60 * 60 * 24
+
+_MISSING = object()
+
+field_cache = CacheNamespace("graphql_fields", timeout=DEFAULT_TIMEOUT)
+counters = CacheNamespace("graphql_field_stats", timeout=None)
+
+# Qualified names of the cached resolvers (for stats()) and one namespace per
+# tracked model, whose version is that model's entity tag.
+_registered_fields = set()
+_entity_namespaces = {}
+
+# Columns the cached types render, for tracked models that are also saved for
+# bookkeeping: a save limited to other columns (User.last_login, written on
+# every sign-in) leaves the cached responses alone.
+RENDERED_FIELDS = {
+    "auth.user": {"username", "email", "first_name", "last_name", "is_active", "is_staff", "is_superuser"},
+}
+
+
+def _model_label(model) -> str:
+    return model._meta.label_lower
+
+
+def entity_tag(label: str) -> int:
+    """Current version of a model's cached responses; bumped on every write."""
+    return _entity_namespaces[label].version()
+
+
+def invalidate(model) -> None:
+    label = _model_label(model)
+    _entity_namespaces[label].invalidate()
+    logger.debug("Response cache invalidated for %s", label)
+
+
+def _on_model_change(sender, update_fields=None, **kwargs):
+    rendered = RENDERED_FIELDS.get(_model_label(sender))
+    if rendered is not None and update_fields is not None and rendered.isdisjoint(update_fields):
+        return
+    invalidate(sender)
+
+
+def _on_m2m_change(sender, instance, action, model=None, **kwargs):
+    if not action.startswith("post_"):
+        return
+    for changed in (type(instance), model):
+        if changed is not None and _model_label(changed) in _entity_namespaces:
+            invalidate(changed)
+
+
+def _track(model) -> None:
+    label = _model_label(model)
+    if label in _entity_namespaces:
+        return
+    _entity_namespaces[label] = CacheNamespace(f"entity:{label}")
+    post_save.connect(_on_model_change, sender=model, weak=False, dispatch_uid=f"graphql_cache_save_{label}")
+    post_delete.connect(_on_model_change, sender=model, weak=False, dispatch_uid=f"graphql_cache_delete_{label}")
+
+
+m2m_changed.connect(_on_m2m_change, weak=False, dispatch_uid="graphql_cache_m2m")
+
+
+def stats() -> dict:
+    """Hit and miss counters for every cached resolver."""
+    return {
+        name: {
+            "hits": counters.get(f"hits:{name}", 0),
+            "misses": counters.get(f"misses:{name}", 0),
+        }
+        for name in sorted(_registered_fields)
+    }
+
+
+def cached_resolver(*models, timeout=DEFAULT_TIMEOUT):
+    """
+    Cache a read-mostly resolver's result, keyed on its arguments and the
+    entity tags of ``models``. Saving or deleting any instance of those
+    models bumps its tag, so stale entries are never read again and simply expire.
+Saves that only touch columns outside ``RENDERED_FIELDS`` keep the tag.
+
+        @strawberry.field
+        @cached_resolver(Route)
+        def all_routes(self) -> List[RouteType]:
+            ...
+
+    Querysets are evaluated before caching; add select_related/prefetch_related
+    to them for every relation the GraphQL type exposes.
+    """
+    for model in models:
+        _track(model)
+    labels = sorted(_model_label(model) for model in models)
+
+    def decorator(resolver):
+        name = resolver.__qualname__
+        _registered_fields.add(name)
+
+        @functools.wraps(resolver)
+        def wrapper(*args, **kwargs):
+            arguments = sorted(
+                (key, value) for key, value in kwargs.items() if not isinstance(value, Info)
+            )
+            tags = [entity_tag(label) for label in labels]
+            key = f"{name}:{digest(arguments, tags)}"
+
+            result = field_cache.get(key, _MISSING)
+            if result is not _MISSING:
+                counters.incr(f"hits:{name}")
+                return result
+
+            counters.incr(f"misses:{name}")
+            result = resolver(*args, **kwargs)
+            if isinstance(result, QuerySet):
+                result = list(result)
+            field_cache.set(key, result, timeout=timeout)
+            return result
+
+        return wrapper
+
+    return decorator
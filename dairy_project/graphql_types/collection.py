@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import date, datetime
 from typing import TYPE_CHECKING, Annotated, List, Optional
 
 import strawberry
@@ -100,3 +100,33 @@ class UpdateTankerInput:
 class UpdateTankerResponse:
     success: bool
     message: str
+
+@strawberry.type
+class CollectionDayWarningType:
+    vessel_type: str  # "bulk_cooler" or "onfarm_tank"
+    vessel_id: int
+    name: str
+    message: str
+
+@strawberry.type
+class StartCollectionDayPayload:
+    collection_day: date
+    bulk_coolers: List[BulkCoolerType]
+    onfarm_tanks: List[OnFarmTankType]
+    warnings: List[CollectionDayWarningType]
+
+@strawberry.type
+class TelemetryPointType:
+    bucket_start: datetime
+    samples: int
+    temperature_min: float
+    temperature_max: float
+    temperature_avg: float
+    volume_min: float
+    volume_max: float
+    volume_avg: float
+
+@strawberry.type
+class CoolerTelemetryType:
+    resolution: str  # "raw", "5m" or "1h"
+    points: List[TelemetryPointType]
@@ -4,9 +4,10 @@ import strawberry_django
 from typing import Optional
 from datetime import date, datetime
 from strawberry import auto
-from distribution.models import Vehicle, Distributor, CIPRecord
+from distribution.models import Vehicle, Distributor, CIPRecord, RoutePlan, RoutePlanStop, RoutePlanTrip
 from .auth import UserType
 from .routes import RouteType
+from .suppliers import SupplierType
 from typing import List
 
 @strawberry.type
@@ -140,11 +141,21 @@ class GatePassType:
     issued_at: Optional[datetime]
     completed_at: Optional[datetime]
     route : Optional[RouteType]
-    empty_tare_kg: float
-    net_volume_l: float
-    density_kg_per_l: float
     expected_arrival_plant: datetime
 
+    # DecimalFields on the model; Float cannot serialize Decimal.
+    @strawberry.field
+    def empty_tare_kg(self) -> float:
+        return float(self.empty_tare_kg)
+
+    @strawberry.field
+    def net_volume_l(self) -> float:
+        return float(self.net_volume_l)
+
+    @strawberry.field
+    def density_kg_per_l(self) -> float:
+        return float(self.density_kg_per_l)
+
     # ---------------- Related ----------------
 
     @strawberry.field
@@ -164,4 +175,79 @@ class GatePassType:
 
     @strawberry.field
     def seals(self) -> List["GatePassSealType"]:
-        return self.seals.all()
\ No newline at end of file
+        return self.seals.all()
+
+@strawberry.type
+class SupplierTraceType:
+    supplier_id: int
+    supplier_name: str
+    lot_ids: List[int]
+    volume_l: float
+
+@strawberry.type
+class NodeTraceType:
+    node_type: str  # "silo", "milk_transfer", "gate_pass", "bulk_cooler", "on_farm_tank" or "can_collection"
+    node_id: int
+    lot_ids: List[int]
+    volume_l: float
+    first_lot_date: date
+    last_lot_date: date
+
+@strawberry.type
+class TransitLossGroupType:
+    group_id: Optional[int]
+    name: Optional[str]
+    transfers: int
+    departure_weight_kg: float
+    arrival_weight_kg: float
+    weight_loss_kg: float
+    dispatched_volume_l: float
+    volume_loss_l: float
+    loss_percent: Optional[float]
+    max_loss_percent: Optional[float]
+
+@strawberry.type
+class TransitLossType:
+    milk_transfer_id: int
+    gate_pass_id: Optional[int]
+    route_id: Optional[int]
+    driver_id: Optional[int]
+    vehicle_id: Optional[int]
+    destination_id: Optional[int]
+    arrival_date: date
+    departure_weight_kg: Optional[float]
+    arrival_weight_kg: Optional[float]
+    weight_loss_kg: Optional[float]
+    density_kg_per_l: float
+    dispatched_volume_l: Optional[float]
+    arrival_volume_l: Optional[float]
+    volume_loss_l: Optional[float]
+    loss_percent: Optional[float]
+
+@strawberry_django.type(RoutePlanStop)
+class RoutePlanStopType:
+    position: auto
+    leg_km: auto
+    supplier: SupplierType
+
+@strawberry_django.type(RoutePlanTrip)
+class RoutePlanTripType:
+    number: auto
+    load_l: auto
+    distance_km: auto
+    over_capacity: auto
+    vehicle: Optional["VehicleType"]
+    stops: List[RoutePlanStopType]
+
+@strawberry_django.type(RoutePlan)
+class RoutePlanType:
+    id: auto
+    created_at: auto
+    supplier_count: auto
+    total_volume_l: auto
+    total_distance_km: auto
+    baseline_distance_km: auto
+    solve_seconds: auto
+    remarks: auto
+    route: RouteType
+    trips: List[RoutePlanTripType]
@@ -9,7 +9,7 @@ from strawberry.types import Info
 import strawberry_django
 from django.db.models import Q
 
-from milk.models import CompositeSample
+from milk.models import INSTANT_GATE_TESTS, SOCIETY_TEST, CompositeSample
 
 
 from .billing import PaymentBillType
@@ -24,8 +24,8 @@ if TYPE_CHECKING:
 
 @strawberry.enum
 class SampleTypeEnum(Enum):
-    INSTANT_GATE_TESTS = "instant-gate tests"
-    SOCIETY_TEST = "society test"
+    INSTANT_GATE_TESTS = INSTANT_GATE_TESTS
+    SOCIETY_TEST = SOCIETY_TEST
 
 @strawberry.input
 class CompositeSampleInput:
@@ -90,7 +90,6 @@ class MilkTransferType:
     transfer_date: datetime             
     arrival_datetime: Optional[datetime] 
     status: str                          
-    total_volume: Optional[float]      
     remarks: Optional[str]             
 
     vehicle: Optional[Annotated["VehicleType", strawberry.lazy(".distribution")]]
@@ -103,6 +102,11 @@ class MilkTransferType:
     on_farm_tank: Optional[Annotated["OnFarmTankType", strawberry.lazy(".collection")]]
     can_collection: Optional[Annotated["CanCollectionType", strawberry.lazy(".collection")]]
 
+    # DecimalField on the model; Float cannot serialize Decimal.
+    @strawberry.field
+    def total_volume(self) -> Optional[float]:
+        return float(self.total_volume) if self.total_volume is not None else None
+
     @strawberry.field(name="gateSamplesCount")
     def gate_sample_count(self, info: Info) -> int:
         if not self.vehicle:
@@ -132,7 +136,7 @@ class MilkTransferType:
     
     @strawberry.field
     def gate_pass(self, info: Info) -> Optional["GatePassType"]:
-        return self.gate_passes.first()
+        return min(self.gate_passes.all(), key=lambda gate_pass: gate_pass.pk, default=None)
 
 @strawberry.type
 class MilkLotType:
@@ -151,6 +155,9 @@ class MilkLotType:
     price_per_litre: Optional[Decimal]
     total_price: Optional[Decimal]
     status: str
+    needs_retest: bool
+    retest_reason: str
+    anomaly_score: Optional[float]
     date_created: Optional[date]
     bill: Optional[PaymentBillType]
     bulk_cooler: Optional[Annotated["BulkCoolerType", strawberry.lazy(".collection")]]
@@ -206,8 +213,90 @@ class MilkPricingConfigType:
     updated_at: datetime
     route: RouteType 
 
+@strawberry.type
+class MilkPricingVersionType:
+    id: int
+    effective_from: date
+    base_price: Decimal
+    added_water_max: float
+
+    fat_min: float
+    fat_bonus: Decimal
+
+    snf_min: float
+    snf_bonus: Decimal
+
+    protein_min: float
+    protein_bonus: Decimal
+
+    urea_max: float
+    urea_bonus: Decimal
+
+    bacteria_max: int
+    bacteria_bonus: Decimal
+
+    water_penalty_per_percent: Decimal
+
+    created_at: datetime
+    updated_at: datetime
+
 @strawberry.type
 class MilkLotVolumeStatType:
     date: date
     status: str
     total_volume: float
+
+@strawberry.type
+class QualityBlendType:
+    node_type: str  # "bulk_cooler", "on_farm_tank", "can_collection", "milk_transfer" or "silo"
+    node_id: int
+    volume_l: float
+    fat_percent: Optional[float]
+    snf_percent: Optional[float]
+    protein_percent: Optional[float]
+
+@strawberry.type
+class BlendParameterType:
+    parameter: str
+    predicted: Optional[float]
+    measured: Optional[float]
+    anomalous: bool
+
+@strawberry.type
+class BlendCheckType:
+    sample_id: int
+    node_type: str
+    node_id: int
+    volume_l: float
+    parameters: List[BlendParameterType]
+    anomalies: List[str]
+
+@strawberry.type
+class PayoutDeltaType:
+    group_id: int  # supplier or route id; 0 for the totals
+    name: str
+    lots: int
+    volume_l: float
+    current_payout: Decimal
+    proposed_payout: Decimal
+    delta: Decimal
+    newly_rejected: int
+    newly_accepted: int
+
+@strawberry.type
+class PriceBinType:
+    lower: float
+    upper: float
+    current_volume_l: float
+    proposed_volume_l: float
+    current_lots: int
+    proposed_lots: int
+
+@strawberry.type
+class PricingSimulationType:
+    start: date
+    end: date
+    totals: PayoutDeltaType
+    suppliers: List[PayoutDeltaType]
+    routes: List[PayoutDeltaType]
+    histogram: List[PriceBinType]
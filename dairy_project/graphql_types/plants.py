@@ -1,4 +1,5 @@
-from typing import Annotated, List, TYPE_CHECKING
+from datetime import date
+from typing import Annotated, List, Optional, TYPE_CHECKING
 
 import strawberry
 import strawberry_django
@@ -34,4 +35,13 @@ class SiloType:
         return self.plant.name
     @strawberry.field
     def completed_transfers(self) -> List[Annotated["MilkTransferType", strawberry.lazy(".milk")]]:
-        return self.incoming_transfers.filter(status="completed")
+        # Filtered in Python so a prefetched incoming_transfers is reused.
+        return [transfer for transfer in self.incoming_transfers.all() if transfer.status == "completed"]
+
+@strawberry.type
+class SiloFillDayType:
+    date: date
+    volume_l: float
+    silo_capacity_l: float
+    fill_percent: Optional[float]
+    processing_capacity_l: float
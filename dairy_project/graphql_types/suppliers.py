@@ -1,3 +1,4 @@
+from datetime import date
 from typing import Optional
 
 import strawberry
@@ -31,3 +32,8 @@ class SupplierType:
     bank_name: Optional[str]
     ifsc_code: Optional[str]
     route: Optional[RouteType]
+
+@strawberry.type
+class ForecastDayType:
+    date: date
+    volume_l: float
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from dairy_project.db_benchmark import run
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure per-request database latency at several concurrency levels with the configured "
+        "connection settings (DB_CONN_MAX_AGE, DB_CONN_HEALTH_CHECKS, DB_POOL*)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="Thread counts to run.")
+        parser.add_argument("--requests", type=int, default=500, help="Requests per concurrency level.")
+        parser.add_argument("--query", default="SELECT 1", help="SQL each simulated request runs.")
+
+    def handle(self, *args, **options):
+        if options["requests"] < 1 or min(options["concurrency"]) < 1:
+            raise CommandError("--requests and --concurrency must be positive.")
+
+        database = settings.DATABASES["default"]
+        self.stdout.write(
+            f"{database['ENGINE']}  CONN_MAX_AGE={database['CONN_MAX_AGE']}  "
+            f"CONN_HEALTH_CHECKS={database['CONN_HEALTH_CHECKS']}  "
+            f"pool={database.get('OPTIONS', {}).get('pool')}"
+        )
+        self.stdout.write(f"{'threads':>8} {'req/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'mean ms':>9}")
+        for concurrency in options["concurrency"]:
+            result = run(concurrency, options["requests"], options["query"])
+            self.stdout.write(
+                f"{result['concurrency']:>8} {result['throughput']:>10.0f} {result['p50']:>9.2f} "
+                f"{result['p95']:>9.2f} {result['p99']:>9.2f} {result['mean']:>9.2f}"
+            )
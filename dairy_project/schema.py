@@ -5,6 +5,9 @@ from collection_center.schema import Query as CollectionCenterQuery, Mutation as
 from plants.schema import Query as PlantsQuery, Mutation as PlantsMutation
 from milk.schema import Mutation as MilkSampleMutation, Query as MilkSampleQuery
 from accounts.schema import Query as AccountsQuery, Mutation as AccountsMutation
+from dairy_project.graphql_extensions.persisted_queries import PersistedQueries, document_cache_extensions
+from dairy_project.graphql_extensions.query_cost import QueryCostAnalyzer
+from dairy_project.graphql_extensions.query_optimizer import QuerySetOptimizer
 
 
 @strawberry.type
@@ -16,5 +19,10 @@ class Mutation(SupplierMutation, DistributionMutation, PlantsMutation, Collectio
     pass
 
 
-schema = strawberry.Schema(query=Query, mutation=Mutation)
+schema = strawberry.Schema(query=Query, mutation=Mutation, extensions=[
+    PersistedQueries,
+    *document_cache_extensions(),
+    QueryCostAnalyzer,
+    QuerySetOptimizer,
+])
 
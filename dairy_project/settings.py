@@ -10,8 +10,12 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 import environ
+import importlib.util
 import os
+import sys
+import tempfile
 from pathlib import Path
+from urllib.parse import urlsplit
 from dotenv import load_dotenv
 import dj_database_url
 
@@ -65,6 +69,7 @@ INSTALLED_APPS = [
     "channels",
     "notifications",
     "accounting",
+    "dairy_project",
 ]
 
 MIDDLEWARE = [
@@ -77,6 +82,7 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "accounts.middleware.PageVisitMiddleware",
+    "dairy_project.cache.RequestCacheMiddleware",
 ]
 
 # Conditional settings for django-browser-reload (development only)
@@ -115,6 +121,108 @@ ASGI_APPLICATION = "dairy_project.asgi.application"
 
 GRAPHQL_URL = "/graphql"
 
+# Static cost analysis of GraphQL operations (see dairy_project.graphql_extensions.query_cost).
+# THROTTLE_BUDGET is the total cost one client may spend per THROTTLE_WINDOW seconds; 0 disables it.
+GRAPHQL_QUERY_COST = {
+    "MAX_COST": env.int("GRAPHQL_MAX_QUERY_COST", default=5000),
+    "MAX_DEPTH": env.int("GRAPHQL_MAX_QUERY_DEPTH", default=10),
+    "DEFAULT_LIST_SIZE": 20,
+    "THROTTLE_BUDGET": env.int("GRAPHQL_COST_BUDGET", default=50000),
+    "THROTTLE_WINDOW": 60,
+}
+
+# Automatic persisted queries and the parsed/validated document LRU caches.
+# Registered documents expire REGISTRY_TIMEOUT seconds after registration; clients re-register them.
+# GET_MAX_AGE > 0 sends successful GET queries with a private Cache-Control of that many
+# seconds, so browsers may show results that old, even after the user's own mutations.
+GRAPHQL_PERSISTED_QUERIES = {
+    "DOCUMENT_CACHE_SIZE": 256,
+    "REGISTRY_TIMEOUT": env.int("GRAPHQL_APQ_TIMEOUT", default=7 * 24 * 3600),
+    "GET_MAX_AGE": env.int("GRAPHQL_GET_MAX_AGE", default=0),
+}
+
+# Bulk cooler controller telemetry (collection_center.telemetry): POST /bmcu/telemetry/
+# or ws/telemetry/coolers/. Ingestion is disabled until COOLER_TELEMETRY_TOKEN is set.
+# Raw logs are downsampled by `manage.py rollup_cooler_telemetry` (collection_center.rollups);
+# hourly buckets are kept indefinitely.
+COOLER_TELEMETRY = {
+    "INGEST_TOKEN": env("COOLER_TELEMETRY_TOKEN", default=""),
+    "BATCH_SIZE": env.int("COOLER_TELEMETRY_BATCH_SIZE", default=1000),
+    "WS_FLUSH_INTERVAL": 1.0,
+    "READING_INTERVAL_SECONDS": 30,
+    "RAW_RETENTION_DAYS": env.int("COOLER_TELEMETRY_RAW_RETENTION_DAYS", default=7),
+    "FIVE_MINUTE_RETENTION_DAYS": env.int("COOLER_TELEMETRY_5M_RETENTION_DAYS", default=90),
+    "ROLLUP_LOOKBACK_HOURS": 2,
+    "MAX_CHART_POINTS": 2000,
+}
+
+# Cold-chain breach rules (collection_center.cold_chain), evaluated on every cooler/tank reading.
+# Milk above MAX_TEMPERATURE for SUSTAINED_MINUTES, or at CRITICAL_TEMPERATURE at all, is a breach.
+COLD_CHAIN = {
+    "MAX_TEMPERATURE": env.float("COLD_CHAIN_MAX_TEMPERATURE", default=4.0),
+    "CRITICAL_TEMPERATURE": env.float("COLD_CHAIN_CRITICAL_TEMPERATURE", default=8.0),
+    "SUSTAINED_MINUTES": env.int("COLD_CHAIN_SUSTAINED_MINUTES", default=30),
+    "RECOVERY_HYSTERESIS": 0.5,
+}
+
+# Predicted vs. measured composition (milk.blending): a composite sample whose fat, SNF or
+# protein differs from its vessel's volume-weighted lot blend by more than this (percentage
+# points) is broadcast as an anomaly.
+QUALITY_BLEND = {
+    "FAT_TOLERANCE": env.float("QUALITY_BLEND_FAT_TOLERANCE", default=0.3),
+    "SNF_TOLERANCE": env.float("QUALITY_BLEND_SNF_TOLERANCE", default=0.4),
+    "PROTEIN_TOLERANCE": env.float("QUALITY_BLEND_PROTEIN_TOLERANCE", default=0.2),
+}
+
+# Offline collection route planning (`manage.py plan_collection_routes`, distribution.route_planning).
+# Savings candidates per supplier, and the capacity assumed on routes with no sized vehicle.
+ROUTE_PLANNING = {
+    "NEIGHBOURS": 25,
+    "DEFAULT_VEHICLE_CAPACITY": 5000.0,
+    "MAX_2OPT_PASSES": 50,
+}
+
+# Supply forecasts (suppliers.forecasting): Holt-Winters smoothing of daily delivered litres,
+# refreshed nightly by `manage.py refresh_supply_forecasts`.
+SUPPLY_FORECAST = {
+    "LEVEL_SMOOTHING": 0.3,
+    "TREND_SMOOTHING": 0.05,
+    "SEASONAL_SMOOTHING": 0.2,
+    "TREND_DAMPING": 0.9,
+}
+
+# Anomaly screening of incoming milk lots (suppliers.anomaly): lots scoring above THRESHOLD
+# (squared Mahalanobis distance, chi-square with 5 d.o.f.) against their supplier's or route's
+# profile are marked for retest. Profiles count once they have MIN_LOTS lots; DECAY weights new lots.
+QUALITY_SCREENING = {
+    "THRESHOLD": env.float("QUALITY_SCREENING_THRESHOLD", default=20.5),
+    "MIN_LOTS": 20,
+    "DECAY": 0.02,
+    "MIN_VARIANCE": 0.01,
+}
+
+# Pricing what-if simulation (milk.pricing, `pricingSimulation` query): width in currency units
+# of the price-per-litre histogram bins, and the decimal places added water is grouped by.
+PRICING_SIMULATION = {
+    "HISTOGRAM_BIN_WIDTH": 1.0,
+    "WATER_DECIMALS": 1,
+}
+
+# Streaming CSV / XLSX exports (accounting.exports, /accounting/exports/<dataset>.<csv|xlsx>):
+# rows read from the database and encoded per chunk.
+EXPORTS = {
+    "CHUNK_SIZE": 2000,
+}
+
+# Bulk CSV imports (suppliers.imports, manage.py import_csv, /imports/<kind>/):
+# rows validated and written per chunk; at most MAX_ERRORS row errors are reported.
+CSV_IMPORT = {
+    "CHUNK_SIZE": 2000,
+    "MAX_ERRORS": 500,
+    # Besides staff, employees with these roles may run these imports.
+    "ROLES": {"milk-lots": ["tester"], "lab-results": ["tester"]},
+}
+
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
@@ -122,6 +230,61 @@ DATABASES = {
     "default": env.db('DATABASE_URL', default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}")
 }
 
+# Connection management
+# https://docs.djangoproject.com/en/5.2/ref/databases/#persistent-connections
+# Persistent connections default to off (CONN_MAX_AGE=0). The Procfile runs
+# daphne, where sync code runs on executor threads that are not tied to a
+# request, so a connection kept past request_finished is never closed by
+# Django and leaks until the server drops it. Under daphne on PostgreSQL with
+# psycopg 3, each worker process instead keeps a psycopg_pool of
+# DB_POOL_MIN_SIZE..DB_POOL_MAX_SIZE connections (Django requires
+# CONN_MAX_AGE=0 with a pool; CONN_HEALTH_CHECKS then checks pooled connections
+# on checkout). Size the pool per worker: workers x max_size must stay below
+# the server's max_connections. Under a WSGI server (gunicorn
+# dairy_project.wsgi), whose threads serve one request at a time, set
+# DB_CONN_MAX_AGE (e.g. 60) to keep each thread's connection instead.
+# Compare the options with `python manage.py db_benchmark`.
+
+DATABASES["default"]["CONN_MAX_AGE"] = env.int("DB_CONN_MAX_AGE", default=0)
+DATABASES["default"]["CONN_HEALTH_CHECKS"] = env.bool("DB_CONN_HEALTH_CHECKS", default=True)
+
+if (
+    env.bool("DB_POOL", default=True)
+    and importlib.util.find_spec("psycopg_pool") is not None
+    and DATABASES["default"]["ENGINE"] == "django.db.backends.postgresql"
+):
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+    DATABASES["default"].setdefault("OPTIONS", {})["pool"] = {
+        "min_size": env.int("DB_POOL_MIN_SIZE", default=2),
+        "max_size": env.int("DB_POOL_MAX_SIZE", default=10),
+        "timeout": env.float("DB_POOL_TIMEOUT", default=10.0),
+        "max_idle": env.float("DB_POOL_MAX_IDLE", default=300.0),
+    }
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# CACHE_URL takes django-environ cache URLs (redis://, filecache://, locmemcache://).
+# Without it, REDIS_URL is shared with channels, else a file cache is used so
+# local workers still share one store. Tests always get an in-process LocMemCache.
+
+TESTING = len(sys.argv) > 1 and sys.argv[1] == "test"
+
+if TESTING:
+    _default_cache_url = "locmemcache://"
+elif os.getenv("REDIS_URL"):
+    # Database 1, whatever database REDIS_URL names for channels.
+    _default_cache_url = urlsplit(os.getenv("REDIS_URL"))._replace(path="/1").geturl()
+else:
+    _default_cache_url = f"filecache://{os.path.join(tempfile.gettempdir(), 'progodairy_cache')}"
+
+CACHES = {
+    "default": {
+        **env.cache("CACHE_URL", default=_default_cache_url),
+        "KEY_PREFIX": "progodairy",
+        "TIMEOUT": 300,
+    }
+}
+
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
@@ -131,6 +294,9 @@ CHANNEL_LAYERS = {
     },
 }
 
+if TESTING:
+    CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -0,0 +1,104 @@
+from decimal import Decimal
+
+from django.test import RequestFactory, SimpleTestCase, TestCase
+
+from distribution.models import Route
+from milk.pricing import config_cache
+from milk.pricing_history import record_version
+from suppliers.models import MilkLot
+from suppliers.tests import QUALITY, make_supplier
+
+from .cache import CacheNamespace, RequestCacheMiddleware, memoize, request_memoize
+
+
+class MemoizeTests(SimpleTestCase):
+    def setUp(self):
+        self.calls = []
+        namespace = CacheNamespace("test_memoize")
+        namespace.invalidate()
+
+        @memoize(namespace)
+        def square(value):
+            self.calls.append(value)
+            return value * value
+
+        self.square = square
+
+    def test_results_are_cached_per_argument(self):
+        self.assertEqual([self.square(3), self.square(3), self.square(4)], [9, 9, 16])
+        self.assertEqual(self.calls, [3, 4])
+
+    def test_invalidating_the_namespace_recomputes(self):
+        self.square(3)
+        self.square.namespace.invalidate()
+        self.square(3)
+        self.assertEqual(self.calls, [3, 3])
+
+
+class RequestMemoizeTests(SimpleTestCase):
+    def setUp(self):
+        self.calls = 0
+
+        @request_memoize
+        def lookup(value):
+            self.calls += 1
+            return value
+
+        self.lookup = lookup
+
+    def _request(self, *values):
+        def view(request):
+            return [self.lookup(value) for value in values]
+
+        return RequestCacheMiddleware(view)(RequestFactory().get("/"))
+
+    def test_cached_for_the_rest_of_the_request(self):
+        self.assertEqual(self._request(1, 1, 2, 1), [1, 1, 2, 1])
+        self.assertEqual(self.calls, 2)
+
+    def test_cleared_between_requests(self):
+        self._request(1)
+        self._request(1)
+        self.assertEqual(self.calls, 2)
+
+    def test_outside_a_request_it_calls_through(self):
+        self.lookup(1)
+        self.lookup(1)
+        self.assertEqual(self.calls, 2)
+
+    def test_unhashable_arguments_call_through(self):
+        self._request([1], [1])
+        self.assertEqual(self.calls, 2)
+
+
+class LotPricingLookupTests(TestCase):
+    def setUp(self):
+        config_cache.invalidate()
+        route = Route.objects.create(name="North")
+        self.route_id = route.pk
+        self.supplier = make_supplier("farmer", route)
+        record_version(route.pk, {})
+
+    def _price_lots(self, count):
+        def view(request):
+            for _ in range(count):
+                MilkLot(supplier_id=self.supplier.pk, volume_l=50.0, **QUALITY).evaluate_and_price()
+
+        RequestCacheMiddleware(view)(RequestFactory().post("/graphql/"))
+
+    def test_supplier_route_and_config_are_read_once(self):
+        # The supplier's route once per request; the config once, then from the shared cache.
+        with self.assertNumQueries(2):
+            self._price_lots(3)
+        with self.assertNumQueries(1):
+            self._price_lots(3)
+
+    def test_a_new_pricing_version_is_used_at_once(self):
+        lot = MilkLot(supplier_id=self.supplier.pk, volume_l=50.0, **QUALITY)
+        lot.evaluate_and_price()
+        before = lot.price_per_litre
+
+        record_version(self.route_id, {"base_price": Decimal("30.00")})
+        lot.evaluate_and_price()
+
+        self.assertEqual(lot.price_per_litre - before, Decimal("4.00"))
@@ -0,0 +1,33 @@
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from .db_benchmark import _percentile, run
+
+
+class DbBenchmarkTests(TestCase):
+    def test_percentiles_pick_the_nearest_sample(self):
+        samples = list(range(1, 101))
+
+        self.assertEqual([_percentile(samples, p) for p in (0, 50, 95, 100)], [1, 51, 95, 100])
+
+    def test_run_reports_every_request(self):
+        result = run(2, 10, "SELECT 1")
+
+        self.assertEqual((result["concurrency"], result["requests"]), (2, 10))
+        self.assertGreater(result["throughput"], 0)
+        self.assertLessEqual(result["p50"], result["p95"])
+        self.assertLessEqual(result["p95"], result["p99"])
+
+    def test_command_prints_one_row_per_concurrency_level(self):
+        out = StringIO()
+        call_command("db_benchmark", "--concurrency", "1", "2", "--requests", "4", stdout=out)
+
+        lines = out.getvalue().splitlines()
+        self.assertIn("CONN_MAX_AGE=0", lines[0])
+        self.assertEqual([line.split()[0] for line in lines[2:]], ["1", "2"])
+
+    def test_command_rejects_non_positive_counts(self):
+        with self.assertRaises(CommandError):
+            call_command("db_benchmark", "--requests", "0", stdout=StringIO())
@@ -0,0 +1,80 @@
+import json
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from plants.models import Plant
+
+from .graphql_extensions.persisted_queries import PERSISTED_QUERY_NOT_FOUND, query_hash, registry
+
+QUERY = "{ plants { name } }"
+
+
+class PersistedQueryTests(TestCase):
+    def setUp(self):
+        registry.documents.invalidate()
+        Plant.objects.create(name="Main", location="", capacity=50000)
+        self.client.force_login(User.objects.create_superuser("admin", "", "password"))
+
+    def _extensions(self, sha256_hash=None):
+        return {"persistedQuery": {"version": 1, "sha256Hash": sha256_hash or query_hash(QUERY)}}
+
+    def _post(self, query=None, sha256_hash=None):
+        payload = {"extensions": self._extensions(sha256_hash)}
+        if query:
+            payload["query"] = query
+        return self.client.post("/graphql/", json.dumps(payload), content_type="application/json").json()
+
+    def _get(self):
+        return self.client.get("/graphql/", {"extensions": json.dumps(self._extensions())})
+
+    def _error_code(self, body):
+        [error] = body["errors"]
+        return error["message"], error["extensions"]["code"]
+
+    def test_unknown_hash_is_registered_then_served_by_hash(self):
+        self.assertEqual(
+            self._error_code(self._post()),
+            (PERSISTED_QUERY_NOT_FOUND, "PERSISTED_QUERY_NOT_FOUND"),
+        )
+
+        registered = self._post(QUERY)
+        self.assertNotIn("errors", registered)
+        self.assertEqual(registry.get(query_hash(QUERY)), QUERY)
+
+        by_hash = self._post()
+        self.assertNotIn("errors", by_hash)
+        self.assertEqual(by_hash["data"], registered["data"])
+        self.assertEqual(by_hash["data"], {"plants": [{"name": "Main"}]})
+
+    def test_query_that_does_not_match_its_hash_is_rejected(self):
+        body = self._post(QUERY, sha256_hash=query_hash("{ __typename }"))
+
+        self.assertEqual(self._error_code(body)[1], "PERSISTED_QUERY_HASH_MISMATCH")
+        self.assertIsNone(registry.get(query_hash("{ __typename }")))
+
+    @override_settings(GRAPHQL_PERSISTED_QUERIES={"GET_MAX_AGE": 30})
+    def test_get_by_hash_is_privately_cacheable(self):
+        registry.register(QUERY)
+
+        response = self._get()
+
+        self.assertEqual(response.json()["data"], {"plants": [{"name": "Main"}]})
+        self.assertIn("private", response["Cache-Control"])
+        self.assertIn("max-age=30", response["Cache-Control"])
+
+    @override_settings(GRAPHQL_PERSISTED_QUERIES={"GET_MAX_AGE": 30})
+    def test_get_with_an_unknown_hash_is_never_cached(self):
+        response = self._get()
+
+        self.assertEqual(self._error_code(response.json())[1], "PERSISTED_QUERY_NOT_FOUND")
+        self.assertIn("no-store", response["Cache-Control"])
+        self.assertNotIn("max-age=30", response["Cache-Control"])
+
+    def test_get_is_never_cached_without_a_max_age(self):
+        registry.register(QUERY)
+
+        response = self._get()
+
+        self.assertNotIn("errors", response.json())
+        self.assertIn("no-store", response["Cache-Control"])
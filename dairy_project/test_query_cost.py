@@ -0,0 +1,83 @@
+import json
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from graphql import parse
+
+from plants.models import Plant
+
+from .graphql_extensions.query_cost import QueryCost, budget_cache
+from .schema import schema
+
+PLANTS = "{ plants { id name } }"
+EMPLOYEES = "{ employees { user { id groups } role { name } } }"
+
+
+class QueryCostTests(SimpleTestCase):
+    def _analyze(self, query):
+        return QueryCost(schema._schema, parse(query)).analyze()
+
+    def test_lists_multiply_the_cost_of_their_selections(self):
+        self.assertEqual(self._analyze(PLANTS).cost, 10)
+        self.assertEqual(self._analyze(EMPLOYEES).cost, 60)
+
+    def test_depth_counts_nested_selections(self):
+        self.assertEqual(self._analyze(PLANTS).depth, 2)
+        self.assertEqual(self._analyze(EMPLOYEES).depth, 3)
+
+    def test_introspection_of_the_type_name_is_free(self):
+        self.assertEqual(self._analyze("{ __typename }").cost, 0)
+
+
+class QueryCostAnalyzerTests(TestCase):
+    def setUp(self):
+        budget_cache.invalidate()
+        Plant.objects.create(name="Main", location="", capacity=50000)
+        self.user = User.objects.create_superuser("admin", "", "password")
+        self.client.force_login(self.user)
+
+    def _post(self, query):
+        return self.client.post("/graphql/", json.dumps({"query": query}), content_type="application/json").json()
+
+    def _data(self, body):
+        self.assertNotIn("errors", body)
+        return body["data"]
+
+    def _error(self, body):
+        self.assertIsNone(body.get("data"))
+        [error] = body["errors"]
+        return error["message"]
+
+    def test_cost_is_reported_with_the_result(self):
+        body = self._post(PLANTS)
+
+        self.assertEqual(self._data(body)["plants"][0]["name"], "Main")
+        self.assertEqual(body["extensions"]["cost"], {"requested": 10, "depth": 2, "maximum": 5000})
+
+    @override_settings(GRAPHQL_QUERY_COST={"MAX_COST": 50})
+    def test_query_over_the_maximum_cost_is_rejected(self):
+        self._data(self._post(PLANTS))
+        self.assertEqual(
+            self._error(self._post(EMPLOYEES)),
+            "Query cost 60 exceeds the maximum allowed cost of 50.",
+        )
+
+    @override_settings(GRAPHQL_QUERY_COST={"MAX_DEPTH": 2})
+    def test_query_over_the_maximum_depth_is_rejected(self):
+        self._data(self._post(PLANTS))
+        self.assertEqual(
+            self._error(self._post(EMPLOYEES)),
+            "Query depth 3 exceeds the maximum allowed depth of 2.",
+        )
+
+    @override_settings(GRAPHQL_QUERY_COST={"THROTTLE_BUDGET": 25, "THROTTLE_WINDOW": 60})
+    def test_budget_is_spent_per_client(self):
+        self._data(self._post(PLANTS))
+        self._data(self._post(PLANTS))
+        self.assertEqual(
+            self._error(self._post(PLANTS)),
+            "Query cost budget of 25 per 60s exhausted. Try again shortly.",
+        )
+
+        self.client.force_login(User.objects.create_superuser("manager", "", "password"))
+        self._data(self._post(PLANTS))
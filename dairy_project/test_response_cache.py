@@ -0,0 +1,58 @@
+import json
+
+from django.contrib.auth.models import User, update_last_login
+from django.test import TestCase
+
+from distribution.models import Distributor
+
+from .graphql_extensions.response_cache import field_cache, stats
+
+QUERY = "{ allDistributors { id user { username } } }"
+
+
+class CachedResolverTests(TestCase):
+    def setUp(self):
+        field_cache.invalidate()
+        self.user = User.objects.create_superuser("admin", "", "password")
+        self.distributor = Distributor.objects.create(user=User.objects.create_user("dairy"), address="")
+        self.client.force_login(self.user)
+
+    def _usernames(self):
+        response = self.client.post("/graphql/", json.dumps({"query": QUERY}), content_type="application/json")
+        return [row["user"]["username"] for row in response.json()["data"]["allDistributors"]]
+
+    def _counts(self):
+        [name] = [name for name in stats() if name.endswith(".all_distributors")]
+        return stats()[name]
+
+    def _misses_and_hits(self, action):
+        before = self._counts()
+        action()
+        after = self._counts()
+        return after["misses"] - before["misses"], after["hits"] - before["hits"]
+
+    def test_second_request_is_served_from_the_cache(self):
+        self.assertEqual(self._misses_and_hits(self._usernames), (1, 0))
+        self.assertEqual(self._misses_and_hits(self._usernames), (0, 1))
+
+    def test_signing_in_keeps_the_cache(self):
+        self._usernames()
+        update_last_login(None, self.distributor.user)
+
+        self.assertEqual(self._misses_and_hits(self._usernames), (0, 1))
+
+    def test_renaming_a_user_invalidates_it(self):
+        self._usernames()
+        user = self.distributor.user
+        user.username = "creamery"
+        user.save()
+
+        self.assertEqual(self._misses_and_hits(self._usernames), (1, 0))
+        self.assertEqual(self._usernames(), ["creamery"])
+
+    def test_saving_a_distributor_invalidates_it(self):
+        self._usernames()
+        self.distributor.license_number = "LIC-1"
+        self.distributor.save()
+
+        self.assertEqual(self._misses_and_hits(self._usernames), (1, 0))
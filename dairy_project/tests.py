@@ -0,0 +1,323 @@
+"""
+SQL query budgets for the frontend's GraphQL template queries.
+
+Each query below is copied from the template that sends it and posted to
+/graphql/ against fixtures with at least two rows behind every list it
+selects, so a list that starts costing a query per row goes over its
+budget. Session and user lookups are measured once per test with an empty
+``{ __typename }`` request and added to every budget.
+"""
+import json
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from collection_center.models import BulkCooler
+from dairy_project.graphql_extensions.response_cache import field_cache
+from distribution.models import CIPRecord, Distributor, GatePass, MilkTransfer, Route, Seal, Vehicle, VehicleDriver
+from milk.models import INSTANT_GATE_TESTS, SOCIETY_TEST, CompositeSample
+from plants.models import Employee, Plant, Role, Silo
+from suppliers.models import CanCollection, MilkLot, OnFarmTank, PaymentBill
+from suppliers.tests import make_lots, make_supplier
+
+
+class TemplateQueryBudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.user = User.objects.create(username="planner")
+        cls.route = Route.objects.create(name="North")
+        cls.plant = Plant.objects.create(name="Main", location="", capacity=50000)
+        cls.vehicle = Vehicle.objects.create(
+            distributor=Distributor.objects.create(address=""),
+            name="Tanker",
+            vehicle_id="KA-01-1234",
+            route=cls.route,
+        )
+
+        role = Role.objects.create(name="Tester")
+        for number in range(2):
+            Employee.objects.create(
+                user=User.objects.create(username=f"employee{number}"), employee_id=f"E{number}", role=role
+            )
+
+        suppliers = [make_supplier(f"farmer{number}", cls.route) for number in range(2)]
+        cls.supplier = suppliers[0]
+        coolers = [
+            BulkCooler.objects.create(route=cls.route, name=f"Cooler-{number}", capacity_liters=1000)
+            for number in range(2)
+        ]
+        tanks = [
+            OnFarmTank.objects.create(supplier=supplier, name=f"Tank-{number}", capacity_liters=500)
+            for number, supplier in enumerate(suppliers)
+        ]
+        cans = [CanCollection.objects.create(route=cls.route, name=f"Cans-{number}") for number in range(2)]
+
+        for supplier in suppliers:
+            make_lots(supplier, 2)
+        cls.bill = PaymentBill.objects.create(
+            supplier=cls.supplier, date=now.date(), total_volume_l=100.0, total_value=4000
+        )
+        MilkLot.objects.filter(supplier=cls.supplier).update(bill=cls.bill, status="approved")
+        PaymentBill.objects.create(supplier=suppliers[1], date=now.date(), total_volume_l=0.0, total_value=0)
+
+        for number in range(2):
+            VehicleDriver.objects.create(
+                name=f"Driver-{number}",
+                mobile=f"980000000{number}",
+                licence_no=f"DL-{number}",
+                licence_expiry=now.date(),
+                route=cls.route,
+            )
+            CIPRecord.objects.create(
+                vehicle=cls.vehicle,
+                certificate_no=f"CIP-{number}",
+                wash_type="Full-CIP",
+                started_at=now - timedelta(hours=2),
+                finished_at=now - timedelta(hours=1),
+                expiry_at=now + timedelta(hours=12),
+                operator_code="OP-1",
+            )
+
+        scheduled = [
+            MilkTransfer.objects.create(
+                vehicle=cls.vehicle, destination=cls.plant, bulk_cooler=coolers[0], total_volume=900
+            ),
+            MilkTransfer.objects.create(
+                vehicle=cls.vehicle, destination=cls.plant, on_farm_tank=tanks[0], total_volume=400
+            ),
+        ]
+        silos = [
+            Silo.objects.create(plant=cls.plant, name=f"Silo-{number}", code=f"S{number}", capacity_liters=20000)
+            for number in range(2)
+        ]
+        sources = [
+            {"bulk_cooler": coolers[1]},
+            {"on_farm_tank": tanks[1]},
+            {"can_collection": cans[0]},
+            {"can_collection": cans[1]},
+        ]
+        for silo, silo_sources in ((silos[0], sources[:2]), (silos[1], sources[2:])):
+            for source in silo_sources:
+                transfer = MilkTransfer.objects.create(
+                    vehicle=cls.vehicle,
+                    destination=cls.plant,
+                    silo=silo,
+                    status="completed",
+                    arrival_datetime=now,
+                    total_volume=300,
+                    **source,
+                )
+                CompositeSample.objects.create(
+                    vehicle=cls.vehicle, milk_transfer=transfer, sample_type=INSTANT_GATE_TESTS, passed="approved"
+                )
+        CompositeSample.objects.create(bulk_cooler=coolers[0], sample_type=SOCIETY_TEST)
+        CompositeSample.objects.create(on_farm_tank=tanks[0], sample_type=SOCIETY_TEST)
+
+        cls.gate_pass = GatePass.objects.create(
+            milk_transfer=scheduled[0],
+            empty_tare_kg=8000,
+            net_volume_l=900,
+            cip_record=CIPRecord.objects.first(),
+            expected_arrival_plant=now + timedelta(hours=3),
+            driver=VehicleDriver.objects.first(),
+            route=cls.route,
+        )
+        for number, position in enumerate(("top-man", "outlet")):
+            Seal.objects.create(gate_pass=cls.gate_pass, seal_no=f"SEAL-{number}", position=position)
+
+    def setUp(self):
+        field_cache.invalidate()
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as overhead:
+            self._post("{ __typename }")
+        self.overhead = len(overhead)
+
+    def _post(self, query, **variables):
+        response = self.client.post(
+            "/graphql/", json.dumps({"query": query, "variables": variables}), content_type="application/json"
+        )
+        return response.json()
+
+    def assertWithinBudget(self, budget, query, **variables):
+        with self.assertNumQueries(self.overhead + budget):
+            result = self._post(query, **variables)
+        self.assertIsNone(result.get("errors"))
+        return result["data"]
+
+    # accounts/rights_access.html
+    def test_employees(self):
+        data = self.assertWithinBudget(2, "{ employees { user { id username email } role { name } } }")
+        self.assertEqual(len(data["employees"]), 2)
+
+    # collection_center/assign_cooler_tank.html
+    def test_bulk_coolers_by_route(self):
+        data = self.assertWithinBudget(
+            1,
+            """query GetCoolers($routeId: Int!) { bulkCoolersByRoute(routeId: $routeId) {
+            id createdAt name capacityLiters currentVolumeLiters lastCleanedAt lastSanitizedAt
+            serviceIntervalDays lastServicedAt lastCalibrationDate route { name } } }""",
+            routeId=self.route.pk,
+        )
+        self.assertEqual(len(data["bulkCoolersByRoute"]), 2)
+
+    def test_pending_milk_lot_list(self):
+        data = self.assertWithinBudget(
+            1,
+            """query { pendingMilkLotList { id dateCreated supplier { user { username } } volumeL fatPercent
+            proteinPercent addedWaterPercent status bulkCooler { id name } onFarmTank { id name }
+            canCollection { id name } } }""",
+        )
+        self.assertEqual(len(data["pendingMilkLotList"]), 2)
+
+    # distribution/gate_pass.html
+    def test_all_drivers(self):
+        data = self.assertWithinBudget(
+            1,
+            "query($routeId: Int) { allDrivers(routeId: $routeId) { id name mobile licenceNo } }",
+            routeId=self.route.pk,
+        )
+        self.assertEqual(len(data["allDrivers"]), 2)
+
+    # distribution/gate_pass_tickets.html. The template also selects
+    # relatedCompositeSamples, which runs its own query per transfer by design
+    # (see FIELD_COSTS); it is left out here.
+    def test_get_milk_transfers_for_pass(self):
+        data = self.assertWithinBudget(
+            2,
+            """query GetTransfers($plantId: Int!, $vehicleNumber: String!, $status: String) {
+            getMilkTransfersForPass(plantId: $plantId, vehicleNumber: $vehicleNumber, status: $status) {
+            id status transferDate totalVolume remarks arrivalDatetime vehicle { vehicleId name capacityLiters }
+            destination { name } gatePass { id } } }""",
+            plantId=self.plant.pk,
+            vehicleNumber=str(self.vehicle.pk),
+            status=None,
+        )
+        self.assertEqual(len(data["getMilkTransfersForPass"]), 6)
+
+    # distribution/gate_pass_view.html
+    def test_gate_pass_by_id(self):
+        data = self.assertWithinBudget(
+            2,
+            """query GetGatePass($id: Int!) { gatePassById(id: $id) { id gatePassStatus emptyTareKg netVolumeL
+            densityKgPerL issuedAt driver { id name } route { id name } seals { sealNo position } } }""",
+            id=self.gate_pass.pk,
+        )
+        self.assertEqual(len(data["gatePassById"]["seals"]), 2)
+
+    # distribution/milk_transfer.html
+    def test_onfarm_tanks_by_route(self):
+        data = self.assertWithinBudget(
+            1,
+            """query OnFarmTanks($routeId: Int!) { onfarmTanksByRoute(routeId: $routeId) {
+            id name currentVolumeLiters supplier { user { username } } createdAt } }""",
+            routeId=self.route.pk,
+        )
+        self.assertEqual(len(data["onfarmTanksByRoute"]), 2)
+
+    def test_can_collections_by_date(self):
+        data = self.assertWithinBudget(
+            2,
+            """query CanCollections($routeId: Int!, $createdDate: Date!) {
+            canCollectionsByDate(routeId: $routeId, createdDate: $createdDate) { id name totalVolumeLiters createdAt } }""",
+            routeId=self.route.pk,
+            createdDate=timezone.localdate().isoformat(),
+        )
+        self.assertEqual(len(data["canCollectionsByDate"]), 2)
+
+    def test_milk_transfers(self):
+        data = self.assertWithinBudget(
+            1,
+            """query { milkTransfers(status: "scheduled") { id status transferDate arrivalDatetime totalVolume
+            vehicle { id name vehicleId route { name } } destination { id name } bulkCooler { name createdAt }
+            onFarmTank { createdAt supplier { user { username } } } canCollection { id } } }""",
+        )
+        self.assertEqual(len(data["milkTransfers"]), 2)
+
+    # distribution/vehicle_CIP_log.html
+    def test_cip_records_by_vehicle(self):
+        data = self.assertWithinBudget(
+            1,
+            """query ($vehicleId: Int!) { cipRecordsByVehicle(vehicleId: $vehicleId) { id certificateNo washType
+            startedAt finishedAt expiryAt finalRinseCondMs passed vehicle { id name vehicleId } } }""",
+            vehicleId=self.vehicle.pk,
+        )
+        self.assertEqual(len(data["cipRecordsByVehicle"]), 2)
+
+    # milk/list_composite_samples.html
+    def test_composite_samples(self):
+        data = self.assertWithinBudget(
+            1,
+            """query GetCompositeSamples { compositeSamples { id collectedAt sampleVolumeMl sampleType
+            bulkCooler { id name } onFarmTank { id name supplier { user { username } } }
+            vehicle { vehicleId name capacityLiters } remark receivedAtLab fatPercent snfPercent proteinPercent
+            bacterialCount antibioticResidue addedWaterPercent passed } }""",
+        )
+        self.assertEqual(len(data["compositeSamples"]), 6)
+
+    # plants/pump_into_silos.html
+    def test_get_approved_instant_gate_transfers_by_plant(self):
+        data = self.assertWithinBudget(
+            1,
+            """query($plantId: Int!) { getApprovedInstantGateTransfersByPlant(plantId: $plantId) {
+            id sourceType arrivalDatetime vehicle { id name } canCollection { id name } bulkCooler { id name }
+            onFarmTank { id name } } }""",
+            plantId=self.plant.pk,
+        )
+        self.assertEqual(len(data["getApprovedInstantGateTransfersByPlant"]), 4)
+
+    def test_silos_by_plant(self):
+        data = self.assertWithinBudget(
+            2,
+            """query GetSilos($plantId: Int!) { silosByPlant(plantId: $plantId) {
+            id name code createdAt currentVolume capacityLiters status completedTransfers { id arrivalDatetime } } }""",
+            plantId=self.plant.pk,
+        )
+        self.assertEqual([len(silo["completedTransfers"]) for silo in data["silosByPlant"]], [2, 2])
+
+    # suppliers/bill_details.html
+    def test_milk_lots_by_bill(self):
+        data = self.assertWithinBudget(
+            1,
+            """query MilkLotsByBill($billId: Int!) { milkLotsByBill(billId: $billId) { id supplier { user { username } }
+            tester { user { username } } volumeL fatPercent proteinPercent lactosePercent totalSolids snf
+            ureaNitrogen bacterialCount addedWaterPercent pricePerLitre totalPrice dateCreated } }""",
+            billId=self.bill.pk,
+        )
+        self.assertEqual(len(data["milkLotsByBill"]), 2)
+
+    # suppliers/milk_lot_list.html
+    def test_milk_lot_list(self):
+        data = self.assertWithinBudget(
+            2,
+            """query GetMilkLots($page: Int!, $perPage: Int!) { milkLotList(pagination: { page: $page, perPage: $perPage }) {
+            items { id volumeL fatPercent proteinPercent bacterialCount status totalPrice dateCreated
+            supplier { id email } } totalItems totalPages currentPage perPage } }""",
+            page=1,
+            perPage=20,
+        )
+        self.assertEqual(len(data["milkLotList"]["items"]), 4)
+
+    # suppliers/on_farm_bulk_pooling.html
+    def test_on_farm_tanks_by_supplier(self):
+        data = self.assertWithinBudget(
+            1,
+            """query ($supplierId: Int!) { onFarmTanksBySupplier(supplierId: $supplierId) { id name capacityLiters
+            currentVolumeLiters supplier { id user { username } } temperatureCelsius lastCleanedAt
+            lastSanitizedAt lastCalibrationDate serviceIntervalDays lastServicedAt } }""",
+            supplierId=self.supplier.pk,
+        )
+        self.assertEqual(len(data["onFarmTanksBySupplier"]), 1)
+
+    # suppliers/payment_bill_list.html
+    def test_all_payment_bills(self):
+        data = self.assertWithinBudget(
+            1,
+            """query { allPaymentBills { id date paymentDate totalVolumeL totalValue isPaid pdfUrl
+            supplier { id user { username } } } }""",
+        )
+        self.assertEqual(len(data["allPaymentBills"]), 2)
@@ -1,13 +1,12 @@
 from django.urls import path, include
 from django.contrib import admin
 from django.conf import settings
-from strawberry.django.views import GraphQLView
 from .schema import schema
-from .views import homepage_view, milk_market_dashboard
+from .views import CachedGraphQLView, homepage_view, milk_market_dashboard
 
 urlpatterns = [
     path("admin/", admin.site.urls),
-    path("graphql/", GraphQLView.as_view(schema=schema)),
+    path("graphql/", CachedGraphQLView.as_view(schema=schema)),
     path("", include("suppliers.urls")),
     path("distribution/", include("distribution.urls")),
     path("bmcu/", include("collection_center.urls")),
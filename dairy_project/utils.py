@@ -1,10 +1,12 @@
 import os
 from dotenv import load_dotenv
 import requests
-from django.core.cache import cache
+from dairy_project.cache import CacheNamespace
 
 load_dotenv()
 
+scrape_cache = CacheNamespace("firecrawl", timeout=3)
+
 FIRECRAWL_API_KEY = os.getenv("FIRECRAWL_API_KEY")
 
 def fetch_milk_prices():
@@ -16,8 +18,7 @@ def fetch_dairy_news():
     return _scrape_with_firecrawl(url)
 
 def _scrape_with_firecrawl(target_url):
-    cache_key = f"firecrawl_{hash(target_url)}"
-    cached_data = cache.get(cache_key)
+    cached_data = scrape_cache.get(target_url)
     
     if cached_data:
         print("======="*34)
@@ -39,7 +40,7 @@ def _scrape_with_firecrawl(target_url):
         response.raise_for_status()
         data = response.json()
         scraped_content = data.get("data", {}).get("markdown", "")
-        cache.set(cache_key, {"success": True, "content": scraped_content}, timeout=3)  
+        scrape_cache.set(target_url, {"success": True, "content": scraped_content})
         return {"success": True, "content": scraped_content}
     except Exception as e:
         return {"success": False, "error": str(e)}
\ No newline at end of file
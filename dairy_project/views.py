@@ -1,4 +1,8 @@
 from django.shortcuts import render
+from django.utils.cache import add_never_cache_headers, patch_cache_control, patch_vary_headers
+from strawberry.django.views import GraphQLView
+from .conf import AppSettings
+from .graphql_extensions import persisted_queries
 from .utils import fetch_milk_prices, fetch_dairy_news
 from .parsers import parse_prices_from_markdown, parse_news_from_markdown
 from datetime import datetime
@@ -34,3 +38,27 @@ def homepage_view(request):
     return render(request, "homePage.html")
 
 
+_persisted_query_setting = AppSettings("GRAPHQL_PERSISTED_QUERIES", persisted_queries.DEFAULTS)
+
+
+class CachedGraphQLView(GraphQLView):
+    """
+    GraphQL endpoint whose error-free GET responses carry a private
+    Cache-Control when GET_MAX_AGE is set, so persisted queries sent by hash can
+    be reused by the browser. Otherwise GET responses are marked never-cache.
+    """
+
+    def process_result(self, request, result):
+        response_data = super().process_result(request, result)
+        request._graphql_cacheable = request.method == "GET" and not response_data.get("errors")
+        return response_data
+
+    def dispatch(self, request, *args, **kwargs):
+        response = super().dispatch(request, *args, **kwargs)
+        max_age = _persisted_query_setting("GET_MAX_AGE")
+        if getattr(request, "_graphql_cacheable", False) and max_age:
+            patch_cache_control(response, private=True, max_age=max_age)
+            patch_vary_headers(response, ("Cookie", "Authorization"))
+        elif request.method == "GET":
+            add_never_cache_headers(response)
+        return response
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Route, Distributor, MilkTransfer, Vehicle, GatePass, GatePassQC, Seal
+from .models import Route, Distributor, MilkTransfer, Vehicle, GatePass, GatePassQC, Seal, RoutePlan
 
 # Register your models here.
 admin.site.register(Route)
@@ -8,4 +8,5 @@ admin.site.register(MilkTransfer)
 admin.site.register(Vehicle)
 admin.site.register(GatePass)
 admin.site.register(GatePassQC)
-admin.site.register(Seal)
\ No newline at end of file
+admin.site.register(Seal)
+admin.site.register(RoutePlan)
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from distribution.models import Route
+from distribution.route_planning import plan_route, save_plan
+
+
+class Command(BaseCommand):
+    help = (
+        "Propose pickup trips and vehicles for collection routes and save them as route plans "
+        "for dispatchers. Routes are not changed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--route", type=int, nargs="+", help="Route ids to plan (default: every route).")
+        parser.add_argument("--plant", type=int, help="Only the routes of this plant.")
+        parser.add_argument("--dry-run", action="store_true", help="Print the plans without saving them.")
+
+    def handle(self, *args, **options):
+        routes = Route.objects.select_related("plant").order_by("name")
+        if options["route"]:
+            routes = routes.filter(pk__in=options["route"])
+        if options["plant"]:
+            routes = routes.filter(plant_id=options["plant"])
+        if not routes.exists():
+            raise CommandError("No matching routes.")
+
+        for route in routes:
+            plan = plan_route(route)
+            if not plan.trips:
+                self.stdout.write(f"{route.name}: no suppliers.")
+                continue
+            over = sum(trip.over_capacity for trip in plan.trips)
+            unassigned = sum(trip.vehicle_id is None for trip in plan.trips)
+            summary = (
+                f"{route.name}: {plan.supplier_count} suppliers, {len(plan.trips)} trips, "
+                f"{plan.total_distance_km:.1f} km (vs {plan.baseline_distance_km:.1f} km one by one, "
+                f"{plan.metric} distances) in {plan.solve_seconds:.2f}s"
+            )
+            if over or unassigned:
+                summary += f"; {over} over capacity, {unassigned} without a vehicle"
+            if not options["dry_run"]:
+                summary += f"; saved as plan {save_plan(plan).pk}"
+            self.stdout.write(summary + ".")
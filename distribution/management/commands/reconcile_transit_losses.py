@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from distribution.models import MilkTransfer
+from distribution.reconciliation import reconcile
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the transit loss summary of completed milk transfers. Completing a transfer "
+        "keeps it current; run this once to backfill, or after correcting weights in the admin."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", help="ISO date; only transfers that left on or after it (default: all).")
+
+    def handle(self, *args, **options):
+        transfers = MilkTransfer.objects.all()
+        if options["since"]:
+            since = parse_date(options["since"])
+            if since is None:
+                raise CommandError(f"Invalid --since date: {options['since']}")
+            transfers = transfers.filter(transfer_date__date__gte=since)
+
+        count = reconcile(transfers)
+        self.stdout.write(f"Reconciled {count} completed transfers.")
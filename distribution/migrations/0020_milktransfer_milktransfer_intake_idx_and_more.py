@@ -0,0 +1,24 @@
+# Generated by Django 5.2.4 on 2026-10-19 16:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collection_center', '0009_bulkcoolerlogrollup'),
+        ('distribution', '0019_vehicledriver_route'),
+        ('plants', '0010_silo_collection_day_silo_silo_plant_day_idx'),
+        ('suppliers', '0018_milklot_needs_retest_milklot_retest_reason'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='milktransfer',
+            index=models.Index(fields=['destination', 'status', 'arrival_datetime'], name='milktransfer_intake_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='milktransfer',
+            index=models.Index(fields=['vehicle', 'arrival_datetime'], name='milktransfer_vehicle_arr_idx'),
+        ),
+    ]
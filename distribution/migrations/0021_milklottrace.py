@@ -0,0 +1,81 @@
+# Generated by Django 5.2.4 on 2026-10-19 16:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+VESSEL_TYPES = ("bulk_cooler", "on_farm_tank", "can_collection")
+
+
+def backfill_traces(apps, schema_editor):
+    # Same rows distribution.traceability maintains from here on: every lot
+    # under its vessel, then under each transfer out of that vessel, the
+    # transfer's gate passes and the silo it was pumped into.
+    MilkLot = apps.get_model("suppliers", "MilkLot")
+    MilkLotTrace = apps.get_model("distribution", "MilkLotTrace")
+    MilkTransfer = apps.get_model("distribution", "MilkTransfer")
+    GatePass = apps.get_model("distribution", "GatePass")
+
+    lots_by_vessel = {}
+    lots = MilkLot.objects.values_list("id", "supplier_id", "date_created", "volume_l", *(f"{v}_id" for v in VESSEL_TYPES))
+    for lot_id, supplier_id, lot_date, volume_l, *vessel_ids in lots.iterator():
+        for vessel_type, vessel_id in zip(VESSEL_TYPES, vessel_ids):
+            if vessel_id:
+                lots_by_vessel.setdefault((vessel_type, vessel_id), []).append((lot_id, supplier_id, lot_date, volume_l))
+
+    gate_passes = {}
+    for gate_pass_id, transfer_id in GatePass.objects.values_list("id", "milk_transfer_id"):
+        gate_passes.setdefault(transfer_id, []).append(gate_pass_id)
+
+    def rows(node_type, node_id, lots, milk_transfer_id=None):
+        return [
+            MilkLotTrace(
+                node_type=node_type, node_id=node_id, milk_lot_id=lot_id, supplier_id=supplier_id,
+                lot_date=lot_date, volume_l=volume_l, milk_transfer_id=milk_transfer_id,
+            )
+            for lot_id, supplier_id, lot_date, volume_l in lots
+        ]
+
+    traces = []
+    for (vessel_type, vessel_id), lots in lots_by_vessel.items():
+        traces += rows(vessel_type, vessel_id, lots)
+    transfers = MilkTransfer.objects.values_list("id", "silo_id", *(f"{v}_id" for v in VESSEL_TYPES))
+    for transfer_id, silo_id, *vessel_ids in transfers.iterator():
+        source = next(((v, pk) for v, pk in zip(VESSEL_TYPES, vessel_ids) if pk), None)
+        lots = lots_by_vessel.get(source)
+        if not lots:
+            continue
+        nodes = [("milk_transfer", transfer_id)] + [("gate_pass", pk) for pk in gate_passes.get(transfer_id, [])]
+        if silo_id:
+            nodes.append(("silo", silo_id))
+        for node_type, node_id in nodes:
+            traces += rows(node_type, node_id, lots, transfer_id)
+    MilkLotTrace.objects.bulk_create(traces, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('distribution', '0020_milktransfer_milktransfer_intake_idx_and_more'),
+        ('suppliers', '0018_milklot_needs_retest_milklot_retest_reason'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MilkLotTrace',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('node_type', models.CharField(choices=[('bulk_cooler', 'Bulk Cooler'), ('on_farm_tank', 'On-Farm Tank'), ('can_collection', 'Can Collection'), ('milk_transfer', 'Milk Transfer'), ('gate_pass', 'Gate Pass'), ('silo', 'Silo')], max_length=20)),
+                ('node_id', models.PositiveIntegerField()),
+                ('lot_date', models.DateField(help_text='Collection date of the lot, for season-wide recalls.')),
+                ('volume_l', models.FloatField()),
+                ('milk_lot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='traces', to='suppliers.milklot')),
+                ('milk_transfer', models.ForeignKey(blank=True, help_text='Transfer that carried the lot to this node; empty for collection vessels.', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='lot_traces', to='distribution.milktransfer')),
+                ('supplier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='traces', to='suppliers.supplier')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['supplier', 'node_type', 'lot_date'], name='milklottrace_supplier_idx')],
+                'constraints': [models.UniqueConstraint(fields=('node_type', 'node_id', 'milk_lot'), name='milklottrace_node_lot_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_traces, migrations.RunPython.noop),
+    ]
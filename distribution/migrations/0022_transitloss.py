@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('distribution', '0021_milklottrace'),
+        ('plants', '0010_silo_collection_day_silo_silo_plant_day_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransitLoss',
+            fields=[
+                ('milk_transfer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='transit_loss', serialize=False, to='distribution.milktransfer')),
+                ('arrival_date', models.DateField()),
+                ('departure_weight_kg', models.FloatField(blank=True, null=True)),
+                ('arrival_weight_kg', models.FloatField(blank=True, null=True)),
+                ('weight_loss_kg', models.FloatField(blank=True, null=True)),
+                ('density_kg_per_l', models.FloatField()),
+                ('dispatched_volume_l', models.FloatField(blank=True, null=True)),
+                ('arrival_volume_l', models.FloatField(blank=True, null=True)),
+                ('volume_loss_l', models.FloatField(blank=True, null=True)),
+                ('loss_percent', models.FloatField(blank=True, null=True)),
+                ('destination', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='plants.plant')),
+                ('driver', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='distribution.vehicledriver')),
+                ('gate_pass', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='distribution.gatepass')),
+                ('route', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='distribution.route')),
+                ('vehicle', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='distribution.vehicle')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['arrival_date'], name='transitloss_date_idx'), models.Index(fields=['route', 'arrival_date'], name='transitloss_route_idx'), models.Index(fields=['driver', 'arrival_date'], name='transitloss_driver_idx'), models.Index(fields=['vehicle', 'arrival_date'], name='transitloss_vehicle_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('distribution', '0022_transitloss'),
+        ('suppliers', '0019_supplier_latitude_supplier_longitude'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoutePlan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('supplier_count', models.PositiveIntegerField(default=0)),
+                ('total_volume_l', models.FloatField(default=0.0)),
+                ('total_distance_km', models.FloatField(default=0.0)),
+                ('baseline_distance_km', models.FloatField(default=0.0, help_text='Distance of one out-and-back trip per supplier, for comparison.')),
+                ('solve_seconds', models.FloatField(default=0.0)),
+                ('remarks', models.TextField(blank=True, null=True)),
+                ('route', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='plans', to='distribution.route')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RoutePlanTrip',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField(help_text='Order of the trip within the plan.')),
+                ('load_l', models.FloatField()),
+                ('distance_km', models.FloatField()),
+                ('over_capacity', models.BooleanField(default=False, help_text="A single supplier's daily volume exceeds every vehicle on the route.")),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trips', to='distribution.routeplan')),
+                ('vehicle', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='distribution.vehicle')),
+            ],
+            options={
+                'ordering': ['plan', 'number'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RoutePlanStop',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField()),
+                ('leg_km', models.FloatField(help_text='Distance from the previous stop (the plant for the first).')),
+                ('supplier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='suppliers.supplier')),
+                ('trip', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stops', to='distribution.routeplantrip')),
+            ],
+            options={
+                'ordering': ['trip', 'position'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='routeplan',
+            index=models.Index(fields=['route', '-created_at'], name='routeplan_route_idx'),
+        ),
+    ]
@@ -1,12 +1,17 @@
+from datetime import timedelta
+
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.db.models import Q
-from milk.models import CompositeSample
+from milk.models import INSTANT_GATE_TESTS, SOCIETY_TEST, CompositeSample
 from django.core.validators import RegexValidator
 from django.utils import timezone
 
 
+# An instant-gate sample drawn within this long after a tanker arrives belongs to that trip.
+GATE_SAMPLE_WINDOW = timedelta(hours=2)
+
 validate_mobile = RegexValidator(
     regex=r'^[0-9]{10,17}$',
     message="Enter a valid mobile number."
@@ -215,11 +220,50 @@ class MilkTransfer(models.Model):
             super().save(update_fields=['total_volume'])
         return self.total_volume
 
+    @classmethod
+    def for_gate_sample(cls, vehicle_id, collected_at):
+        """The vehicle's trip that arrived within GATE_SAMPLE_WINDOW before ``collected_at``, if any."""
+        return (
+            cls.objects.filter(
+                vehicle_id=vehicle_id,
+                arrival_datetime__lte=collected_at,
+                arrival_datetime__gte=collected_at - GATE_SAMPLE_WINDOW,
+            )
+            .order_by('-arrival_datetime')
+            .first()
+        )
+
+    def link_gate_samples(self):
+        """
+        Attach the tanker's unlinked instant-gate samples drawn within
+        GATE_SAMPLE_WINDOW of this arrival, for samples taken before the
+        arrival was recorded. Returns the number of samples linked.
+        """
+        if not (self.vehicle_id and self.arrival_datetime):
+            return 0
+        return CompositeSample.objects.filter(
+            vehicle_id=self.vehicle_id,
+            sample_type=INSTANT_GATE_TESTS,
+            collected_at__gte=self.arrival_datetime,
+            collected_at__lte=self.arrival_datetime + GATE_SAMPLE_WINDOW,
+            milk_transfer__isnull=True,
+        ).update(milk_transfer=self)
+
     def __str__(self):
         source = self.bulk_cooler or self.on_farm_tank or self.can_collection or "Unknown Source"
         return f"Transfer {self.id} {source.name} → {self.transfer_date}"
     
     class Meta:
+        indexes = [
+            models.Index(
+                fields=['destination', 'status', 'arrival_datetime'],
+                name='milktransfer_intake_idx',
+            ),
+            models.Index(
+                fields=['vehicle', 'arrival_datetime'],
+                name='milktransfer_vehicle_arr_idx',
+            ),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['on_farm_tank'],
@@ -356,23 +400,33 @@ class GatePass(models.Model):
         return [s.seal_no for s in self.seals.all()]
     
     def link_samples(self):
+        """
+        Attach the transfer's QC samples: those taken from its bulk cooler or
+        on-farm tank, and the instant-gate samples linked to this trip
+        (CompositeSample.milk_transfer), not the tanker's samples from other
+        trips. One SELECT plus one INSERT, however many samples there are;
+        samples already linked are skipped by the unique constraint.
+        """
         transfer = self.milk_transfer
         source_q = Q()
-        if transfer.bulk_cooler:
-            source_q |= Q(bulk_cooler=transfer.bulk_cooler)
-        if transfer.on_farm_tank:
-            source_q |= Q(on_farm_tank=transfer.on_farm_tank)
-        if transfer.can_collection:
-            source_q |= Q(can_collection=transfer.can_collection)
-
-        samples = CompositeSample.objects.filter(source_q)
-
-        for s in samples:
-            GatePassQC.objects.get_or_create(
-                gate_pass=self,
-                composite_sample=s,
-                defaults={"is_primary": s.sample_type == "society test"}
-            )
+        if transfer.bulk_cooler_id:
+            source_q |= Q(bulk_cooler_id=transfer.bulk_cooler_id)
+        if transfer.on_farm_tank_id:
+            source_q |= Q(on_farm_tank_id=transfer.on_farm_tank_id)
+        source_q |= Q(milk_transfer_id=transfer.pk)
+
+        samples = CompositeSample.objects.filter(source_q).values_list("id", "sample_type")
+        GatePassQC.objects.bulk_create(
+            [
+                GatePassQC(
+                    gate_pass=self,
+                    composite_sample_id=sample_id,
+                    is_primary=sample_type == SOCIETY_TEST,
+                )
+                for sample_id, sample_type in samples
+            ],
+            ignore_conflicts=True,
+        )
         
     def clean(self):
         super().clean()
@@ -440,4 +494,150 @@ class GatePassQC(models.Model):
     )
 
     class Meta:
-        unique_together = [('gate_pass', 'composite_sample')]
\ No newline at end of file
+        unique_together = [('gate_pass', 'composite_sample')]
+
+class MilkLotTrace(models.Model):
+    """
+    Traceability index: one row per (node, contributing milk lot), where a node
+    is a collection vessel, a transfer, a gate pass or a silo. Maintained by
+    distribution.traceability as lots are assigned and transfers move, so a
+    trace in either direction is a single indexed lookup instead of a walk
+    through the foreign keys.
+    """
+
+    NODE_TYPES = [
+        ('bulk_cooler', 'Bulk Cooler'),
+        ('on_farm_tank', 'On-Farm Tank'),
+        ('can_collection', 'Can Collection'),
+        ('milk_transfer', 'Milk Transfer'),
+        ('gate_pass', 'Gate Pass'),
+        ('silo', 'Silo'),
+    ]
+
+    node_type = models.CharField(max_length=20, choices=NODE_TYPES)
+    node_id = models.PositiveIntegerField()
+    milk_lot = models.ForeignKey('suppliers.MilkLot', on_delete=models.CASCADE, related_name='traces')
+    supplier = models.ForeignKey('suppliers.Supplier', on_delete=models.CASCADE, related_name='traces')
+    lot_date = models.DateField(help_text="Collection date of the lot, for season-wide recalls.")
+    volume_l = models.FloatField()
+    milk_transfer = models.ForeignKey(
+        MilkTransfer,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='lot_traces',
+        help_text="Transfer that carried the lot to this node; empty for collection vessels.",
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['node_type', 'node_id', 'milk_lot'],
+                name='milklottrace_node_lot_uniq',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['supplier', 'node_type', 'lot_date'], name='milklottrace_supplier_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.node_type} {self.node_id} ← lot {self.milk_lot_id} ({self.volume_l} L)"
+
+
+class TransitLoss(models.Model):
+    """
+    Reconciled shrinkage of one completed transfer: departure vs. arrival
+    weight, and the dispatched volume (gate pass net litres, else the
+    transfer's total volume) vs. the arrival weight at the pass's density.
+    Route, driver and vehicle are copied in so loss reports group one table.
+    Rebuilt by distribution.reconciliation.
+    """
+
+    milk_transfer = models.OneToOneField(
+        MilkTransfer, on_delete=models.CASCADE, primary_key=True, related_name='transit_loss'
+    )
+    gate_pass = models.ForeignKey(GatePass, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    route = models.ForeignKey(Route, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    driver = models.ForeignKey(VehicleDriver, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    vehicle = models.ForeignKey(Vehicle, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    destination = models.ForeignKey(
+        'plants.Plant', on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    arrival_date = models.DateField()
+
+    departure_weight_kg = models.FloatField(null=True, blank=True)
+    arrival_weight_kg = models.FloatField(null=True, blank=True)
+    weight_loss_kg = models.FloatField(null=True, blank=True)
+    density_kg_per_l = models.FloatField()
+    dispatched_volume_l = models.FloatField(null=True, blank=True)
+    arrival_volume_l = models.FloatField(null=True, blank=True)
+    volume_loss_l = models.FloatField(null=True, blank=True)
+    loss_percent = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['arrival_date'], name='transitloss_date_idx'),
+            models.Index(fields=['route', 'arrival_date'], name='transitloss_route_idx'),
+            models.Index(fields=['driver', 'arrival_date'], name='transitloss_driver_idx'),
+            models.Index(fields=['vehicle', 'arrival_date'], name='transitloss_vehicle_idx'),
+        ]
+
+    def __str__(self):
+        return f"Transfer {self.milk_transfer_id} loss {self.weight_loss_kg} kg ({self.loss_percent}%)"
+
+
+class RoutePlan(models.Model):
+    """
+    A proposed set of pickup trips for one route, produced offline by
+    distribution.route_planning for dispatchers to review. Plans are only
+    proposals; nothing is reassigned until a dispatcher acts on one.
+    """
+
+    route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name='plans')
+    created_at = models.DateTimeField(auto_now_add=True)
+    supplier_count = models.PositiveIntegerField(default=0)
+    total_volume_l = models.FloatField(default=0.0)
+    total_distance_km = models.FloatField(default=0.0)
+    baseline_distance_km = models.FloatField(
+        default=0.0, help_text="Distance of one out-and-back trip per supplier, for comparison."
+    )
+    solve_seconds = models.FloatField(default=0.0)
+    remarks = models.TextField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['route', '-created_at'], name='routeplan_route_idx'),
+        ]
+
+    def __str__(self):
+        return f"Plan {self.id} for {self.route} ({self.total_distance_km:.1f} km)"
+
+
+class RoutePlanTrip(models.Model):
+    plan = models.ForeignKey(RoutePlan, on_delete=models.CASCADE, related_name='trips')
+    number = models.PositiveIntegerField(help_text="Order of the trip within the plan.")
+    vehicle = models.ForeignKey(Vehicle, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    load_l = models.FloatField()
+    distance_km = models.FloatField()
+    over_capacity = models.BooleanField(
+        default=False, help_text="A single supplier's daily volume exceeds every vehicle on the route."
+    )
+
+    class Meta:
+        ordering = ['plan', 'number']
+
+    def __str__(self):
+        return f"Trip {self.number} of plan {self.plan_id}"
+
+
+class RoutePlanStop(models.Model):
+    trip = models.ForeignKey(RoutePlanTrip, on_delete=models.CASCADE, related_name='stops')
+    position = models.PositiveIntegerField()
+    supplier = models.ForeignKey('suppliers.Supplier', on_delete=models.CASCADE, related_name='+')
+    leg_km = models.FloatField(help_text="Distance from the previous stop (the plant for the first).")
+
+    class Meta:
+        ordering = ['trip', 'position']
+
+    def __str__(self):
+        return f"Stop {self.position} of trip {self.trip_id}"
@@ -0,0 +1,196 @@
+"""
+Transit loss reconciliation for completed milk transfers.
+
+``reconcile`` rebuilds the TransitLoss rows of a set of transfers from one
+SELECT, with every loss figure computed in SQL (the latest non-cancelled gate
+pass is read through correlated subqueries), and writes them back with a
+single bulk upsert. Rows of transfers in the set that are no longer completed
+(e.g. reopened in the admin) are deleted. update_milktransfer and create_gate_pass run it for the one
+transfer they touch; ``manage.py reconcile_transit_losses`` rebuilds a date
+range.
+
+Per transfer:
+
+* weight loss = departure weight - arrival weight,
+* dispatched volume = gate pass net litres, else the transfer's total volume,
+* arrival volume = arrival weight / gate pass density (DEFAULT_DENSITY without a pass),
+* loss % = weight loss / departure weight, else volume loss / dispatched volume.
+
+``loss_report`` groups the summary table by route, driver, vehicle or
+destination in one aggregate query over the date-leading indexes.
+"""
+from dataclasses import dataclass
+from datetime import date
+from typing import List, Optional
+
+from django.db import transaction
+from django.db.models import (
+    Count,
+    F,
+    FloatField,
+    IntegerField,
+    Max,
+    OuterRef,
+    Q,
+    QuerySet,
+    Subquery,
+    Sum,
+    Value,
+)
+from django.db.models.functions import Cast, Coalesce, NullIf, TruncDate
+
+from .models import GatePass, MilkTransfer, TransitLoss
+
+DEFAULT_DENSITY = 1.032
+
+# report dimension -> (TransitLoss foreign key, column naming the group)
+GROUPS = {
+    "route": ("route_id", "route__name"),
+    "driver": ("driver_id", "driver__name"),
+    "vehicle": ("vehicle_id", "vehicle__vehicle_id"),
+    "destination": ("destination_id", "destination__name"),
+}
+
+MEASURES = (
+    "departure_weight_kg",
+    "arrival_weight_kg",
+    "weight_loss_kg",
+    "density_kg_per_l",
+    "dispatched_volume_l",
+    "arrival_volume_l",
+    "volume_loss_l",
+    "loss_percent",
+)
+COLUMNS = (
+    "vehicle_id",
+    "destination_id",
+    "gate_pass_id",
+    "route_id",
+    "driver_id",
+    "arrival_date",
+    *MEASURES,
+)
+
+
+def _float(expression):
+    return Cast(expression, FloatField())
+
+
+def _rows(transfers: QuerySet) -> QuerySet:
+    gate_pass = (
+        GatePass.objects.filter(milk_transfer=OuterRef("pk"))
+        .exclude(gate_pass_status="cancelled")
+        .order_by("-created_at")
+    )
+
+    def latest(column):
+        return Subquery(gate_pass.values(column)[:1])
+
+    departure = _float("departure_weight_kg")
+    arrival = _float("arrival_weight_kg")
+    density = Coalesce(_float(latest("density_kg_per_l")), Value(DEFAULT_DENSITY))
+    dispatched = Coalesce(_float(latest("net_volume_l")), _float("total_volume"))
+    weight_loss = departure - arrival
+    volume_loss = dispatched - arrival / density
+    annotations = {
+        "gate_pass_id": latest("pk"),
+        "route_id": Coalesce(latest("route_id"), F("vehicle__route_id"), output_field=IntegerField()),
+        "driver_id": latest("driver_id"),
+        "arrival_date": Coalesce(TruncDate("arrival_datetime"), TruncDate("transfer_date")),
+        "departure_weight_kg": departure,
+        "arrival_weight_kg": arrival,
+        "weight_loss_kg": weight_loss,
+        "density_kg_per_l": density,
+        "dispatched_volume_l": dispatched,
+        "arrival_volume_l": arrival / density,
+        "volume_loss_l": volume_loss,
+        "loss_percent": Coalesce(
+            weight_loss * 100 / NullIf(departure, Value(0.0)),
+            volume_loss * 100 / NullIf(dispatched, Value(0.0)),
+        ),
+    }
+    # Prefixed so they do not clash with the transfer's own columns of the same name.
+    return (
+        transfers.filter(status="completed")
+        .annotate(**{f"loss_{name}": expression for name, expression in annotations.items()})
+        .order_by()
+        .values_list("pk", "vehicle_id", "destination_id", *(f"loss_{name}" for name in annotations))
+    )
+
+
+def reconcile(transfers: Optional[QuerySet] = None) -> int:
+    """Rebuild the TransitLoss rows of ``transfers`` (default: all). Returns the number written."""
+    if transfers is None:
+        transfers = MilkTransfer.objects.all()
+    losses = [
+        TransitLoss(milk_transfer_id=pk, **dict(zip(COLUMNS, values)))
+        for pk, *values in _rows(transfers)
+    ]
+    with transaction.atomic():
+        TransitLoss.objects.filter(
+            milk_transfer__in=transfers.exclude(status="completed").order_by().values("pk")
+        ).delete()
+        TransitLoss.objects.bulk_create(
+            losses,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=["milk_transfer"],
+            update_fields=list(COLUMNS),
+        )
+    return len(losses)
+
+
+@dataclass
+class LossGroup:
+    group_id: Optional[int]
+    name: Optional[str]
+    transfers: int
+    departure_weight_kg: float
+    arrival_weight_kg: float
+    weight_loss_kg: float
+    dispatched_volume_l: float
+    volume_loss_l: float
+    loss_percent: Optional[float]
+    max_loss_percent: Optional[float]
+
+
+def loss_report(group_by: str, start: Optional[date] = None, end: Optional[date] = None) -> List[LossGroup]:
+    """Losses per ``group_by`` (a GROUPS key) between ``start`` and ``end``, largest loss first."""
+    key, name = GROUPS[group_by]
+    losses = TransitLoss.objects.all()
+    if start:
+        losses = losses.filter(arrival_date__gte=start)
+    if end:
+        losses = losses.filter(arrival_date__lte=end)
+
+    rows = (
+        losses.values(key, name)
+        .annotate(
+            transfers=Count("pk"),
+            departure=Coalesce(Sum("departure_weight_kg"), Value(0.0)),
+            arrival=Coalesce(Sum("arrival_weight_kg"), Value(0.0)),
+            weight_loss=Coalesce(Sum("weight_loss_kg"), Value(0.0)),
+            weighed_departure=Sum("departure_weight_kg", filter=Q(weight_loss_kg__isnull=False)),
+            dispatched=Coalesce(Sum("dispatched_volume_l"), Value(0.0)),
+            volume_loss=Coalesce(Sum("volume_loss_l"), Value(0.0)),
+            max_loss_percent=Max("loss_percent"),
+        )
+        .order_by("-weight_loss", key)
+    )
+    return [
+        LossGroup(
+            group_id=row[key],
+            name=row[name],
+            transfers=row["transfers"],
+            departure_weight_kg=row["departure"],
+            arrival_weight_kg=row["arrival"],
+            weight_loss_kg=row["weight_loss"],
+            dispatched_volume_l=row["dispatched"],
+            volume_loss_l=row["volume_loss"],
+            # Only transfers weighed at both ends count towards the group's loss %.
+            loss_percent=row["weight_loss"] * 100 / row["weighed_departure"] if row["weighed_departure"] else None,
+            max_loss_percent=row["max_loss_percent"],
+        )
+        for row in rows
+    ]
+
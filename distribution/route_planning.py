@@ -0,0 +1,297 @@
+"""
+Offline collection route planning.
+
+For each route, the suppliers on it are split into pickup trips that start
+and end at the plant, each within a vehicle's capacity, and every trip is
+sequenced to keep the distance driven short:
+
+1. Distances. When the plant and every supplier on the route have
+   coordinates, farms are projected onto a flat plane around the plant (a
+   collection area is small enough for that) and measured straight-line.
+   Otherwise each farm is assumed to sit on the route's road at its
+   ``distance_from_plant``, so two farms are the difference of those
+   distances apart.
+2. Clarke-Wright savings. Each farm starts on its own out-and-back trip; trip
+   ends are joined in order of the distance saved, while the load fits the
+   largest vehicle on the route. Only the NEIGHBOURS nearest farms of each
+   farm are candidates, so the savings list grows linearly with the route.
+3. 2-opt. Each trip's stop order is improved by reversing segments until no
+   reversal shortens it.
+4. Vehicles. Trips are handed out heaviest first to the vehicle that can
+   carry them and has the fewest trips so far.
+
+Plans are saved as RoutePlan rows for dispatchers to review; nothing is
+reassigned. Run with ``manage.py plan_collection_routes``.
+"""
+import heapq
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Tuple
+
+from django.db import transaction
+
+from dairy_project.conf import AppSettings
+
+from .models import Route, RoutePlan, RoutePlanStop, RoutePlanTrip
+
+EARTH_RADIUS_KM = 6371.0
+
+DEFAULTS = {
+    "NEIGHBOURS": 25,
+    "DEFAULT_VEHICLE_CAPACITY": 5000.0,
+    "MAX_2OPT_PASSES": 50,
+}
+
+
+_setting = AppSettings("ROUTE_PLANNING", DEFAULTS)
+
+
+@dataclass
+class Farm:
+    supplier_id: int
+    volume_l: float
+    distance_from_plant: float
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+
+
+@dataclass
+class PlannedTrip:
+    supplier_ids: List[int]
+    legs_km: List[float]
+    load_l: float
+    distance_km: float
+    vehicle_id: Optional[int] = None
+    over_capacity: bool = False
+
+
+@dataclass
+class Plan:
+    route_id: int
+    metric: str
+    trips: List[PlannedTrip] = field(default_factory=list)
+    total_distance_km: float = 0.0
+    baseline_distance_km: float = 0.0
+    solve_seconds: float = 0.0
+
+    @property
+    def supplier_count(self):
+        return sum(len(trip.supplier_ids) for trip in self.trips)
+
+    @property
+    def total_volume_l(self):
+        return sum(trip.load_l for trip in self.trips)
+
+
+def _distance_function(farms: List[Farm], plant) -> Tuple[str, Callable[[int, int], float]]:
+    """("planar" or "radial", d(i, j)) over node 0 = plant and node i = farms[i - 1]."""
+    located = (
+        plant is not None
+        and plant.latitude is not None
+        and plant.longitude is not None
+        and all(farm.latitude is not None and farm.longitude is not None for farm in farms)
+    )
+    if located:
+        # Equirectangular projection around the plant, in km.
+        scale = math.cos(math.radians(plant.latitude))
+        points = [(0.0, 0.0)] + [
+            (
+                math.radians(farm.longitude - plant.longitude) * scale * EARTH_RADIUS_KM,
+                math.radians(farm.latitude - plant.latitude) * EARTH_RADIUS_KM,
+            )
+            for farm in farms
+        ]
+
+        def planar(i, j):
+            (xi, yi), (xj, yj) = points[i], points[j]
+            return math.hypot(xi - xj, yi - yj)
+
+        return "planar", planar
+
+    radii = [0.0] + [farm.distance_from_plant for farm in farms]
+
+    def radial(i, j):
+        return abs(radii[i] - radii[j])
+
+    return "radial", radial
+
+
+def _neighbours(metric: str, farms: List[Farm], distance, k: int) -> List[List[int]]:
+    """The k nearest other farms of each farm (node numbers)."""
+    n = len(farms)
+    if metric == "radial":
+        # Along a line the nearest farms are the ones next to it in distance order.
+        order = sorted(range(1, n + 1), key=lambda node: farms[node - 1].distance_from_plant)
+        position = {node: index for index, node in enumerate(order)}
+        nearest = [[] for _ in range(n + 1)]
+        for node in order:
+            at = position[node]
+            window = order[max(0, at - k):at] + order[at + 1:at + 1 + k]
+            nearest[node] = heapq.nsmallest(k, window, key=lambda other: distance(node, other))
+        return nearest
+    nodes = range(1, n + 1)
+    return [[]] + [
+        heapq.nsmallest(k, (other for other in nodes if other != node), key=lambda other: distance(node, other))
+        for node in nodes
+    ]
+
+
+def _savings(farms: List[Farm], distance, neighbours, capacity: float) -> List[List[int]]:
+    """Clarke-Wright parallel savings: trips as lists of node numbers."""
+    n = len(farms)
+    load = [0.0] + [farm.volume_l for farm in farms]
+    candidates = set()
+    for node in range(1, n + 1):
+        for other in neighbours[node]:
+            pair = (node, other) if node < other else (other, node)
+            candidates.add(pair)
+    savings = sorted(
+        ((distance(0, i) + distance(0, j) - distance(i, j), i, j) for i, j in candidates),
+        reverse=True,
+    )
+
+    trip_of = list(range(n + 1))
+    trips = {node: [node] for node in range(1, n + 1)}
+    trip_load = {node: load[node] for node in range(1, n + 1)}
+    for saving, i, j in savings:
+        if saving <= 0:
+            break
+        a, b = trip_of[i], trip_of[j]
+        if a == b or trip_load[a] + trip_load[b] > capacity:
+            continue
+        first, second = trips[a], trips[b]
+        # i and j must each be at an end of their trip to be joined.
+        if first[-1] == i and second[0] == j:
+            merged = first + second
+        elif first[0] == i and second[-1] == j:
+            merged = second + first
+        elif first[0] == i and second[0] == j:
+            merged = first[::-1] + second
+        elif first[-1] == i and second[-1] == j:
+            merged = first + second[::-1]
+        else:
+            continue
+        trips[a] = merged
+        trip_load[a] += trip_load.pop(b)
+        del trips[b]
+        for node in second:
+            trip_of[node] = a
+    return list(trips.values())
+
+
+def _two_opt(stops: List[int], distance, max_passes: int) -> List[int]:
+    tour = [0] + stops + [0]
+    for _ in range(max_passes):
+        improved = False
+        for a in range(1, len(tour) - 2):
+            for b in range(a + 1, len(tour) - 1):
+                delta = (
+                    distance(tour[a - 1], tour[b]) + distance(tour[a], tour[b + 1])
+                    - distance(tour[a - 1], tour[a]) - distance(tour[b], tour[b + 1])
+                )
+                if delta < -1e-9:
+                    tour[a:b + 1] = reversed(tour[a:b + 1])
+                    improved = True
+        if not improved:
+            break
+    return tour[1:-1]
+
+
+def _assign_vehicles(trips: List[PlannedTrip], vehicles: List[tuple], capacity: float) -> None:
+    """Heaviest trip first, to the capable vehicle with the fewest trips (then the smallest)."""
+    assigned = {vehicle_id: 0 for vehicle_id, _ in vehicles}
+    for trip in sorted(trips, key=lambda trip: -trip.load_l):
+        # Only a single supplier bigger than every vehicle can overload a trip.
+        trip.over_capacity = trip.load_l > capacity
+        capable = [
+            (assigned[vehicle_id], vehicle_capacity, vehicle_id)
+            for vehicle_id, vehicle_capacity in vehicles
+            if vehicle_capacity >= trip.load_l
+        ]
+        if capable:
+            _, _, vehicle_id = min(capable)
+            trip.vehicle_id = vehicle_id
+            assigned[vehicle_id] += 1
+
+
+def solve(route_id: int, farms: List[Farm], vehicles: List[tuple], plant=None) -> Plan:
+    """
+    Plan trips for ``farms`` with ``vehicles`` as (vehicle id, capacity) pairs;
+    ``plant`` is anything with ``latitude``/``longitude``.
+    """
+    started = time.perf_counter()
+    metric, distance = _distance_function(farms, plant)
+    plan = Plan(route_id=route_id, metric=metric)
+    if not farms:
+        return plan
+
+    capacity = max((capacity for _, capacity in vehicles), default=_setting("DEFAULT_VEHICLE_CAPACITY"))
+    neighbours = _neighbours(metric, farms, distance, min(_setting("NEIGHBOURS"), len(farms) - 1))
+    for nodes in _savings(farms, distance, neighbours, capacity):
+        nodes = _two_opt(nodes, distance, _setting("MAX_2OPT_PASSES"))
+        legs = [distance(a, b) for a, b in zip([0] + nodes, nodes)]
+        plan.trips.append(
+            PlannedTrip(
+                supplier_ids=[farms[node - 1].supplier_id for node in nodes],
+                legs_km=legs,
+                load_l=sum(farms[node - 1].volume_l for node in nodes),
+                distance_km=sum(legs) + distance(nodes[-1], 0),
+            )
+        )
+    _assign_vehicles(plan.trips, vehicles, capacity)
+
+    # Longest trips first, which is also the order dispatchers send them out in.
+    plan.trips.sort(key=lambda trip: -trip.distance_km)
+    plan.total_distance_km = sum(trip.distance_km for trip in plan.trips)
+    plan.baseline_distance_km = sum(2 * distance(0, node) for node in range(1, len(farms) + 1))
+    plan.solve_seconds = time.perf_counter() - started
+    return plan
+
+
+def plan_route(route: Route) -> Plan:
+    farms = [
+        Farm(*row)
+        for row in route.suppliers.order_by("pk").values_list(
+            "pk", "daily_capacity", "distance_from_plant", "latitude", "longitude"
+        )
+    ]
+    vehicles = [
+        (vehicle_id, capacity)
+        for vehicle_id, capacity in route.vehicles.order_by("pk").values_list("pk", "capacity_liters")
+        if capacity
+    ]
+    return solve(route.pk, farms, vehicles, route.plant)
+
+
+@transaction.atomic
+def save_plan(plan: Plan) -> RoutePlan:
+    route_plan = RoutePlan.objects.create(
+        route_id=plan.route_id,
+        supplier_count=plan.supplier_count,
+        total_volume_l=plan.total_volume_l,
+        total_distance_km=plan.total_distance_km,
+        baseline_distance_km=plan.baseline_distance_km,
+        solve_seconds=plan.solve_seconds,
+        remarks=f"{plan.metric} distances",
+    )
+    trips = RoutePlanTrip.objects.bulk_create(
+        RoutePlanTrip(
+            plan=route_plan,
+            number=number,
+            vehicle_id=trip.vehicle_id,
+            load_l=trip.load_l,
+            distance_km=trip.distance_km,
+            over_capacity=trip.over_capacity,
+        )
+        for number, trip in enumerate(plan.trips, start=1)
+    )
+    RoutePlanStop.objects.bulk_create(
+        (
+            RoutePlanStop(trip=saved, position=position, supplier_id=supplier_id, leg_km=leg_km)
+            for saved, trip in zip(trips, plan.trips)
+            for position, (supplier_id, leg_km) in enumerate(zip(trip.supplier_ids, trip.legs_km), start=1)
+        ),
+        batch_size=1000,
+    )
+    return route_plan
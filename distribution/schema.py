@@ -1,18 +1,21 @@
-from datetime import datetime, timedelta
+from datetime import date, datetime
 from decimal import Decimal
 from typing import List, Optional
 
 import strawberry
+from django.contrib.auth.models import User
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.exceptions import ValidationError as DjangoValidationError
 from django.core.exceptions import ValidationError
-from django.db.models import F
+from django.db.models import Exists, F, OuterRef
 from django.utils import timezone
 from strawberry.types import Info
 from django.db import transaction
 from django.utils.dateparse import parse_datetime
 
 from collection_center.models import BulkCooler
+from dairy_project.graphql_extensions.response_cache import cached_resolver
+from dairy_project.graphql_extensions.query_optimizer import optimize
 from dairy_project.graphql_types.distribution import (
     CIPRecordInput,
     CIPRecordType,
@@ -23,14 +26,22 @@ from dairy_project.graphql_types.distribution import (
     VehicleInput,
     VehicleType,
     GatePassInput,
-    GatePassType
+    GatePassType,
+    NodeTraceType,
+    RoutePlanType,
+    SupplierTraceType,
+    TransitLossGroupType,
+    TransitLossType,
 )
 from dairy_project.graphql_types.milk import MilkTransferType
 from dairy_project.graphql_types.routes import RouteType
 from plants.models import Plant
+from milk import blending
+from milk.models import CompositeSample
 from suppliers.models import CanCollection, OnFarmTank
 
-from .models import CIPRecord, Distributor, MilkTransfer, Route, Vehicle, VehicleDriver, GatePass, Seal
+from . import reconciliation, traceability
+from .models import INSTANT_GATE_TESTS, CIPRecord, Distributor, MilkTransfer, Route, RoutePlan, Vehicle, VehicleDriver, GatePass, Seal, TransitLoss
 
 
 
@@ -63,13 +74,15 @@ class Query:
         return Vehicle.objects.select_related('distributor', 'route').all()
     
     @strawberry.field
+    @cached_resolver(VehicleDriver, Route)
     def all_drivers(self, route_id: Optional[int] = None) -> List[VehicleDriverType]:
-        queryset = VehicleDriver.objects.all()
+        queryset = VehicleDriver.objects.select_related("route").all()
         if route_id is not None:
             queryset = queryset.filter(route_id=route_id)
         return queryset
     
     @strawberry.field
+    @cached_resolver(Route)
     def all_routes(self) -> List[RouteType]:
         return Route.objects.all()
     
@@ -83,8 +96,9 @@ class Query:
         return [v for v in vehicles if v.is_available]
 
     @strawberry.field
+    @cached_resolver(Distributor, User)
     def all_distributors(self) -> List[DistributorType]:
-        return Distributor.objects.all()
+        return Distributor.objects.select_related("user").all()
     
     @strawberry.field
     def milk_transfers(
@@ -113,14 +127,17 @@ class Query:
         info: Info, 
         plant_id: int, 
     ) -> List[MilkTransferType]:
+        approved_gate_sample = CompositeSample.objects.filter(
+            milk_transfer=OuterRef('pk'),
+            sample_type=INSTANT_GATE_TESTS,
+            passed='approved',
+        )
         approved_transfers = MilkTransfer.objects.filter(
-            destination_id = plant_id,
+            Exists(approved_gate_sample),
+            destination_id=plant_id,
+            status='completed',
             arrival_datetime__isnull=False,
-            vehicle__gateSamples__sample_type='instant-gate tests',
-            vehicle__gateSamples__passed='approved',
-            vehicle__gateSamples__collected_at__gte=F('arrival_datetime'),
-            vehicle__gateSamples__collected_at__lte=F('arrival_datetime') + timedelta(hours=2)
-        ).distinct()
+        )
         return approved_transfers 
 
     @strawberry.field
@@ -174,10 +191,74 @@ class Query:
     @strawberry.field
     def gate_pass_by_id(self, info: Info, id: int) -> "GatePassType":
         try:
-            return GatePass.objects.get(id=id)
+            return optimize(GatePass.objects.filter(id=id), info).get()
         except GatePass.DoesNotExist:
             raise Exception("GatePass not found")
 
+    @strawberry.field
+    def trace_suppliers(self, node_type: str, node_id: int) -> List[SupplierTraceType]:
+        if node_type not in traceability.NODE_TYPES:
+            raise Exception(f"Unknown node type: {node_type}")
+        return [SupplierTraceType(**vars(trace)) for trace in traceability.trace_back(node_type, node_id)]
+
+    @strawberry.field
+    def trace_supplier_milk(
+        self,
+        supplier_id: int,
+        node_type: str = traceability.SILO,
+        from_date: Optional[date] = None,
+        to_date: Optional[date] = None,
+    ) -> List[NodeTraceType]:
+        if node_type not in traceability.NODE_TYPES:
+            raise Exception(f"Unknown node type: {node_type}")
+        return [
+            NodeTraceType(**vars(trace))
+            for trace in traceability.trace_forward(supplier_id, node_type, from_date, to_date)
+        ]
+
+    @strawberry.field
+    def route_plans(self, route_id: int, limit: int = 1) -> List[RoutePlanType]:
+        return RoutePlan.objects.filter(route_id=route_id).order_by("-created_at")[:limit]
+
+    @strawberry.field
+    def transit_loss_report(
+        self,
+        group_by: str = "route",
+        from_date: Optional[date] = None,
+        to_date: Optional[date] = None,
+    ) -> List[TransitLossGroupType]:
+        if group_by not in reconciliation.GROUPS:
+            raise Exception(f"Unknown grouping: {group_by}")
+        return [
+            TransitLossGroupType(**vars(group))
+            for group in reconciliation.loss_report(group_by, from_date, to_date)
+        ]
+
+    @strawberry.field
+    def transit_losses(
+        self,
+        from_date: Optional[date] = None,
+        to_date: Optional[date] = None,
+        route_id: Optional[int] = None,
+        driver_id: Optional[int] = None,
+        vehicle_id: Optional[int] = None,
+        limit: int = 100,
+    ) -> List[TransitLossType]:
+        losses = TransitLoss.objects.all()
+        if from_date:
+            losses = losses.filter(arrival_date__gte=from_date)
+        if to_date:
+            losses = losses.filter(arrival_date__lte=to_date)
+        if route_id:
+            losses = losses.filter(route_id=route_id)
+        if driver_id:
+            losses = losses.filter(driver_id=driver_id)
+        if vehicle_id:
+            losses = losses.filter(vehicle_id=vehicle_id)
+        columns = [field.python_name for field in TransitLossType.__strawberry_definition__.fields]
+        rows = losses.order_by(F("loss_percent").desc(nulls_last=True)).values(*columns)[:limit]
+        return [TransitLossType(**row) for row in rows]
+
 
 
 @strawberry.type
@@ -247,6 +328,8 @@ class Mutation:
             transfer.full_clean()
             transfer.save()
             transfer.calculate_total_volume()
+            traceability.propagate(transfer)
+            blending.blend_transfer(transfer)
             return transfer
         except DjangoValidationError as e:
             print("Validation error:", e.messages)
@@ -278,6 +361,9 @@ class Mutation:
                 update_fields.append("arrival_weight_kg")
 
             transfer.save(update_fields=update_fields)
+            transfer.link_gate_samples()
+            traceability.propagate(transfer)
+            reconciliation.reconcile(MilkTransfer.objects.filter(pk=transfer.pk))
             return transfer
         except MilkTransfer.DoesNotExist:
             return None
@@ -391,6 +477,8 @@ class Mutation:
                 # Link QC Samples (AUTO)
                 # -----------------------------
                 gate_pass.link_samples()
+                traceability.propagate(transfer)
+                reconciliation.reconcile(MilkTransfer.objects.filter(pk=transfer.pk))
 
                 return gate_pass
 
@@ -1,3 +1,345 @@
-from django.test import TestCase
+import random
+from datetime import timedelta
+from io import StringIO
+from types import SimpleNamespace
 
-# Create your tests here.
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from collection_center.models import BulkCooler
+from milk.models import INSTANT_GATE_TESTS, SOCIETY_TEST, CompositeSample
+from plants.models import Plant, Silo
+from suppliers.models import Supplier
+from suppliers.storage import assign_lots
+from suppliers.tests import make_lots, make_supplier
+
+from .models import (
+    CIPRecord,
+    Distributor,
+    GatePass,
+    GatePassQC,
+    MilkLotTrace,
+    MilkTransfer,
+    Route,
+    RoutePlan,
+    RoutePlanStop,
+    TransitLoss,
+    Vehicle,
+    VehicleDriver,
+)
+from .reconciliation import reconcile
+from .route_planning import Farm, _distance_function, _two_opt, plan_route, save_plan, solve
+from .traceability import GATE_PASS, MILK_TRANSFER, SILO, propagate, trace_back, trace_forward
+
+
+class GatePassLinkSamplesTests(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        self.route = Route.objects.create(name="North")
+        self.vehicle = Vehicle.objects.create(
+            distributor=Distributor.objects.create(address=""), name="Tanker", vehicle_id="KA-01-1234"
+        )
+        self.cooler = BulkCooler.objects.create(route=self.route, name="Cooler-1", capacity_liters=1000)
+        self.trip = MilkTransfer.objects.create(vehicle=self.vehicle, bulk_cooler=self.cooler, total_volume=900)
+        self.later_trip = MilkTransfer.objects.create(vehicle=self.vehicle, total_volume=900)
+        self.gate_pass = GatePass.objects.create(
+            milk_transfer=self.trip,
+            empty_tare_kg=8000,
+            net_volume_l=1000,
+            cip_record=CIPRecord.objects.create(
+                vehicle=self.vehicle,
+                certificate_no="CIP-1",
+                wash_type="Full-CIP",
+                started_at=now - timedelta(hours=2),
+                finished_at=now - timedelta(hours=1),
+                expiry_at=now + timedelta(hours=12),
+                operator_code="OP-1",
+            ),
+            expected_arrival_plant=now + timedelta(hours=3),
+            driver=VehicleDriver.objects.create(
+                name="Driver", mobile="9800000000", licence_no="DL-1", licence_expiry=now.date()
+            ),
+        )
+
+    def _gate_sample(self, transfer):
+        return CompositeSample.objects.create(
+            vehicle=self.vehicle, milk_transfer=transfer, sample_type=INSTANT_GATE_TESTS
+        )
+
+    def test_links_the_source_and_this_trips_gate_samples_only(self):
+        cooler_sample = CompositeSample.objects.create(bulk_cooler=self.cooler, sample_type=SOCIETY_TEST)
+        this_trip = self._gate_sample(self.trip)
+        self._gate_sample(self.later_trip)
+        self._gate_sample(None)
+
+        self.gate_pass.link_samples()
+
+        linked = dict(
+            GatePassQC.objects.filter(gate_pass=self.gate_pass).values_list("composite_sample_id", "is_primary")
+        )
+        self.assertEqual(linked, {cooler_sample.pk: True, this_trip.pk: False})
+
+    def test_linking_twice_adds_nothing(self):
+        self._gate_sample(self.trip)
+
+        self.gate_pass.link_samples()
+        self.gate_pass.link_samples()
+
+        self.assertEqual(GatePassQC.objects.filter(gate_pass=self.gate_pass).count(), 1)
+
+
+class ReconcileTests(TestCase):
+    def setUp(self):
+        vehicle = Vehicle.objects.create(
+            distributor=Distributor.objects.create(address=""), name="Tanker", vehicle_id="KA-01-1234"
+        )
+        self.transfers = [
+            MilkTransfer.objects.create(
+                vehicle=vehicle,
+                total_volume=1000,
+                status="completed",
+                arrival_datetime=timezone.now(),
+                departure_weight_kg=1032,
+                arrival_weight_kg=1022,
+            )
+            for _ in range(2)
+        ]
+
+    def test_writes_the_loss_of_completed_transfers(self):
+        self.assertEqual(reconcile(), 2)
+
+        loss = TransitLoss.objects.get(milk_transfer=self.transfers[0])
+        self.assertEqual(loss.weight_loss_kg, 10.0)
+        self.assertAlmostEqual(loss.loss_percent, 1000 / 1032)
+
+    def test_drops_the_rows_of_transfers_no_longer_completed(self):
+        reconcile()
+        reopened, other = self.transfers
+        MilkTransfer.objects.filter(pk=reopened.pk).update(status="in_transit")
+
+        self.assertEqual(reconcile(MilkTransfer.objects.filter(pk=reopened.pk)), 0)
+
+        self.assertEqual(list(TransitLoss.objects.values_list("milk_transfer", flat=True)), [other.pk])
+
+
+PLANT = SimpleNamespace(latitude=12.9, longitude=77.6)
+
+
+def scattered_farms(count, seed, volume=(200.0, 1500.0)):
+    rng = random.Random(seed)
+    return [
+        Farm(
+            supplier_id=number,
+            volume_l=rng.uniform(*volume),
+            distance_from_plant=0.0,
+            latitude=PLANT.latitude + rng.uniform(-0.2, 0.2),
+            longitude=PLANT.longitude + rng.uniform(-0.2, 0.2),
+        )
+        for number in range(1, count + 1)
+    ]
+
+
+def tour_length(stops, distance):
+    tour = [0] + stops + [0]
+    return sum(distance(a, b) for a, b in zip(tour, tour[1:]))
+
+
+class SolveTests(SimpleTestCase):
+    VEHICLES = [(1, 5000.0), (2, 3000.0)]
+
+    def test_every_supplier_is_on_exactly_one_trip(self):
+        farms = scattered_farms(60, seed=1)
+
+        plan = solve(1, farms, self.VEHICLES, PLANT)
+
+        planned = [supplier_id for trip in plan.trips for supplier_id in trip.supplier_ids]
+        self.assertEqual(sorted(planned), [farm.supplier_id for farm in farms])
+        self.assertEqual(plan.metric, "planar")
+
+    def test_trips_fit_the_largest_vehicle_and_get_one_that_carries_them(self):
+        farms = scattered_farms(60, seed=2)
+        volumes = {farm.supplier_id: farm.volume_l for farm in farms}
+
+        plan = solve(1, farms, self.VEHICLES, PLANT)
+
+        capacities = dict(self.VEHICLES)
+        for trip in plan.trips:
+            self.assertAlmostEqual(trip.load_l, sum(volumes[supplier_id] for supplier_id in trip.supplier_ids))
+            self.assertLessEqual(trip.load_l, 5000.0)
+            self.assertFalse(trip.over_capacity)
+            self.assertGreaterEqual(capacities[trip.vehicle_id], trip.load_l)
+
+    def test_planned_trips_are_shorter_than_one_by_one(self):
+        farms = scattered_farms(40, seed=3)
+        _, distance = _distance_function(farms, PLANT)
+        node = {farm.supplier_id: number for number, farm in enumerate(farms, start=1)}
+
+        plan = solve(1, farms, self.VEHICLES, PLANT)
+
+        self.assertLess(plan.total_distance_km, plan.baseline_distance_km)
+        for trip in plan.trips:
+            stops = [node[supplier_id] for supplier_id in trip.supplier_ids]
+            self.assertAlmostEqual(trip.distance_km, tour_length(stops, distance))
+
+    def test_two_opt_never_lengthens_a_trip(self):
+        for seed in range(20):
+            farms = scattered_farms(12, seed)
+            _, distance = _distance_function(farms, PLANT)
+            stops = list(range(1, len(farms) + 1))
+            random.Random(seed).shuffle(stops)
+
+            improved = _two_opt(list(stops), distance, max_passes=50)
+
+            self.assertEqual(sorted(improved), sorted(stops))
+            self.assertLessEqual(tour_length(improved, distance), tour_length(stops, distance) + 1e-9)
+
+    def test_an_oversize_supplier_gets_its_own_trip_flagged_over_capacity(self):
+        farms = scattered_farms(5, seed=4, volume=(100.0, 200.0))
+        farms.append(Farm(supplier_id=99, volume_l=8000.0, distance_from_plant=0.0, latitude=12.95, longitude=77.65))
+
+        plan = solve(1, farms, self.VEHICLES, PLANT)
+
+        [oversize] = [trip for trip in plan.trips if 99 in trip.supplier_ids]
+        self.assertEqual(oversize.supplier_ids, [99])
+        self.assertTrue(oversize.over_capacity)
+        self.assertIsNone(oversize.vehicle_id)
+        self.assertEqual([trip for trip in plan.trips if trip.over_capacity], [oversize])
+
+    def test_without_coordinates_farms_sit_on_the_road(self):
+        farms = [Farm(supplier_id=n, volume_l=100.0, distance_from_plant=float(n)) for n in (3, 1, 2)]
+
+        plan = solve(1, farms, [], None)
+
+        [trip] = plan.trips
+        self.assertEqual(plan.metric, "radial")
+        self.assertEqual(trip.distance_km, 6.0)
+        self.assertEqual(sorted(trip.legs_km), [1.0, 1.0, 3.0])
+
+
+class SavePlanTests(TestCase):
+    def setUp(self):
+        self.route = Route.objects.create(name="North")
+        distributor = Distributor.objects.create(address="")
+        for number, capacity in enumerate((500.0, 300.0)):
+            Vehicle.objects.create(
+                distributor=distributor,
+                name=f"Tanker-{number}",
+                vehicle_id=f"KA-{number}",
+                capacity_liters=capacity,
+                route=self.route,
+            )
+        for number in range(6):
+            make_supplier(f"farmer{number}", self.route)
+        Supplier.objects.filter(route=self.route).update(daily_capacity=150.0)
+
+    def test_saved_plan_mirrors_the_solution(self):
+        plan = plan_route(self.route)
+
+        saved = save_plan(plan)
+
+        trips = list(saved.trips.order_by("number"))
+        self.assertEqual(saved.supplier_count, 6)
+        self.assertEqual(saved.total_volume_l, 900.0)
+        self.assertEqual([trip.load_l for trip in trips], [trip.load_l for trip in plan.trips])
+        self.assertEqual(
+            [list(trip.stops.order_by("position").values_list("supplier_id", flat=True)) for trip in trips],
+            [trip.supplier_ids for trip in plan.trips],
+        )
+        self.assertTrue(all(trip.vehicle_id for trip in trips))
+
+    def test_command_saves_a_plan_per_route_unless_dry_run(self):
+        call_command("plan_collection_routes", "--dry-run", stdout=StringIO())
+        self.assertFalse(RoutePlan.objects.exists())
+
+        out = StringIO()
+        call_command("plan_collection_routes", "--route", str(self.route.pk), stdout=out)
+
+        self.assertIn("6 suppliers", out.getvalue())
+        self.assertEqual(RoutePlanStop.objects.filter(trip__plan__route=self.route).count(), 6)
+
+
+class TraceabilityTests(TestCase):
+    def setUp(self):
+        route = Route.objects.create(name="North")
+        self.big, self.small = make_supplier("big", route), make_supplier("small", route)
+        self.cooler = BulkCooler.objects.create(route=route, name="Cooler-1", capacity_liters=1000)
+        lots = make_lots(self.big, 2, volume_l=100.0) + make_lots(self.small, 1)
+        assign_lots(self.cooler, [lot.pk for lot in lots])
+        plant = Plant.objects.create(name="Main", location="", capacity=10000)
+        self.silos = [
+            Silo.objects.create(plant=plant, name=f"Silo-{number}", code=f"S-{number}", capacity_liters=10000)
+            for number in range(2)
+        ]
+        self.vehicle = Vehicle.objects.create(
+            distributor=Distributor.objects.create(address=""), name="Tanker", vehicle_id="KA-01-1234"
+        )
+        self.transfer = MilkTransfer.objects.create(vehicle=self.vehicle, bulk_cooler=self.cooler, total_volume=250)
+
+    def _nodes(self):
+        return sorted(
+            MilkLotTrace.objects.filter(milk_transfer=self.transfer)
+            .values_list("node_type", "node_id")
+            .distinct()
+        )
+
+    def test_assigned_lots_trace_back_to_their_suppliers(self):
+        traces = trace_back("bulk_cooler", self.cooler.pk)
+
+        self.assertEqual(
+            [(trace.supplier_name, trace.volume_l) for trace in traces], [("big", 200.0), ("small", 50.0)]
+        )
+        self.assertEqual(len(traces[0].lot_ids), 2)
+
+    def test_a_transfer_copies_its_vessels_lots_to_every_node_it_reaches(self):
+        self.transfer.silo = self.silos[0]
+        self.transfer.save()
+        now = timezone.now()
+        gate_pass = GatePass.objects.create(
+            milk_transfer=self.transfer,
+            empty_tare_kg=8000,
+            net_volume_l=250,
+            cip_record=CIPRecord.objects.create(
+                vehicle=self.vehicle,
+                certificate_no="CIP-1",
+                wash_type="Full-CIP",
+                started_at=now - timedelta(hours=2),
+                finished_at=now - timedelta(hours=1),
+                expiry_at=now + timedelta(hours=12),
+                operator_code="OP-1",
+            ),
+            expected_arrival_plant=now + timedelta(hours=3),
+            driver=VehicleDriver.objects.create(
+                name="Driver", mobile="9800000000", licence_no="DL-1", licence_expiry=now.date()
+            ),
+        )
+
+        self.assertEqual(propagate(self.transfer), 9)
+
+        expected = [(MILK_TRANSFER, self.transfer.pk), (GATE_PASS, gate_pass.pk), (SILO, self.silos[0].pk)]
+        self.assertEqual(self._nodes(), sorted(expected))
+        self.assertEqual([trace.volume_l for trace in trace_back(SILO, self.silos[0].pk)], [200.0, 50.0])
+
+    def test_moving_a_transfer_to_another_silo_moves_its_rows(self):
+        for silo in self.silos:
+            self.transfer.silo = silo
+            self.transfer.save()
+            propagate(self.transfer)
+
+        self.assertFalse(MilkLotTrace.objects.filter(node_type=SILO, node_id=self.silos[0].pk).exists())
+        [silo] = trace_forward(self.big.pk, SILO)
+        self.assertEqual((silo.node_id, silo.volume_l), (self.silos[1].pk, 200.0))
+
+    def test_lots_added_after_the_transfer_follow_it(self):
+        propagate(self.transfer)
+
+        assign_lots(self.cooler, [lot.pk for lot in make_lots(self.small, 2)])
+
+        self.assertEqual(MilkLotTrace.objects.filter(node_type=MILK_TRANSFER, node_id=self.transfer.pk).count(), 5)
+        self.assertEqual(trace_back(MILK_TRANSFER, self.transfer.pk)[1].volume_l, 150.0)
+
+    def test_a_transfer_without_a_source_has_no_rows(self):
+        transfer = MilkTransfer.objects.create(vehicle=self.vehicle, total_volume=100)
+
+        self.assertEqual(propagate(transfer), 0)
+        self.assertFalse(MilkLotTrace.objects.filter(milk_transfer=transfer).exists())
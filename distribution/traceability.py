@@ -0,0 +1,146 @@
+"""
+Maintenance and lookups for the MilkLotTrace traceability index.
+
+Lots enter the index when they are assigned to a collection vessel
+(``record_lots``, called by suppliers.storage.assign_lots). A transfer's rows,
+for itself, its gate passes and its silo, are re-derived from its source
+vessel's rows whenever the transfer is created, completed, gets a gate pass or
+is pumped into a silo (``propagate``). Re-deriving instead of appending also
+drops the rows of a silo the transfer was moved away from.
+
+``trace_back`` (node -> suppliers) and ``trace_forward`` (supplier -> nodes)
+each read one index range in a single query.
+"""
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Dict, Iterable, List, Optional
+
+from django.db import transaction
+
+from suppliers.models import MilkLot
+
+from .models import GatePass, MilkLotTrace, MilkTransfer
+
+# Collection vessels; each is also the MilkLot and MilkTransfer foreign key to it.
+VESSEL_TYPES = ("bulk_cooler", "on_farm_tank", "can_collection")
+MILK_TRANSFER = "milk_transfer"
+GATE_PASS = "gate_pass"
+SILO = "silo"
+NODE_TYPES = {node_type for node_type, _ in MilkLotTrace.NODE_TYPES}
+
+_LOT_COLUMNS = ("milk_lot_id", "supplier_id", "lot_date", "volume_l")
+
+
+@dataclass
+class SupplierTrace:
+    supplier_id: int
+    supplier_name: str
+    lot_ids: List[int] = field(default_factory=list)
+    volume_l: float = 0.0
+
+
+@dataclass
+class NodeTrace:
+    node_type: str
+    node_id: int
+    lot_ids: List[int] = field(default_factory=list)
+    volume_l: float = 0.0
+    first_lot_date: Optional[date] = None
+    last_lot_date: Optional[date] = None
+
+
+def _rows(node_type, node_id, lots, milk_transfer_id=None) -> List[MilkLotTrace]:
+    return [
+        MilkLotTrace(
+            node_type=node_type,
+            node_id=node_id,
+            milk_lot_id=lot_id,
+            supplier_id=supplier_id,
+            lot_date=lot_date,
+            volume_l=volume_l,
+            milk_transfer_id=milk_transfer_id,
+        )
+        for lot_id, supplier_id, lot_date, volume_l in lots
+    ]
+
+
+def record_lots(vessel_type: str, vessel_id: int, lot_ids: Iterable[int]) -> None:
+    """Index lots just assigned to a vessel, and pass them on if the vessel was already transferred."""
+    lots = MilkLot.objects.filter(pk__in=list(lot_ids)).values_list("pk", "supplier_id", "date_created", "volume_l")
+    MilkLotTrace.objects.bulk_create(_rows(vessel_type, vessel_id, lots), ignore_conflicts=True)
+
+    # A vessel is emptied by at most one transfer (unique_transfer_per_*).
+    transfer = MilkTransfer.objects.filter(**{f"{vessel_type}_id": vessel_id}).first()
+    if transfer is not None:
+        propagate(transfer)
+
+
+def _source(transfer: MilkTransfer):
+    for vessel_type in VESSEL_TYPES:
+        vessel_id = getattr(transfer, f"{vessel_type}_id")
+        if vessel_id:
+            return vessel_type, vessel_id
+    return None
+
+
+def propagate(transfer: MilkTransfer) -> int:
+    """
+    Rebuild the rows of ``transfer``, its gate passes and its silo from its
+    source vessel's rows. Returns the number of rows written.
+    """
+    with transaction.atomic():
+        MilkLotTrace.objects.filter(milk_transfer=transfer).delete()
+        source = _source(transfer)
+        if source is None:
+            return 0
+        vessel_type, vessel_id = source
+        lots = list(
+            MilkLotTrace.objects.filter(node_type=vessel_type, node_id=vessel_id).values_list(*_LOT_COLUMNS)
+        )
+        if not lots:
+            return 0
+
+        nodes = [(MILK_TRANSFER, transfer.pk)]
+        nodes += [(GATE_PASS, pk) for pk in GatePass.objects.filter(milk_transfer=transfer).values_list("pk", flat=True)]
+        if transfer.silo_id:
+            nodes.append((SILO, transfer.silo_id))
+        rows = [row for node_type, node_id in nodes for row in _rows(node_type, node_id, lots, transfer.pk)]
+        MilkLotTrace.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+        return len(rows)
+
+
+def trace_back(node_type: str, node_id: int) -> List[SupplierTrace]:
+    """Suppliers whose lots ended up in a node, largest contribution first."""
+    suppliers: Dict[int, SupplierTrace] = {}
+    rows = MilkLotTrace.objects.filter(node_type=node_type, node_id=node_id).values_list(
+        "supplier_id", "supplier__user__username", "milk_lot_id", "volume_l"
+    )
+    for supplier_id, username, lot_id, volume_l in rows:
+        trace = suppliers.get(supplier_id)
+        if trace is None:
+            trace = suppliers[supplier_id] = SupplierTrace(supplier_id, username)
+        trace.lot_ids.append(lot_id)
+        trace.volume_l += volume_l
+    return sorted(suppliers.values(), key=lambda trace: -trace.volume_l)
+
+
+def trace_forward(
+    supplier_id: int, node_type: str = SILO, start: Optional[date] = None, end: Optional[date] = None
+) -> List[NodeTrace]:
+    """Nodes of ``node_type`` that received a supplier's lots collected between ``start`` and ``end``."""
+    rows = MilkLotTrace.objects.filter(supplier_id=supplier_id, node_type=node_type)
+    if start:
+        rows = rows.filter(lot_date__gte=start)
+    if end:
+        rows = rows.filter(lot_date__lte=end)
+
+    nodes: Dict[int, NodeTrace] = {}
+    for node_id, lot_id, lot_date, volume_l in rows.values_list("node_id", "milk_lot_id", "lot_date", "volume_l"):
+        trace = nodes.get(node_id)
+        if trace is None:
+            trace = nodes[node_id] = NodeTrace(node_type, node_id, first_lot_date=lot_date, last_lot_date=lot_date)
+        trace.lot_ids.append(lot_id)
+        trace.volume_l += volume_l
+        trace.first_lot_date = min(trace.first_lot_date, lot_date)
+        trace.last_lot_date = max(trace.last_lot_date, lot_date)
+    return sorted(nodes.values(), key=lambda trace: trace.last_lot_date, reverse=True)
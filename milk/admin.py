@@ -1,6 +1,37 @@
 from django.contrib import admin
-from .models import CompositeSample, MilkPricingConfig
+from .models import CompositeSample, MilkPricingConfig, MilkPricingVersion
+from .pricing import CONFIG_FIELDS
+from .pricing_history import record_version
 
 
 admin.site.register(CompositeSample)
-admin.site.register(MilkPricingConfig)
+
+
+@admin.register(MilkPricingConfig)
+class MilkPricingConfigAdmin(admin.ModelAdmin):
+    """Edits are recorded as a pricing version from today, as updateMilkPricingConfig does."""
+
+    def get_readonly_fields(self, request, obj=None):
+        return ("route",) if obj else ()
+
+    def save_model(self, request, obj, form, change):
+        record_version(obj.route_id, {name: getattr(obj, name) for name in CONFIG_FIELDS})
+        obj.pk = MilkPricingConfig.objects.get(route_id=obj.route_id).pk
+        obj.refresh_from_db()
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(MilkPricingVersion)
+class MilkPricingVersionAdmin(admin.ModelAdmin):
+    """Read-only: versions are written by record_version, which keeps the current config in step."""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
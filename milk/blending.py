@@ -0,0 +1,185 @@
+"""
+Predicted composition of vessels, transfers and silos from their milk lots.
+
+Each node keeps running sums of volume and volume x fat/SNF/protein
+(QualityBlend). Lots assigned to a vessel add one aggregate of the batch
+(``add_lots``, called by suppliers.storage.assign_lots). A transfer takes a
+copy of its source vessel's counters and adds them to its silo
+(``blend_transfer``); when it is re-blended, the previous copy is taken back
+out of the silo it went into first, so a transfer moved between silos is
+counted once. Every update is a fixed number of queries, however many lots the
+node already holds.
+
+When a composite sample gets lab results, ``flag_sample`` compares them with
+the predicted blend of the vessel or transfer it was drawn from and broadcasts
+the parameters that differ by more than the configured tolerance on the
+"notifications" channel group.
+"""
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models import F, Sum
+
+from dairy_project.conf import AppSettings
+from distribution.models import MilkTransfer
+from suppliers.models import MilkLot
+
+from .models import CompositeSample, QualityBlend
+
+logger = logging.getLogger(__name__)
+
+VESSEL_TYPES = ("bulk_cooler", "on_farm_tank", "can_collection")
+MILK_TRANSFER = "milk_transfer"
+SILO = "silo"
+NODE_TYPES = {node_type for node_type, _ in QualityBlend.NODE_TYPES}
+
+# counter -> MilkLot column it weights by volume
+COUNTERS = {
+    "fat_sum": "fat_percent",
+    "snf_sum": "snf",
+    "protein_sum": "protein_percent",
+}
+
+# parameter -> (CompositeSample column, QualityBlend property)
+PARAMETERS = {
+    "fat": ("fat_percent", "fat_percent"),
+    "snf": ("snf_percent", "snf_percent"),
+    "protein": ("protein_percent", "protein_percent"),
+}
+
+DEFAULTS = {
+    "FAT_TOLERANCE": 0.3,
+    "SNF_TOLERANCE": 0.4,
+    "PROTEIN_TOLERANCE": 0.2,
+}
+
+
+_setting = AppSettings("QUALITY_BLEND", DEFAULTS)
+
+
+def _empty() -> Dict[str, float]:
+    return dict.fromkeys(("volume_l", *COUNTERS), 0.0)
+
+
+def _counters(blend: QualityBlend) -> Dict[str, float]:
+    return {name: getattr(blend, name) for name in _empty()}
+
+
+def _add(node_type: str, node_id: int, counters: Dict[str, float], sign: int = 1) -> None:
+    blend, _ = QualityBlend.objects.get_or_create(node_type=node_type, node_id=node_id)
+    QualityBlend.objects.filter(pk=blend.pk).update(
+        **{name: F(name) + sign * value for name, value in counters.items()}
+    )
+
+
+def add_lots(vessel_type: str, vessel_id: int, lot_ids: Iterable[int]) -> None:
+    """Add lots just assigned to a vessel, and re-blend the vessel's transfer if it already left."""
+    totals = MilkLot.objects.filter(pk__in=list(lot_ids)).aggregate(
+        lot_volume_l=Sum("volume_l"),
+        **{f"lot_{name}": Sum(F("volume_l") * F(column)) for name, column in COUNTERS.items()},
+    )
+    if not totals["lot_volume_l"]:
+        return
+    _add(vessel_type, vessel_id, {name: totals[f"lot_{name}"] or 0.0 for name in _empty()})
+
+    # A vessel is emptied by at most one transfer (unique_transfer_per_*).
+    transfer = MilkTransfer.objects.filter(**{f"{vessel_type}_id": vessel_id}).first()
+    if transfer is not None:
+        blend_transfer(transfer)
+
+
+def blend_transfer(transfer: MilkTransfer) -> QualityBlend:
+    """Copy the source vessel's counters to ``transfer`` and move them into its current silo."""
+    source = next(
+        ((vessel_type, getattr(transfer, f"{vessel_type}_id")) for vessel_type in VESSEL_TYPES
+         if getattr(transfer, f"{vessel_type}_id")),
+        None,
+    )
+    with transaction.atomic():
+        QualityBlend.objects.get_or_create(node_type=MILK_TRANSFER, node_id=transfer.pk)
+        blend = QualityBlend.objects.select_for_update().get(node_type=MILK_TRANSFER, node_id=transfer.pk)
+        if blend.silo_id:
+            _add(SILO, blend.silo_id, _counters(blend), sign=-1)
+
+        vessel = source and QualityBlend.objects.filter(node_type=source[0], node_id=source[1]).first()
+        counters = _counters(vessel) if vessel else _empty()
+        for name, value in counters.items():
+            setattr(blend, name, value)
+        blend.silo_id = transfer.silo_id
+        blend.save()
+
+        if transfer.silo_id and counters["volume_l"]:
+            _add(SILO, transfer.silo_id, counters)
+    return blend
+
+
+def predicted_blend(node_type: str, node_id: int) -> Optional[QualityBlend]:
+    return QualityBlend.objects.filter(node_type=node_type, node_id=node_id, volume_l__gt=0).first()
+
+
+@dataclass
+class BlendCheck:
+    sample_id: int
+    node_type: str
+    node_id: int
+    volume_l: float
+    predicted: Dict[str, Optional[float]] = field(default_factory=dict)
+    measured: Dict[str, Optional[float]] = field(default_factory=dict)
+    anomalies: List[str] = field(default_factory=list)
+
+
+def _sample_node(sample: CompositeSample):
+    if sample.milk_transfer_id:
+        return MILK_TRANSFER, sample.milk_transfer_id
+    if sample.bulk_cooler_id:
+        return "bulk_cooler", sample.bulk_cooler_id
+    if sample.on_farm_tank_id:
+        return "on_farm_tank", sample.on_farm_tank_id
+    return None
+
+
+def check_sample(sample: CompositeSample) -> Optional[BlendCheck]:
+    """Lab results of ``sample`` against the predicted blend it was drawn from, or None without one."""
+    node = _sample_node(sample)
+    blend = node and predicted_blend(*node)
+    if blend is None:
+        return None
+
+    check = BlendCheck(sample.pk, blend.node_type, blend.node_id, blend.volume_l)
+    for parameter, (sample_column, blend_property) in PARAMETERS.items():
+        predicted = getattr(blend, blend_property)
+        measured = getattr(sample, sample_column)
+        check.predicted[parameter] = predicted
+        check.measured[parameter] = measured
+        tolerance = _setting(f"{parameter.upper()}_TOLERANCE")
+        if measured is not None and predicted is not None and abs(measured - predicted) > tolerance:
+            check.anomalies.append(parameter)
+    return check
+
+
+def flag_sample(sample: CompositeSample) -> Optional[BlendCheck]:
+    """``check_sample``, broadcasting a notification when a parameter is out of tolerance."""
+    check = check_sample(sample)
+    if check is None or not check.anomalies:
+        return check
+
+    differences = ", ".join(
+        f"{parameter} {check.measured[parameter]:.2f}% (expected {check.predicted[parameter]:.2f}%)"
+        for parameter in check.anomalies
+    )
+    try:
+        async_to_sync(get_channel_layer().group_send)(
+            "notifications",
+            {
+                "type": "send_notification",
+                "message": f"Composite sample {sample.pk} differs from its {check.node_type} blend: {differences}.",
+            },
+        )
+    except Exception:
+        # The results are already saved; a channel layer outage must not fail the update.
+        logger.exception("Could not broadcast blend anomaly for composite sample %s", sample.pk)
+    return check
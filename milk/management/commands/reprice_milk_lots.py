@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from distribution.models import Route
+from milk.pricing_history import reprice
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-price milk lots with the pricing version in force on the day each was delivered, "
+        "e.g. after a retroactive pricing correction. Lots on paid bills are left alone."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", required=True, help="ISO date of the first delivery day to re-price.")
+        parser.add_argument("--until", help="ISO date of the last delivery day (default: today).")
+        parser.add_argument("--route", type=int, action="append", help="Route id; repeat for several (default: all).")
+
+    def handle(self, *args, **options):
+        dates = {}
+        for name in ("since", "until"):
+            if options[name]:
+                dates[name] = parse_date(options[name])
+                if dates[name] is None:
+                    raise CommandError(f"Invalid --{name} date: {options[name]}")
+
+        route_ids = options["route"] or list(Route.objects.values_list("pk", flat=True))
+        result = reprice(route_ids, dates["since"], dates.get("until"))
+        self.stdout.write(f"Re-priced {result['lots']} milk lots and re-totalled {result['bills']} unpaid bills.")
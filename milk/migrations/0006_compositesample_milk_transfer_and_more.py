@@ -0,0 +1,49 @@
+# Generated by Django 5.2.4 on 2026-10-19 16:53
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_gate_sample_transfers(apps, schema_editor):
+    # Same rule the intake query used to apply on the fly: an instant-gate
+    # sample belongs to the latest trip of its tanker that arrived at most two
+    # hours before the sample was drawn.
+    CompositeSample = apps.get_model("milk", "CompositeSample")
+    MilkTransfer = apps.get_model("distribution", "MilkTransfer")
+    arrivals = (
+        MilkTransfer.objects.filter(vehicle__isnull=False, arrival_datetime__isnull=False)
+        .order_by("arrival_datetime")
+        .values_list("id", "vehicle_id", "arrival_datetime")
+    )
+    for transfer_id, vehicle_id, arrived_at in arrivals.iterator():
+        CompositeSample.objects.filter(
+            vehicle_id=vehicle_id,
+            sample_type="instant-gate tests",
+            collected_at__gte=arrived_at,
+            collected_at__lte=arrived_at + timedelta(hours=2),
+        ).update(milk_transfer_id=transfer_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collection_center', '0009_bulkcoolerlogrollup'),
+        ('distribution', '0020_milktransfer_milktransfer_intake_idx_and_more'),
+        ('milk', '0005_alter_compositesample_vehicle'),
+        ('suppliers', '0018_milklot_needs_retest_milklot_retest_reason'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='compositesample',
+            name='milk_transfer',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='gate_samples', to='distribution.milktransfer'),
+        ),
+        migrations.RunPython(backfill_gate_sample_transfers, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='compositesample',
+            index=models.Index(fields=['vehicle', 'sample_type', 'passed', 'collected_at'], name='compositesample_gate_idx'),
+        ),
+    ]
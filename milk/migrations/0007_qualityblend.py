@@ -0,0 +1,87 @@
+# Generated by Django 5.2.4 on 2026-10-19 16:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, Sum
+
+VESSEL_TYPES = ("bulk_cooler", "on_farm_tank", "can_collection")
+COUNTERS = ("volume_l", "fat_sum", "snf_sum", "protein_sum")
+
+
+def backfill_blends(apps, schema_editor):
+    # Same counters milk.blending maintains from here on: lot sums per vessel,
+    # each transfer's copy of its source vessel, and the transfers per silo.
+    MilkLot = apps.get_model("suppliers", "MilkLot")
+    MilkTransfer = apps.get_model("distribution", "MilkTransfer")
+    QualityBlend = apps.get_model("milk", "QualityBlend")
+
+    vessels = {}
+    for vessel_type in VESSEL_TYPES:
+        totals = (
+            MilkLot.objects.filter(**{f"{vessel_type}__isnull": False})
+            .values(f"{vessel_type}_id")
+            .annotate(
+                total_volume=Sum("volume_l"),
+                total_fat=Sum(F("volume_l") * F("fat_percent")),
+                total_snf=Sum(F("volume_l") * F("snf")),
+                total_protein=Sum(F("volume_l") * F("protein_percent")),
+            )
+            .order_by()
+            .values_list(f"{vessel_type}_id", "total_volume", "total_fat", "total_snf", "total_protein")
+        )
+        for vessel_id, *counters in totals:
+            vessels[(vessel_type, vessel_id)] = [value or 0.0 for value in counters]
+
+    transfers, silos = {}, {}
+    rows = MilkTransfer.objects.values_list("id", "silo_id", *(f"{v}_id" for v in VESSEL_TYPES))
+    for transfer_id, silo_id, *vessel_ids in rows.iterator():
+        source = next(((v, pk) for v, pk in zip(VESSEL_TYPES, vessel_ids) if pk), None)
+        counters = vessels.get(source)
+        if counters is None:
+            continue
+        transfers[transfer_id] = (counters, silo_id)
+        if silo_id:
+            silo = silos.setdefault(silo_id, [0.0] * len(COUNTERS))
+            silos[silo_id] = [total + value for total, value in zip(silo, counters)]
+
+    blends = [
+        QualityBlend(node_type=vessel_type, node_id=vessel_id, **dict(zip(COUNTERS, counters)))
+        for (vessel_type, vessel_id), counters in vessels.items()
+    ]
+    blends += [
+        QualityBlend(node_type="milk_transfer", node_id=transfer_id, silo_id=silo_id, **dict(zip(COUNTERS, counters)))
+        for transfer_id, (counters, silo_id) in transfers.items()
+    ]
+    blends += [
+        QualityBlend(node_type="silo", node_id=silo_id, **dict(zip(COUNTERS, counters)))
+        for silo_id, counters in silos.items()
+    ]
+    QualityBlend.objects.bulk_create(blends, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('milk', '0006_compositesample_milk_transfer_and_more'),
+        ('plants', '0010_silo_collection_day_silo_silo_plant_day_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QualityBlend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('node_type', models.CharField(choices=[('bulk_cooler', 'Bulk Cooler'), ('on_farm_tank', 'On-Farm Tank'), ('can_collection', 'Can Collection'), ('milk_transfer', 'Milk Transfer'), ('silo', 'Silo')], max_length=20)),
+                ('node_id', models.PositiveIntegerField()),
+                ('volume_l', models.FloatField(default=0.0)),
+                ('fat_sum', models.FloatField(default=0.0)),
+                ('snf_sum', models.FloatField(default=0.0)),
+                ('protein_sum', models.FloatField(default=0.0)),
+                ('silo', models.ForeignKey(blank=True, help_text='For a transfer: the silo its counters were added to, so a move can take them back out.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='plants.silo')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('node_type', 'node_id'), name='qualityblend_node_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_blends, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:14
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Min
+
+
+TERMS = (
+    "base_price",
+    "added_water_max",
+    "fat_min",
+    "fat_bonus",
+    "snf_min",
+    "snf_bonus",
+    "protein_min",
+    "protein_bonus",
+    "urea_max",
+    "urea_bonus",
+    "bacteria_max",
+    "bacteria_bonus",
+    "water_penalty_per_percent",
+)
+
+
+def backfill_versions(apps, schema_editor):
+    # Earlier edits were not kept, so each route's current terms become its
+    # only version, in force since its first lot.
+    MilkPricingConfig = apps.get_model("milk", "MilkPricingConfig")
+    MilkPricingVersion = apps.get_model("milk", "MilkPricingVersion")
+    MilkLot = apps.get_model("suppliers", "MilkLot")
+
+    first_lots = dict(
+        MilkLot.objects.filter(supplier__route__isnull=False)
+        .values("supplier__route_id")
+        .annotate(first=Min("date_created"))
+        .values_list("supplier__route_id", "first")
+    )
+    MilkPricingVersion.objects.bulk_create(
+        MilkPricingVersion(
+            route_id=config.route_id,
+            effective_from=min(filter(None, [first_lots.get(config.route_id), config.updated_at.date()])),
+            **{name: getattr(config, name) for name in TERMS},
+        )
+        for config in MilkPricingConfig.objects.all()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('distribution', '0023_routeplan_routeplantrip_routeplanstop_and_more'),
+        ('milk', '0007_qualityblend'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MilkPricingVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('base_price', models.DecimalField(decimal_places=2, default=Decimal('26.00'), max_digits=8)),
+                ('added_water_max', models.FloatField(default=3.0)),
+                ('fat_min', models.FloatField(default=3.5)),
+                ('fat_bonus', models.DecimalField(decimal_places=2, default=Decimal('1.50'), max_digits=5)),
+                ('snf_min', models.FloatField(default=8.5)),
+                ('snf_bonus', models.DecimalField(decimal_places=2, default=Decimal('1.00'), max_digits=5)),
+                ('protein_min', models.FloatField(default=3.0)),
+                ('protein_bonus', models.DecimalField(decimal_places=2, default=Decimal('0.50'), max_digits=5)),
+                ('urea_max', models.FloatField(default=70.0)),
+                ('urea_bonus', models.DecimalField(decimal_places=2, default=Decimal('0.50'), max_digits=5)),
+                ('bacteria_max', models.PositiveIntegerField(default=50000)),
+                ('bacteria_bonus', models.DecimalField(decimal_places=2, default=Decimal('0.50'), max_digits=5)),
+                ('water_penalty_per_percent', models.DecimalField(decimal_places=2, default=Decimal('0.10'), max_digits=5)),
+                ('effective_from', models.DateField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('route', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pricing_versions', to='distribution.route')),
+            ],
+            options={
+                'ordering': ['route', 'effective_from'],
+                'constraints': [models.UniqueConstraint(fields=('route', 'effective_from'), name='milkpricingversion_route_from_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_versions, migrations.RunPython.noop),
+    ]
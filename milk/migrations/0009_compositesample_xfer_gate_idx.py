@@ -0,0 +1,24 @@
+# Generated by Django 5.2.4 on 2026-10-19 18:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collection_center', '0010_coldchainstate'),
+        ('distribution', '0023_routeplan_routeplantrip_routeplanstop_and_more'),
+        ('milk', '0008_milkpricingversion'),
+        ('suppliers', '0021_qualityprofile_milklot_anomaly_score'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='compositesample',
+            name='compositesample_gate_idx',
+        ),
+        migrations.AddIndex(
+            model_name='compositesample',
+            index=models.Index(fields=['milk_transfer', 'sample_type', 'passed'], name='compositesample_xfer_gate_idx'),
+        ),
+    ]
@@ -3,8 +3,13 @@ from suppliers.models import MilkLot
 from django.db.models import Q
 from decimal import Decimal
 
-class MilkPricingConfig(models.Model):
-    route = models.OneToOneField("distribution.Route", on_delete=models.CASCADE, related_name="pricing_config")
+# CompositeSample.sample_type values.
+INSTANT_GATE_TESTS = 'instant-gate tests'
+SOCIETY_TEST = 'society test'
+
+class PricingTerms(models.Model):
+    """Prices, bonuses and limits that milk.pricing.price_per_litre applies to a lot."""
+
     # Base values
     base_price = models.DecimalField(max_digits=8, decimal_places=2, default=Decimal("26.00"))
     added_water_max = models.FloatField(default=3.0)
@@ -28,12 +33,43 @@ class MilkPricingConfig(models.Model):
     # Water penalty
     water_penalty_per_percent = models.DecimalField(max_digits=5, decimal_places=2, default=Decimal("0.10"))
 
+    class Meta:
+        abstract = True
+
+
+class MilkPricingConfig(PricingTerms):
+    """The terms in force today; kept in step with the route's latest MilkPricingVersion."""
+
+    route = models.OneToOneField("distribution.Route", on_delete=models.CASCADE, related_name="pricing_config")
+
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Milk Pricing Config (Updated {self.updated_at})"
 
 
+class MilkPricingVersion(PricingTerms):
+    """
+    The terms a route paid from ``effective_from`` until the route's next
+    version. Lots are priced with the version in force on their
+    ``date_created`` (milk.pricing_history).
+    """
+
+    route = models.ForeignKey("distribution.Route", on_delete=models.CASCADE, related_name="pricing_versions")
+    effective_from = models.DateField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["route", "effective_from"]
+        constraints = [
+            models.UniqueConstraint(fields=["route", "effective_from"], name="milkpricingversion_route_from_uniq"),
+        ]
+
+    def __str__(self):
+        return f"Milk pricing for route {self.route_id} from {self.effective_from}"
+
+
 class CompositeSample(models.Model):
 
     bulk_cooler  = models.ForeignKey(
@@ -48,6 +84,12 @@ class CompositeSample(models.Model):
         'distribution.Vehicle', null=True, blank=True, on_delete=models.CASCADE,
         related_name='gateSamples'
     )
+    # The trip an instant-gate sample was drawn for, set when the sample is
+    # taken or when the tanker's arrival is recorded (MilkTransfer.link_gate_samples).
+    milk_transfer = models.ForeignKey(
+        'distribution.MilkTransfer', null=True, blank=True, on_delete=models.SET_NULL,
+        related_name='gate_samples'
+    )
 
     sample_volume_ml = models.PositiveSmallIntegerField(default=50)  
     collected_at     = models.DateTimeField(auto_now_add=True)
@@ -64,9 +106,9 @@ class CompositeSample(models.Model):
     
     sample_type = models.CharField(
         max_length=20,
-        choices=[('instant-gate tests', 'Instant-Gate Tests'),
-                 ('society test', 'Society Test')],
-        default='society test'
+        choices=[(INSTANT_GATE_TESTS, 'Instant-Gate Tests'),
+                 (SOCIETY_TEST, 'Society Test')],
+        default=SOCIETY_TEST
     )
 
     cob_test        = models.BooleanField(null=True, blank=True)  
@@ -86,6 +128,16 @@ class CompositeSample(models.Model):
         default='pending'
     )
 
+    class Meta:
+        indexes = [
+            # The instant-gate approval check (getApprovedInstantGateTransfersByPlant)
+            # looks samples up per transfer, by type and result.
+            models.Index(
+                fields=['milk_transfer', 'sample_type', 'passed'],
+                name='compositesample_xfer_gate_idx',
+            ),
+        ]
+
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
         if self.passed == 'approved':
@@ -130,3 +182,59 @@ class CompositeSample(models.Model):
         return f"Composite Sample {self.id}"
     
 
+
+
+class QualityBlend(models.Model):
+    """
+    Running volume-weighted quality counters for a collection vessel, a
+    transfer or a silo. The ``*_sum`` columns hold sum(volume_l * percent) over
+    the contributing lots, so adding lots or landing a transfer is a constant
+    number of increments and the blend is ``sum / volume_l``. Maintained by
+    milk.blending.
+    """
+
+    NODE_TYPES = [
+        ('bulk_cooler', 'Bulk Cooler'),
+        ('on_farm_tank', 'On-Farm Tank'),
+        ('can_collection', 'Can Collection'),
+        ('milk_transfer', 'Milk Transfer'),
+        ('silo', 'Silo'),
+    ]
+
+    node_type = models.CharField(max_length=20, choices=NODE_TYPES)
+    node_id = models.PositiveIntegerField()
+    volume_l = models.FloatField(default=0.0)
+    fat_sum = models.FloatField(default=0.0)
+    snf_sum = models.FloatField(default=0.0)
+    protein_sum = models.FloatField(default=0.0)
+    silo = models.ForeignKey(
+        'plants.Silo',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        help_text="For a transfer: the silo its counters were added to, so a move can take them back out.",
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['node_type', 'node_id'], name='qualityblend_node_uniq'),
+        ]
+
+    def _percent(self, total):
+        return total / self.volume_l if self.volume_l > 0 else None
+
+    @property
+    def fat_percent(self):
+        return self._percent(self.fat_sum)
+
+    @property
+    def snf_percent(self):
+        return self._percent(self.snf_sum)
+
+    @property
+    def protein_percent(self):
+        return self._percent(self.protein_sum)
+
+    def __str__(self):
+        return f"{self.node_type} {self.node_id} blend ({self.volume_l} L)"
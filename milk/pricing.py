@@ -0,0 +1,302 @@
+"""
+Milk lot pricing, and what-if simulation of pricing config changes.
+
+``price_per_litre`` is the pricing rule itself: base price, a bonus for every
+quality threshold met, a penalty per percent of added water, and rejection
+above ``added_water_max``. ``MilkLot.evaluate_and_price`` uses it when a lot is
+tested, so a simulation prices lots exactly as intake would.
+
+``simulate`` re-prices a stretch of lot history under a proposed config. The
+price per litre only depends on which of the five thresholds a lot meets and
+on its added water, so rather than loading every lot the database compares
+the thresholds and groups the lots by those outcomes, their added water
+rounded to WATER_DECIMALS places, supplier and current price bin, summing
+volume and payout: a year of a route comes back as a few hundred rows
+whatever the lot volumes. Each distinct outcome is priced once in Python,
+exactly as intake would, and applied to the group's total volume, so
+proposed payouts are rounded to the cent per group rather than per lot.
+Results are payout deltas against what was actually billed (the lots' stored
+``total_price``), per supplier and per route, plus a volume histogram of
+price per litre before and after.
+"""
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Dict, Iterable, List, Optional
+
+from django.db.models import BooleanField, Count, DecimalField, ExpressionWrapper, Q, Sum
+from django.db.models.functions import Cast, Floor, Round
+
+from dairy_project.cache import CacheNamespace, memoize
+from dairy_project.conf import AppSettings
+from distribution.models import Route
+from suppliers.models import MilkLot, Supplier
+
+from .models import MilkPricingConfig
+
+CENTS = Decimal("0.01")
+
+# MilkPricingConfig fields a proposal may change.
+CONFIG_FIELDS = (
+    "base_price",
+    "added_water_max",
+    "fat_min",
+    "fat_bonus",
+    "snf_min",
+    "snf_bonus",
+    "protein_min",
+    "protein_bonus",
+    "urea_max",
+    "urea_bonus",
+    "bacteria_max",
+    "bacteria_bonus",
+    "water_penalty_per_percent",
+)
+
+DEFAULTS = {
+    "HISTOGRAM_BIN_WIDTH": 1.0,
+    # Analysers report added water to 0.1 %; finer values would split groups
+    # without changing the penalty by a cent.
+    "WATER_DECIMALS": 1,
+}
+
+
+_setting = AppSettings("PRICING_SIMULATION", DEFAULTS)
+
+# Read for every lot priced at intake. record_version, the only writer of
+# MilkPricingConfig, invalidates it.
+config_cache = CacheNamespace("milk_pricing_config")
+
+
+@memoize(config_cache)
+def current_config(route_id: int) -> Optional[MilkPricingConfig]:
+    """The route's current config, or None; cached across workers."""
+    return MilkPricingConfig.objects.filter(route_id=route_id).first()
+
+
+def price_per_litre(config, fat, snf, protein, urea, bacteria, added_water) -> Optional[Decimal]:
+    """Price per litre of a lot under ``config``; None when the lot is rejected for added water."""
+    if added_water > config.added_water_max:
+        return None
+
+    bonus = Decimal("0.00")
+    if fat >= config.fat_min:
+        bonus += config.fat_bonus
+    if snf >= config.snf_min:
+        bonus += config.snf_bonus
+    if protein >= config.protein_min:
+        bonus += config.protein_bonus
+    if urea <= config.urea_max:
+        bonus += config.urea_bonus
+    if bacteria <= config.bacteria_max:
+        bonus += config.bacteria_bonus
+    if added_water > 0.0:
+        bonus -= config.water_penalty_per_percent * Decimal(str(added_water))
+
+    return max(config.base_price + bonus, Decimal("0.00")).quantize(CENTS, rounding=ROUND_HALF_UP)
+
+
+def lot_total(volume_l: float, price: Decimal) -> Decimal:
+    # str() so 47.3 L is 47.3, not the binary float just below it.
+    return (Decimal(str(volume_l)) * price).quantize(CENTS, rounding=ROUND_HALF_UP)
+
+
+@dataclass
+class PayoutDelta:
+    group_id: int
+    name: str
+    lots: int = 0
+    volume_l: float = 0.0
+    current_payout: Decimal = Decimal("0.00")
+    proposed_payout: Decimal = Decimal("0.00")
+    newly_rejected: int = 0
+    newly_accepted: int = 0
+
+    @property
+    def delta(self) -> Decimal:
+        return self.proposed_payout - self.current_payout
+
+
+@dataclass
+class PriceBin:
+    lower: float
+    upper: float
+    current_volume_l: float = 0.0
+    proposed_volume_l: float = 0.0
+    current_lots: int = 0
+    proposed_lots: int = 0
+
+
+@dataclass
+class PricingSimulation:
+    start: date
+    end: date
+    totals: PayoutDelta
+    suppliers: List[PayoutDelta] = field(default_factory=list)
+    routes: List[PayoutDelta] = field(default_factory=list)
+    histogram: List[PriceBin] = field(default_factory=list)
+
+
+def proposed_config(route_id: int, changes: Dict) -> MilkPricingConfig:
+    """The route's current config (or the defaults) with ``changes`` applied; not saved."""
+    config = current_config(route_id) or MilkPricingConfig(route_id=route_id)
+    for name, value in changes.items():
+        if name in CONFIG_FIELDS and value is not None:
+            setattr(config, name, value)
+    return config
+
+
+def _flags(config) -> Dict:
+    """SQL booleans for each pricing threshold met under ``config``."""
+
+    def flag(condition):
+        return ExpressionWrapper(condition, output_field=BooleanField())
+
+    return {
+        "sim_fat": flag(Q(fat_percent__gte=config.fat_min)),
+        "sim_snf": flag(Q(snf__gte=config.snf_min)),
+        "sim_protein": flag(Q(protein_percent__gte=config.protein_min)),
+        "sim_urea": flag(Q(urea_nitrogen__lte=config.urea_max)),
+        "sim_bacteria": flag(Q(bacterial_count__lte=config.bacteria_max)),
+    }
+
+
+def _price_from_flags(config, fat, snf, protein, urea, bacteria, added_water) -> Optional[Decimal]:
+    """``price_per_litre`` for a group whose threshold outcomes were computed in SQL."""
+    # Values that meet (or miss) exactly the same thresholds as the group.
+    return price_per_litre(
+        config,
+        config.fat_min if fat else float("-inf"),
+        config.snf_min if snf else float("-inf"),
+        config.protein_min if protein else float("-inf"),
+        config.urea_max if urea else float("inf"),
+        config.bacteria_max if bacteria else float("inf"),
+        added_water,
+    )
+
+
+def _histogram(current: Dict[int, List[float]], proposed: Dict[int, List[float]], width: float) -> List[PriceBin]:
+    bins = []
+    for index in sorted(set(current) | set(proposed)):
+        bins.append(
+            PriceBin(
+                lower=index * width,
+                upper=(index + 1) * width,
+                current_volume_l=current.get(index, [0.0, 0])[0],
+                current_lots=current.get(index, [0.0, 0])[1],
+                proposed_volume_l=proposed.get(index, [0.0, 0])[0],
+                proposed_lots=proposed.get(index, [0.0, 0])[1],
+            )
+        )
+    return bins
+
+
+def simulate(
+    changes: Dict,
+    route_ids: Iterable[int],
+    start: date,
+    end: date,
+    supplier_ids: Optional[Iterable[int]] = None,
+) -> PricingSimulation:
+    """
+    Re-price the lots delivered on ``route_ids`` between ``start`` and ``end``
+    with ``changes`` applied to each route's own config.
+    """
+    route_ids = list(route_ids)
+    lots = MilkLot.objects.filter(date_created__range=(start, end))
+    if supplier_ids is not None:
+        lots = lots.filter(supplier_id__in=list(supplier_ids))
+
+    width = _setting("HISTOGRAM_BIN_WIDTH")
+    totals = PayoutDelta(group_id=0, name="All routes")
+    suppliers, routes = {}, {}
+    current_bins, proposed_bins = defaultdict(lambda: [0.0, 0]), defaultdict(lambda: [0.0, 0])
+    names = dict(
+        Supplier.objects.filter(route_id__in=route_ids).values_list("pk", "user__username")
+    )
+
+    water = Round(
+        Cast("added_water_percent", DecimalField(max_digits=9, decimal_places=4)), _setting("WATER_DECIMALS")
+    )
+    price_bin = Floor(Cast("price_per_litre", DecimalField(max_digits=10, decimal_places=2)) / Decimal(str(width)))
+
+    for route in Route.objects.filter(pk__in=route_ids).order_by("pk"):
+        current = proposed_config(route.pk, {})
+        config = proposed_config(route.pk, changes)
+        prices = {}
+        # One row per supplier and combination of pricing inputs; volume and
+        # payout are summed, so a year of a route is a few hundred groups.
+        groups = (
+            lots.filter(supplier__route_id=route.pk)
+            .annotate(
+                **_flags(config),
+                sim_water=water,
+                sim_water_rejected=ExpressionWrapper(
+                    Q(added_water_percent__gt=config.added_water_max), output_field=BooleanField()
+                ),
+                sim_water_ok=ExpressionWrapper(
+                    Q(added_water_percent__lte=current.added_water_max), output_field=BooleanField()
+                ),
+                sim_current_bin=price_bin,
+            )
+            .values(
+                "supplier_id", "status", "sim_current_bin",
+                "sim_fat", "sim_snf", "sim_protein", "sim_urea", "sim_bacteria",
+                "sim_water", "sim_water_rejected", "sim_water_ok",
+            )
+            .annotate(sim_lots=Count("pk"), sim_volume=Sum("volume_l"), sim_paid=Sum("total_price"))
+            .order_by()
+        )
+        for row in groups:
+            key = (
+                row["sim_fat"], row["sim_snf"], row["sim_protein"], row["sim_urea"], row["sim_bacteria"],
+                row["sim_water"], row["sim_water_rejected"],
+            )
+            if key not in prices:
+                # Rejection is decided on the unrounded value; rounding must not push an accepted lot over.
+                prices[key] = None if key[-1] else _price_from_flags(
+                    config, *key[:5], min(float(key[5]), config.added_water_max)
+                )
+            price = prices[key]
+            rejected = row["status"] == "rejected"
+            if rejected and row["sim_water_ok"]:
+                # Rejected at intake for something other than added water; pricing cannot change that.
+                price = None
+
+            count, volume = row["sim_lots"], row["sim_volume"]
+            paid = (row["sim_paid"] or Decimal("0.00")).quantize(CENTS)
+            proposed_total = lot_total(volume, price) if price is not None else Decimal("0.00")
+
+            supplier_id = row["supplier_id"]
+            supplier = suppliers.get(supplier_id) or suppliers.setdefault(
+                supplier_id, PayoutDelta(supplier_id, names.get(supplier_id, ""))
+            )
+            route_total = routes.get(route.pk) or routes.setdefault(route.pk, PayoutDelta(route.pk, route.name))
+            for group in (totals, supplier, route_total):
+                group.lots += count
+                group.volume_l += volume
+                group.current_payout += paid
+                group.proposed_payout += proposed_total
+                if price is None and not rejected:
+                    group.newly_rejected += count
+                elif price is not None and rejected:
+                    group.newly_accepted += count
+
+            if row["sim_current_bin"] is not None and not rejected:
+                current_bin = current_bins[int(row["sim_current_bin"])]
+                current_bin[0] += volume
+                current_bin[1] += count
+            if price is not None:
+                proposed_bin = proposed_bins[int(float(price) // width)]
+                proposed_bin[0] += volume
+                proposed_bin[1] += count
+
+    return PricingSimulation(
+        start=start,
+        end=end,
+        totals=totals,
+        suppliers=sorted(suppliers.values(), key=lambda group: group.delta),
+        routes=sorted(routes.values(), key=lambda group: group.delta),
+        histogram=_histogram(current_bins, proposed_bins, width),
+    )
@@ -0,0 +1,189 @@
+"""
+Effective-dated pricing terms and point-in-time repricing.
+
+Every change to a route's pricing is kept as a MilkPricingVersion that is in
+force from its ``effective_from`` until the route's next version, unique per
+(route, effective_from). MilkPricingConfig stays the route's "current" row
+that intake and the GraphQL API read; ``record_version`` copies the version in
+force today into it after every change. A change dated in the past is a
+retroactive correction: it only covers the days up to the next later version.
+A route's first version also covers the days before it, so a lot back-dated
+past the first recorded change is priced with the oldest terms known, not
+today's.
+
+``reprice`` re-prices lots against the version in force on their
+``date_created``. Each version covers one date range of one route, so the
+range join comes down to a ``date_created`` range filter per version. The
+price is computed in the database, with the same rule as
+milk.pricing.price_per_litre, in one UPDATE per version inside one
+transaction. Months of lots are corrected without loading any of them into
+Python. Lots on paid bills keep what they were paid. Rejected lots stay
+rejected, and lots that now exceed ``added_water_max`` are rejected. Unpaid
+bills of the re-priced days are totalled again.
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import (
+    Case,
+    CharField,
+    DecimalField,
+    F,
+    FloatField,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Cast, Coalesce, Greatest, Round
+from django.utils import timezone
+
+from suppliers.models import MilkLot, PaymentBill
+
+from .models import MilkPricingConfig, MilkPricingVersion
+from .pricing import CONFIG_FIELDS, config_cache, current_config
+
+MONEY = DecimalField(max_digits=10, decimal_places=2)
+
+
+def config_on(route_id: int, day: date):
+    """
+    The version in force on ``day`` (the first version for days before it);
+    the current config, or the defaults, if the route has none.
+    """
+    versions = MilkPricingVersion.objects.filter(route_id=route_id)
+    version = (
+        versions.filter(effective_from__lte=day).order_by("-effective_from").first()
+        or versions.order_by("effective_from").first()
+    )
+    if version is not None:
+        return version
+    return current_config(route_id) or MilkPricingConfig(route_id=route_id)
+
+
+def validity(route_id: int) -> List[Tuple[MilkPricingVersion, Optional[date]]]:
+    """The route's versions with the day each stops being in force (None for the latest)."""
+    versions = list(MilkPricingVersion.objects.filter(route_id=route_id).order_by("effective_from"))
+    ends = [version.effective_from for version in versions[1:]] + [None]
+    return list(zip(versions, ends))
+
+
+@transaction.atomic
+def record_version(route_id: int, changes: Dict, effective_from: Optional[date] = None) -> MilkPricingVersion:
+    """
+    Apply ``changes`` to the terms in force on ``effective_from`` (default:
+    today) as a version starting that day, and bring the current config in
+    line with the version in force today.
+    """
+    today = timezone.localdate()
+    effective_from = effective_from or today
+    if effective_from > today:
+        raise ValueError("Pricing changes cannot take effect in the future.")
+
+    base = config_on(route_id, effective_from)
+    version = MilkPricingVersion.objects.filter(route_id=route_id, effective_from=effective_from).first()
+    if version is None:
+        version = MilkPricingVersion(
+            route_id=route_id,
+            effective_from=effective_from,
+            **{name: getattr(base, name) for name in CONFIG_FIELDS},
+        )
+    for name, value in changes.items():
+        if name in CONFIG_FIELDS and value is not None:
+            setattr(version, name, value)
+    version.save()
+
+    current = config_on(route_id, today)
+    config, _ = MilkPricingConfig.objects.get_or_create(route_id=route_id)
+    for name in CONFIG_FIELDS:
+        setattr(config, name, getattr(current, name))
+    config.save()
+    # Now for this transaction's own reads, and again once other workers can see the change.
+    config_cache.invalidate()
+    transaction.on_commit(config_cache.invalidate)
+    return version
+
+
+def _price_expression(terms):
+    """SQL for milk.pricing.price_per_litre of a non-rejected lot under ``terms``."""
+
+    def bonus(condition, amount):
+        return Case(When(condition, then=Value(amount)), default=Value(Decimal("0.00")), output_field=MONEY)
+
+    water = Cast("added_water_percent", DecimalField(max_digits=7, decimal_places=3))
+    price = (
+        Value(terms.base_price, output_field=MONEY)
+        + bonus(Q(fat_percent__gte=terms.fat_min), terms.fat_bonus)
+        + bonus(Q(snf__gte=terms.snf_min), terms.snf_bonus)
+        + bonus(Q(protein_percent__gte=terms.protein_min), terms.protein_bonus)
+        + bonus(Q(urea_nitrogen__lte=terms.urea_max), terms.urea_bonus)
+        + bonus(Q(bacterial_count__lte=terms.bacteria_max), terms.bacteria_bonus)
+        - Value(terms.water_penalty_per_percent, output_field=MONEY) * water
+    )
+    return Greatest(Round(price, 2, output_field=MONEY), Value(Decimal("0.00")), output_field=MONEY)
+
+
+def _reprice_range(version: MilkPricingVersion, start: date, end: Optional[date]) -> int:
+    lots = (
+        MilkLot.objects.filter(supplier__route_id=version.route_id, date_created__gte=start)
+        .exclude(status="rejected")
+        .exclude(bill__is_paid=True)
+    )
+    if end is not None:
+        lots = lots.filter(date_created__lt=end)
+
+    too_watery = Q(added_water_percent__gt=version.added_water_max)
+    price = _price_expression(version)
+    volume = Cast("volume_l", DecimalField(max_digits=12, decimal_places=4))
+    return lots.update(
+        status=Case(When(too_watery, then=Value("rejected")), default=F("status"), output_field=CharField()),
+        price_per_litre=Case(When(too_watery, then=Value(Decimal("0.00"))), default=price, output_field=MONEY),
+        total_price=Case(
+            When(too_watery, then=Value(Decimal("0.00"))),
+            default=Round(volume * price, 2, output_field=MONEY),
+            output_field=MONEY,
+        ),
+    )
+
+
+def _retotal_bills(route_id: int, start: date, end: date) -> int:
+    """Re-run PaymentBill.calculate_totals, set-based, for the route's unpaid bills in [start, end]."""
+    approved = MilkLot.objects.filter(
+        supplier_id=OuterRef("supplier_id"), date_created=OuterRef("date"), status="approved"
+    ).values("supplier_id")
+    return PaymentBill.objects.filter(
+        supplier__route_id=route_id, is_paid=False, date__range=(start, end)
+    ).update(
+        total_volume_l=Coalesce(
+            Subquery(approved.annotate(total=Sum("volume_l")).values("total")), Value(0.0), output_field=FloatField()
+        ),
+        total_value=Coalesce(
+            Subquery(approved.annotate(total=Sum("total_price")).values("total")),
+            Value(Decimal("0.00")),
+            output_field=MONEY,
+        ),
+    )
+
+
+@transaction.atomic
+def reprice(route_ids: List[int], start: date, end: Optional[date] = None) -> Dict[str, int]:
+    """
+    Re-price the routes' lots delivered from ``start`` to ``end`` (default:
+    today) with the versions in force on their dates. Returns the lots and bills updated.
+    """
+    end = end or timezone.localdate()
+    lots = bills = 0
+    for route_id in route_ids:
+        for index, (version, until) in enumerate(validity(route_id)):
+            # Clip the version's validity [effective_from, until) to [start, end];
+            # the first version also covers the days before it (see config_on).
+            range_start = start if index == 0 else max(version.effective_from, start)
+            range_end = min(until, end + timedelta(days=1)) if until else end + timedelta(days=1)
+            if range_start < range_end:
+                lots += _reprice_range(version, range_start, range_end)
+        bills += _retotal_bills(route_id, start, end)
+    return {"lots": lots, "bills": bills}
@@ -1,23 +1,34 @@
-from datetime import datetime
+from datetime import date, datetime, timedelta
 from typing import List, Optional
 
 import strawberry
 from strawberry.types import Info
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.utils import timezone
 
 from collection_center.models import BulkCooler
+from dairy_project.graphql_extensions.response_cache import cached_resolver
 from dairy_project.graphql_types.collection import UpdateTankerInput, UpdateTankerResponse
 from dairy_project.graphql_types.milk import (
+    BlendCheckType,
+    BlendParameterType,
     CompositeSampleInput,
     CompositeSampleType,
     MilkPricingConfigInput,
     MilkPricingConfigType,
+    MilkPricingVersionType,
+    PayoutDeltaType,
+    PriceBinType,
+    PricingSimulationType,
+    QualityBlendType,
     UpdateCompositeSampleInput,
 )
-from distribution.models import Route, Vehicle
-from milk.models import MilkPricingConfig
+from distribution.models import MilkTransfer, Route, Vehicle
+from milk.models import INSTANT_GATE_TESTS, SOCIETY_TEST, MilkPricingConfig, MilkPricingVersion
 from suppliers.models import OnFarmTank
 
+from . import blending, pricing, pricing_history
 from .models import CompositeSample
 
 
@@ -53,11 +64,92 @@ class Query:
         return qs
     
     @strawberry.field
+    @cached_resolver(MilkPricingConfig, Route)
     def milk_pricing_config(self, route_id: int) -> Optional[MilkPricingConfigType]:
         try:
-            return MilkPricingConfig.objects.get(route_id=route_id)
+            return MilkPricingConfig.objects.select_related("route").get(route_id=route_id)
         except MilkPricingConfig.DoesNotExist:
             return None
+
+    @strawberry.field
+    @cached_resolver(MilkPricingVersion)
+    def milk_pricing_history(self, route_id: int) -> List[MilkPricingVersionType]:
+        return MilkPricingVersion.objects.filter(route_id=route_id).order_by("-effective_from")
+
+    @strawberry.field
+    def pricing_simulation(
+        self,
+        proposal: MilkPricingConfigInput,
+        from_date: Optional[date] = None,
+        to_date: Optional[date] = None,
+        route_ids: Optional[List[int]] = None,
+        supplier_ids: Optional[List[int]] = None,
+    ) -> PricingSimulationType:
+        """
+        Re-price past lots with ``proposal`` applied to each route's config
+        (default: the proposal's route over the last 365 days). Nothing is saved.
+        """
+        to_date = to_date or timezone.localdate()
+        from_date = from_date or to_date - timedelta(days=365)
+        if from_date > to_date:
+            raise ValueError("fromDate must not be after toDate")
+        simulation = pricing.simulate(
+            vars(proposal), route_ids or [proposal.routeId], from_date, to_date, supplier_ids
+        )
+
+        def payout(group):
+            return PayoutDeltaType(**vars(group), delta=group.delta)
+
+        return PricingSimulationType(
+            start=simulation.start,
+            end=simulation.end,
+            totals=payout(simulation.totals),
+            suppliers=[payout(group) for group in simulation.suppliers],
+            routes=[payout(group) for group in simulation.routes],
+            histogram=[PriceBinType(**vars(bin)) for bin in simulation.histogram],
+        )
+
+    @strawberry.field
+    def quality_blend(self, node_type: str, node_id: int) -> Optional[QualityBlendType]:
+        if node_type not in blending.NODE_TYPES:
+            raise ValueError(f"Unknown node type: {node_type}")
+        blend = blending.predicted_blend(node_type, node_id)
+        if blend is None:
+            return None
+        return QualityBlendType(
+            node_type=blend.node_type,
+            node_id=blend.node_id,
+            volume_l=blend.volume_l,
+            fat_percent=blend.fat_percent,
+            snf_percent=blend.snf_percent,
+            protein_percent=blend.protein_percent,
+        )
+
+    @strawberry.field
+    def composite_sample_blend_check(self, sample_id: int) -> Optional[BlendCheckType]:
+        try:
+            sample = CompositeSample.objects.get(id=sample_id)
+        except CompositeSample.DoesNotExist:
+            raise ValueError("Sample not found")
+        check = blending.check_sample(sample)
+        if check is None:
+            return None
+        return BlendCheckType(
+            sample_id=check.sample_id,
+            node_type=check.node_type,
+            node_id=check.node_id,
+            volume_l=check.volume_l,
+            parameters=[
+                BlendParameterType(
+                    parameter=parameter,
+                    predicted=check.predicted[parameter],
+                    measured=check.measured[parameter],
+                    anomalous=parameter in check.anomalies,
+                )
+                for parameter in check.predicted
+            ],
+            anomalies=check.anomalies,
+        )
     
     
 @strawberry.type
@@ -79,16 +171,19 @@ class Mutation:
             on_farm_tank.is_stirred = input.is_stirred
             on_farm_tank.save(update_fields=["is_stirred"])
         
+        milk_transfer = None
         if not bulk_cooler and not on_farm_tank:
-            sample_type_value = 'instant-gate tests'
+            sample_type_value = INSTANT_GATE_TESTS
+            milk_transfer = MilkTransfer.for_gate_sample(vehicle.id, timezone.now())
         else:
-            sample_type_value = 'society test'
+            sample_type_value = SOCIETY_TEST
 
 
         sample = CompositeSample.objects.create(
             bulk_cooler=bulk_cooler,
             on_farm_tank=on_farm_tank,
             vehicle=vehicle,
+            milk_transfer=milk_transfer,
             remark=input.remark,
             sample_volume_ml=input.sample_volume_ml or 50,
             temperature_c=input.temperature_c or 4.0,
@@ -128,6 +223,7 @@ class Mutation:
                 setattr(sample, field, value)
 
         sample.save()
+        blending.flag_sample(sample)
 
         return CompositeSampleType(
             id=sample.id,
@@ -195,14 +291,24 @@ class Mutation:
         return UpdateTankerResponse(success=True, message=f"{input.type.replace('_',' ').title()} with ID {input.id} updated successfully.")
     
     @strawberry.mutation
-    def update_milk_pricing_config(self, info: Info, input: MilkPricingConfigInput) -> MilkPricingConfigType:
+    def update_milk_pricing_config(
+        self,
+        info: Info,
+        input: MilkPricingConfigInput,
+        effective_from: Optional[date] = None,
+        reprice: bool = False,
+    ) -> MilkPricingConfigType:
+        """
+        Record the change as a pricing version from ``effective_from`` (default
+        today). With ``reprice``, lots from that day on are re-priced with the
+        versions in force on their dates.
+        """
         route = Route.objects.get(id=input.routeId)
-        config, _ = MilkPricingConfig.objects.get_or_create(route=route)
-        for field, value in input.__dict__.items():
-            if value is not None:
-                setattr(config, field, value)
-        config.save()
-        return config
+        with transaction.atomic():
+            version = pricing_history.record_version(route.pk, vars(input), effective_from)
+            if reprice:
+                pricing_history.reprice([route.pk], version.effective_from)
+        return MilkPricingConfig.objects.select_related("route").get(route=route)
 
 schema = strawberry.Schema(query=Query, mutation=Mutation)
 
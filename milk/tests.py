@@ -1,3 +1,305 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from collection_center.models import BulkCooler
+from distribution.models import Distributor, MilkTransfer, Route, Vehicle
+from plants.models import Plant, Silo
+from suppliers.models import MilkLot, PaymentBill
+from suppliers.storage import assign_lots
+from suppliers.tests import QUALITY, make_lots, make_supplier
+
+from .blending import MILK_TRANSFER, SILO, blend_transfer, flag_sample, predicted_blend
+from .models import SOCIETY_TEST, CompositeSample, MilkPricingConfig, MilkPricingVersion, QualityBlend
+from .pricing import CONFIG_FIELDS, config_cache, lot_total, price_per_litre, proposed_config, simulate
+from .pricing_history import config_on, record_version, reprice
+
+# (fat, added water, volume): meets or misses the fat bonus, with and without a water penalty.
+LOTS = [(4.0, 0.0, 50.0), (3.2, 1.3, 47.3), (4.1, 2.5, 38.6)]
+
+
+def expected_price(terms, fat, water):
+    return price_per_litre(
+        terms,
+        fat,
+        QUALITY["snf"],
+        QUALITY["protein_percent"],
+        QUALITY["urea_nitrogen"],
+        QUALITY["bacterial_count"],
+        water,
+    )
+
+
+class RepriceTests(TestCase):
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.route = Route.objects.create(name="North")
+        self.supplier = make_supplier("farmer", self.route)
+        self.first = record_version(self.route.pk, {}, effective_from=self.today - timedelta(days=10))
+
+    def _deliver(self, day, bill=None):
+        """Lots priced at intake on ``day``, as MilkLot.evaluate_and_price does."""
+        lots = []
+        for fat, water, volume in LOTS:
+            lot = MilkLot(
+                supplier=self.supplier,
+                volume_l=volume,
+                bill=bill,
+                **{**QUALITY, "fat_percent": fat, "added_water_percent": water},
+            )
+            lot.evaluate_and_price()
+            if lot.status != "rejected":
+                lot.status = "approved"
+            lots.append(lot)
+        lots = MilkLot.objects.bulk_create(lots)
+        MilkLot.objects.filter(pk__in=[lot.pk for lot in lots]).update(date_created=day)
+        return lots
+
+    def _bill(self, day, is_paid=False):
+        return PaymentBill.objects.create(
+            supplier=self.supplier, date=day, total_volume_l=0.0, total_value=Decimal("0.00"), is_paid=is_paid
+        )
+
+    def _prices(self):
+        return {
+            pk: (status, price, total)
+            for pk, status, price, total in MilkLot.objects.values_list(
+                "pk", "status", "price_per_litre", "total_price"
+            )
+        }
+
+    def test_unchanged_terms_keep_the_intake_prices(self):
+        for days_ago in (10, 5, 1):
+            self._deliver(self.today - timedelta(days=days_ago))
+        before = self._prices()
+
+        result = reprice([self.route.pk], self.today - timedelta(days=10))
+
+        self.assertEqual(result["lots"], 9)
+        self.assertEqual(self._prices(), before)
+
+    def test_retroactive_change_reprices_only_the_days_it_covers(self):
+        earlier = self._deliver(self.today - timedelta(days=10))
+        later = self._deliver(self.today - timedelta(days=5))
+        before = self._prices()
+
+        version = record_version(
+            self.route.pk,
+            {"base_price": Decimal("28.00"), "added_water_max": 2.0},
+            effective_from=self.today - timedelta(days=5),
+        )
+        reprice([self.route.pk], self.today - timedelta(days=10))
+
+        after = self._prices()
+        for lot in earlier:
+            self.assertEqual(after[lot.pk], before[lot.pk])
+        for lot, (fat, water, volume) in zip(later[:2], LOTS):
+            price = expected_price(version, fat, water)
+            self.assertEqual(after[lot.pk], ("approved", price, lot_total(volume, price)))
+        self.assertEqual(after[later[2].pk], ("rejected", Decimal("0.00"), Decimal("0.00")))
+
+    def test_lots_on_paid_bills_keep_what_they_were_paid(self):
+        day = self.today - timedelta(days=5)
+        paid = self._deliver(day, bill=self._bill(day, is_paid=True))
+        before = self._prices()
+
+        record_version(self.route.pk, {"base_price": Decimal("28.00"), "added_water_max": 2.0}, effective_from=day)
+        reprice([self.route.pk], day)
+
+        after = self._prices()
+        for lot in paid:
+            self.assertEqual(after[lot.pk], before[lot.pk])
+
+    def test_unpaid_bills_are_totalled_again(self):
+        day = self.today - timedelta(days=5)
+        bill = self._bill(day)
+        self._deliver(day, bill=bill)
+
+        record_version(self.route.pk, {"base_price": Decimal("28.00")}, effective_from=day)
+        result = reprice([self.route.pk], day)
+
+        bill.refresh_from_db()
+        approved = MilkLot.objects.filter(bill=bill, status="approved")
+        self.assertEqual(result["bills"], 1)
+        self.assertEqual(bill.total_value, sum(lot.total_price for lot in approved))
+        self.assertEqual(bill.total_volume_l, sum(lot.volume_l for lot in approved))
+
+    def test_days_before_the_first_version_use_it_not_todays_terms(self):
+        back_dated = self.today - timedelta(days=30)
+        record_version(self.route.pk, {"base_price": Decimal("30.00")})
+        [lot, *_] = self._deliver(back_dated)
+
+        self.assertEqual(config_on(self.route.pk, back_dated).pk, self.first.pk)
+        reprice([self.route.pk], back_dated)
+
+        lot.refresh_from_db()
+        fat, water, _ = LOTS[0]
+        self.assertEqual(lot.price_per_litre, expected_price(self.first, fat, water))
+
+
+class SimulateTests(TestCase):
+    # (fat, added water, volume), two lots per combination with different volumes.
+    LOTS = [(4.0, 0.0, 50.0), (4.0, 0.0, 38.0), (3.2, 1.3, 47.0), (3.2, 1.3, 20.0), (4.1, 2.5, 40.0)]
+
+    def setUp(self):
+        config_cache.invalidate()
+        self.today = timezone.localdate()
+        self.route = Route.objects.create(name="North")
+        self.supplier = make_supplier("farmer", self.route)
+        record_version(self.route.pk, {"added_water_max": 3.0})
+        lots = []
+        for fat, water, volume in self.LOTS:
+            lot = MilkLot(
+                supplier=self.supplier, volume_l=volume, **{**QUALITY, "fat_percent": fat, "added_water_percent": water}
+            )
+            lot.evaluate_and_price()
+            lots.append(lot)
+        MilkLot.objects.bulk_create(lots)
+
+    def _simulate(self, changes):
+        return simulate(changes, [self.route.pk], self.today, self.today)
+
+    def _expected_payout(self, changes):
+        config = proposed_config(self.route.pk, changes)
+        total = Decimal("0.00")
+        for fat, water, volume in self.LOTS:
+            price = expected_price(config, fat, water)
+            if price is not None:
+                total += lot_total(volume, price)
+        return total
+
+    def test_unchanged_terms_pay_what_intake_priced(self):
+        result = self._simulate({})
+
+        self.assertEqual(result.totals.lots, 5)
+        self.assertEqual(result.totals.volume_l, sum(volume for _, _, volume in self.LOTS))
+        self.assertEqual(result.totals.current_payout, self._expected_payout({}))
+        self.assertEqual(result.totals.delta, Decimal("0.00"))
+
+    def test_proposed_terms_match_price_per_litre(self):
+        changes = {"base_price": Decimal("28.00"), "fat_min": 3.0, "water_penalty_per_percent": Decimal("0.75")}
+
+        result = self._simulate(changes)
+
+        self.assertEqual(result.totals.proposed_payout, self._expected_payout(changes))
+        self.assertEqual(result.totals.newly_rejected, 0)
+
+    def test_a_lower_water_limit_rejects_lots(self):
+        result = self._simulate({"added_water_max": 2.0})
+
+        self.assertEqual(result.totals.newly_rejected, 1)
+        self.assertEqual(result.totals.proposed_payout, self._expected_payout({"added_water_max": 2.0}))
+        self.assertEqual(sum(price_bin.proposed_volume_l for price_bin in result.histogram), 155.0)
+        self.assertEqual(sum(price_bin.current_volume_l for price_bin in result.histogram), 195.0)
+
+
+class MilkPricingConfigAdminTests(TestCase):
+    def test_saving_records_a_version(self):
+        route = Route.objects.create(name="North")
+        record_version(route.pk, {}, effective_from=timezone.localdate() - timedelta(days=10))
+        config = MilkPricingConfig.objects.get(route=route)
+        self.client.force_login(User.objects.create_superuser("admin", "", "password"))
+
+        data = {name: getattr(config, name) for name in CONFIG_FIELDS}
+        data["base_price"] = "27.50"
+        response = self.client.post(reverse("admin:milk_milkpricingconfig_change", args=[config.pk]), data)
+
+        self.assertEqual(response.status_code, 302)
+        version = MilkPricingVersion.objects.get(route=route, effective_from=timezone.localdate())
+        self.assertEqual(version.base_price, Decimal("27.50"))
+        config.refresh_from_db()
+        self.assertEqual(config.base_price, Decimal("27.50"))
+
+
+class QualityBlendTests(TestCase):
+    def setUp(self):
+        route = Route.objects.create(name="North")
+        supplier = make_supplier("farmer", route)
+        self.cooler = BulkCooler.objects.create(route=route, name="Cooler-1", capacity_liters=1000)
+        # 100 L at 4.0 % fat and 50 L at 3.1 %: a 3.7 % blend.
+        lots = make_lots(supplier, 1, volume_l=100.0) + make_lots(supplier, 1, fat_percent=3.1)
+        assign_lots(self.cooler, [lot.pk for lot in lots])
+        self.supplier = supplier
+        plant = Plant.objects.create(name="Main", location="", capacity=10000)
+        self.silos = [
+            Silo.objects.create(plant=plant, name=f"Silo-{number}", code=f"S-{number}", capacity_liters=10000)
+            for number in range(2)
+        ]
+        self.transfer = MilkTransfer.objects.create(
+            vehicle=Vehicle.objects.create(
+                distributor=Distributor.objects.create(address=""), name="Tanker", vehicle_id="KA-01-1234"
+            ),
+            bulk_cooler=self.cooler,
+            total_volume=150,
+        )
+
+    def _sample(self, **results):
+        values = {"fat_percent": 3.7, "snf_percent": QUALITY["snf"], "protein_percent": QUALITY["protein_percent"]}
+        return CompositeSample.objects.create(
+            bulk_cooler=self.cooler, sample_type=SOCIETY_TEST, **{**values, **results}
+        )
+
+    def _notifications(self):
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)("notifications", channel)
+        self.addCleanup(async_to_sync(layer.group_discard), "notifications", channel)
+        return layer, channel
+
+    def test_the_vessel_blend_is_volume_weighted(self):
+        blend = predicted_blend("bulk_cooler", self.cooler.pk)
+
+        self.assertEqual(blend.volume_l, 150.0)
+        self.assertAlmostEqual(blend.fat_percent, 3.7)
+        self.assertAlmostEqual(blend.snf_percent, QUALITY["snf"])
+
+    def test_later_lots_update_the_running_sums(self):
+        assign_lots(self.cooler, [lot.pk for lot in make_lots(self.supplier, 1, volume_l=150.0, fat_percent=4.3)])
+
+        blend = predicted_blend("bulk_cooler", self.cooler.pk)
+        self.assertEqual(blend.volume_l, 300.0)
+        self.assertAlmostEqual(blend.fat_percent, 4.0)
+        # The cooler's transfer was re-blended with it.
+        self.assertEqual(predicted_blend(MILK_TRANSFER, self.transfer.pk).volume_l, 300.0)
+
+    def test_a_transfer_moved_between_silos_is_counted_once(self):
+        for silo in self.silos:
+            self.transfer.silo = silo
+            self.transfer.save()
+            blend_transfer(self.transfer)
+        blend_transfer(self.transfer)
+
+        first, second = (QualityBlend.objects.get(node_type=SILO, node_id=silo.pk) for silo in self.silos)
+        self.assertAlmostEqual(first.volume_l, 0.0)
+        self.assertAlmostEqual(first.fat_sum, 0.0)
+        self.assertEqual(second.volume_l, 150.0)
+        self.assertAlmostEqual(second.fat_percent, 3.7)
+
+    def test_a_sample_within_tolerance_is_not_flagged(self):
+        with mock.patch("milk.blending.get_channel_layer") as channel_layer:
+            check = flag_sample(self._sample(fat_percent=3.9))
+
+        self.assertEqual(check.anomalies, [])
+        self.assertAlmostEqual(check.predicted["fat"], 3.7)
+        channel_layer.assert_not_called()
+
+    def test_a_sample_out_of_tolerance_is_broadcast(self):
+        layer, channel = self._notifications()
+
+        check = flag_sample(self._sample(fat_percent=4.2, protein_percent=QUALITY["protein_percent"] - 0.5))
+
+        self.assertEqual(check.anomalies, ["fat", "protein"])
+        message = async_to_sync(layer.receive)(channel)["message"]
+        self.assertIn("fat 4.20% (expected 3.70%)", message)
+
+    def test_a_sample_without_a_blend_is_not_checked(self):
+        sample = CompositeSample.objects.create(sample_type=SOCIETY_TEST, fat_percent=4.0)
 
-# Create your tests here.
+        self.assertIsNone(flag_sample(sample))
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-19 16:38
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+
+def backfill_collection_day(apps, schema_editor):
+    Silo = apps.get_model("plants", "Silo")
+    Silo.objects.update(collection_day=TruncDate("created_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plants', '0009_remove_silo_transfer_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='silo',
+            name='collection_day',
+            field=models.DateField(default=django.utils.timezone.localdate, help_text='Collection day this vessel record belongs to; one generation per day.'),
+        ),
+        migrations.RunPython(backfill_collection_day, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='silo',
+            index=models.Index(fields=['plant', 'collection_day'], name='silo_plant_day_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plants', '0010_silo_collection_day_silo_silo_plant_day_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plant',
+            name='latitude',
+            field=models.FloatField(blank=True, help_text='Plant location, used for route planning', null=True),
+        ),
+        migrations.AddField(
+            model_name='plant',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
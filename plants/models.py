@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from distribution.models import Route
 from django.contrib.auth.models import User
 from distribution.models import MilkTransfer
@@ -27,6 +28,8 @@ class Employee(models.Model):
 class Plant(models.Model):
     name = models.CharField(max_length=100, unique=True)  
     location = models.CharField(max_length=200)  
+    latitude = models.FloatField(null=True, blank=True, help_text="Plant location, used for route planning")
+    longitude = models.FloatField(null=True, blank=True)
     capacity = models.DecimalField(max_digits=10, decimal_places=2, help_text="Daily processing capacity in liters")
     contact_persons = models.ManyToManyField(
         "Employee",
@@ -79,6 +82,15 @@ class Silo(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    collection_day = models.DateField(
+        default=timezone.localdate,
+        help_text="Collection day this vessel record belongs to; one generation per day."
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["plant", "collection_day"], name="silo_plant_day_idx"),
+        ]
 
     def update_current_volume(self):
         total = MilkTransfer.objects.filter(
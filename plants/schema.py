@@ -3,21 +3,27 @@ from datetime import date
 from typing import List
 
 import strawberry
+from django.contrib.auth.models import User
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
-from django.db.models import Max, Sum
+from django.db.models import Subquery, Sum
 from django.utils import timezone
 from graphql import GraphQLError
 from strawberry.types import Info
 from strawberry_django import field
 
+from dairy_project.graphql_extensions.query_optimizer import optimize
+from dairy_project.graphql_extensions.response_cache import cached_resolver
 from dairy_project.graphql_types.billing import BillSummaryType
 from dairy_project.graphql_types.employees import EmployeeType
 from dairy_project.graphql_types.milk import MilkLotVolumeStatType
-from dairy_project.graphql_types.plants import PlantType, SiloType
+from dairy_project.graphql_types.plants import PlantType, SiloFillDayType, SiloType
 from dairy_project.graphql_types.routes import RouteVolumeStats
 from dairy_project.graphql_types.suppliers import SupplierVolumeStatType
-from distribution.models import MilkTransfer
-from plants.models import Employee, Plant, Silo
+from distribution import traceability
+from distribution.models import MilkTransfer, Route
+from milk import blending
+from plants.models import Employee, Plant, Role, Silo
+from suppliers import forecasting
 from suppliers.models import MilkLot, PaymentBill
 
 
@@ -116,42 +122,47 @@ class Query:
         ]
 
     @field
+    @cached_resolver(Employee, Role, User, Route)
     def testers(self) -> List[EmployeeType]:
-        return Employee.objects.filter(role__name="tester")
+        return (
+            Employee.objects.filter(role__name="tester")
+            .select_related("role", "user")
+            .prefetch_related("routes")
+        )
     
     @field
+    @cached_resolver(Employee, Role, User, Route)
     def employees(self) -> List[EmployeeType]:
-        return Employee.objects.select_related("role", "user").all()
+        return Employee.objects.select_related("role", "user").prefetch_related("routes").all()
 
     @strawberry.field
+    @cached_resolver(Plant)
     def plants(self) -> List[PlantType]:
         return Plant.objects.all()
     
     @strawberry.field
     def silos_by_plant(self, info: Info, plant_id: int) -> list[SiloType]:
         try:
-            latest_datetime = (
-                Silo.objects
-                .filter(plant_id=plant_id)
-                .aggregate(latest=Max('created_at'))['latest']
-            )
-
-            if not latest_datetime:
-                return []
-
-            latest_date = latest_datetime.date()
-
-
-            silos = Silo.objects.filter(
-                plant_id=plant_id,
-                created_at__date=latest_date
+            plant_silos = Silo.objects.filter(plant_id=plant_id)
+            latest_day = plant_silos.order_by('-collection_day').values('collection_day')[:1]
+            silos = plant_silos.filter(
+                collection_day=Subquery(latest_day)
             ).select_related('last_cleaned_by', 'plant').order_by('-created_at')
 
-            return list(silos)
+            return list(optimize(silos, info))
 
         except Exception as e:
             print(f"Error in silos_by_plant: {e}") 
             return []
+
+    @strawberry.field
+    def silo_fill_forecast(self, plant_id: int, days: int = 7) -> List[SiloFillDayType]:
+        if not 1 <= days <= 31:
+            raise GraphQLError("days must be between 1 and 31.")
+        try:
+            return [SiloFillDayType(**vars(day)) for day in forecasting.silo_fill_forecast(plant_id, days)]
+        except Plant.DoesNotExist:
+            raise GraphQLError("Plant not found")
     
 @strawberry.type
 class Mutation:
@@ -172,6 +183,8 @@ class Mutation:
 
             transfer.emptied_at = timezone.now()
             transfer.save(update_fields=["emptied_at"])
+            traceability.propagate(transfer)
+            blending.blend_transfer(transfer)
             return f"Silo '{silo.name}' assigned to transfer {transfer.id}. Current silo volume: {silo.current_volume}L"
 
         except ObjectDoesNotExist as e:
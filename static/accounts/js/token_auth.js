@@ -3,7 +3,28 @@
 let ACCESS_TOKEN = null;
 
 //================================================ Normal GraphQL call function ============================================================================
+// Sends automatic persisted queries: the sha256 hash goes first (queries over GET, cacheable when GRAPHQL_GET_MAX_AGE is set),
+// and the full document is only sent when the server answers PersistedQueryNotFound.
 async function callGraphQL(query, variables = {}) {
+    const hash = await sha256Hex(query);
+    if (!hash) {
+        return postGraphQL({ query, variables });
+    }
+
+    const extensions = { persistedQuery: { version: 1, sha256Hash: hash } };
+    const isMutation = query.trim().startsWith("mutation");
+
+    let result = isMutation
+        ? await postGraphQL({ variables, extensions })
+        : await getGraphQL({ variables, extensions });
+
+    if (result.errors && result.errors.some(e => e.message === "PersistedQueryNotFound")) {
+        result = await postGraphQL({ query, variables, extensions });
+    }
+    return result;
+}
+
+async function postGraphQL(body) {
     const response = await fetch("/graphql/", {
         method: "POST",
         credentials: "include", 
@@ -11,12 +32,34 @@ async function callGraphQL(query, variables = {}) {
             "Content-Type": "application/json",
             "X-CSRFToken": getCookie('csrftoken'),
         },
-        body: JSON.stringify({ query, variables }),
+        body: JSON.stringify(body),
     });
 
     return response.json();
 }
 
+async function getGraphQL({ variables, extensions }) {
+    const params = new URLSearchParams({
+        variables: JSON.stringify(variables),
+        extensions: JSON.stringify(extensions),
+    });
+    const response = await fetch(`/graphql/?${params}`, {
+        method: "GET",
+        credentials: "include",
+        headers: { "Accept": "application/json" },
+    });
+
+    return response.json();
+}
+
+async function sha256Hex(text) {
+    if (!window.crypto || !window.crypto.subtle) {
+        return null;  // not a secure context, fall back to sending the full query
+    }
+    const digest = await window.crypto.subtle.digest("SHA-256", new TextEncoder().encode(text));
+    return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, "0")).join("");
+}
+
 // ===================================================== fetch cookie ======================================================================
 function getCookie(name) {
     let cookieValue = null;
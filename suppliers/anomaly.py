@@ -0,0 +1,262 @@
+"""
+Multivariate anomaly screening of incoming milk lots.
+
+``MilkLot.evaluate_and_price`` only checks fixed thresholds. Screening also
+compares each new lot with what its own supplier, and its route, usually
+deliver. Every supplier and route keeps a QualityProfile: an exponentially
+weighted mean and covariance of FEATURES (fat, SNF, lactose, total solids and
+added water). A lot is scored by its squared Mahalanobis distance from a
+profile. That distance is chi-square distributed with five degrees of freedom
+for normal milk, so THRESHOLD = 20.5 lets through all but 0.1% of normal lots.
+Watering, skimming or adding solids shifts several of these features against
+their usual correlation, and the score picks that up even when each value
+alone still passes the pricing thresholds.
+
+Lots that score above THRESHOLD against their supplier's profile or their
+route's profile are marked ``needs_retest`` before they are pooled into a
+cooler. Profiles are only used once they have seen MIN_LOTS lots.
+
+``screen`` handles a whole batch with one query for the suppliers' routes,
+one for the profiles and a few bulk writes. Each profile's covariance is factorised once per batch, so scoring a
+lot costs a few dozen float operations. Lots that pass are then folded into
+both profiles in O(1) per lot. For the first 1/DECAY lots every lot has equal
+weight, which is plain Welford; after that older lots fade out. A flagged
+lot is folded in as if it lay on the THRESHOLD boundary, in the same
+direction: a single adulterated delivery barely moves the profile, while a
+genuine change in a herd's milk (feed, season) is followed within a few dozen
+lots instead of being flagged forever. Rejected lots are never folded in.
+
+``rebuild`` replays all history (``manage.py rebuild_quality_profiles``), for
+the first deployment or after changing DECAY.
+"""
+import math
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import Q
+
+from dairy_project.conf import AppSettings
+
+from .models import MilkLot, QualityProfile, Supplier
+
+SUPPLIER = "supplier"
+ROUTE = "route"
+
+FEATURES = ("fat_percent", "snf", "lactose_percent", "total_solids", "added_water_percent")
+
+DEFAULTS = {
+    "THRESHOLD": 20.5,
+    "MIN_LOTS": 20,
+    "DECAY": 0.02,
+    # Added to each variance: the analyser's repeatability, so a supplier with
+    # very uniform milk is not flagged for measurement noise.
+    "MIN_VARIANCE": 0.01,
+}
+
+
+_setting = AppSettings("QUALITY_SCREENING", DEFAULTS)
+
+
+@dataclass
+class LotScore:
+    lot_id: int
+    supplier_score: Optional[float]
+    route_score: Optional[float]
+    flagged: bool
+    reason: str = ""
+
+
+def _vector(lot) -> List[float]:
+    return [float(getattr(lot, name) or 0.0) for name in FEATURES]
+
+
+def _cholesky(covariance: List[List[float]], ridge: float) -> Optional[List[List[float]]]:
+    """Lower-triangular L with L L^T = covariance + ridge * I; None if not positive definite."""
+    size = len(covariance)
+    lower = [[0.0] * size for _ in range(size)]
+    for i in range(size):
+        for j in range(i + 1):
+            total = covariance[i][j] + (ridge if i == j else 0.0)
+            total -= sum(lower[i][k] * lower[j][k] for k in range(j))
+            if i == j:
+                if total <= 0.0:
+                    return None
+                lower[i][i] = math.sqrt(total)
+            else:
+                lower[i][j] = total / lower[j][j]
+    return lower
+
+
+def _mahalanobis(lower: List[List[float]], mean: List[float], values: List[float]) -> float:
+    """Squared distance: |L^-1 (x - mean)|^2 by forward substitution."""
+    solved = []
+    total = 0.0
+    for i, row in enumerate(lower):
+        value = values[i] - mean[i] - sum(row[k] * solved[k] for k in range(i))
+        value /= row[i]
+        solved.append(value)
+        total += value * value
+    return total
+
+
+def _furthest_feature(profile: QualityProfile, values: List[float]) -> str:
+    """The feature furthest from the profile mean in standard deviations, for the retest reason."""
+    ridge = _setting("MIN_VARIANCE")
+    deviations = [
+        (abs(value - mean) / math.sqrt(profile.covariance[i][i] + ridge), name, value, mean)
+        for i, (name, value, mean) in enumerate(zip(FEATURES, values, profile.mean))
+    ]
+    _, name, value, mean = max(deviations)
+    return f"{name} {value:g} vs usual {mean:.2f}"
+
+
+def _fold(profile: QualityProfile, values: List[float], score: Optional[float] = None) -> None:
+    """
+    Exponentially weighted update of mean and covariance (Welford while count < 1/DECAY).
+    A lot scoring above THRESHOLD is pulled back onto the THRESHOLD boundary first.
+    """
+    profile.count += 1
+    weight = max(1.0 / profile.count, _setting("DECAY"))
+    shrink = 1.0
+    if score is not None and score > _setting("THRESHOLD"):
+        shrink = math.sqrt(_setting("THRESHOLD") / score)
+    diff = [(value - mean) * shrink for value, mean in zip(values, profile.mean)]
+    profile.mean = [mean + weight * d for mean, d in zip(profile.mean, diff)]
+    profile.covariance = [
+        [(1.0 - weight) * (cell + weight * di * dj) for cell, dj in zip(row, diff)]
+        for row, di in zip(profile.covariance, diff)
+    ]
+
+
+def _empty(scope: str, scope_id: int) -> QualityProfile:
+    size = len(FEATURES)
+    return QualityProfile(
+        scope=scope,
+        scope_id=scope_id,
+        count=0,
+        mean=[0.0] * size,
+        covariance=[[0.0] * size for _ in range(size)],
+    )
+
+
+def _score(profile: Optional[QualityProfile], factors: Dict, values: List[float]) -> Optional[float]:
+    if profile is None or profile.count < _setting("MIN_LOTS"):
+        return None
+    key = (profile.scope, profile.scope_id)
+    if key not in factors:
+        factors[key] = _cholesky(profile.covariance, _setting("MIN_VARIANCE"))
+    if factors[key] is None:
+        return None
+    return _mahalanobis(factors[key], profile.mean, values)
+
+
+@transaction.atomic
+def screen(lots: Iterable[MilkLot], save: bool = True) -> List[LotScore]:
+    """
+    Score new lots against their supplier and route profiles, flag the outliers
+    for retest and fold every lot into both profiles. Rejected lots are skipped.
+    With ``save=False`` the lots' fields are only set, for lots about to be
+    inserted; the profiles are saved either way.
+    """
+    rows = [
+        (lot, lot.supplier_id, route_id, _vector(lot))
+        for lot, route_id in _with_routes(lots)
+        if lot.status != "rejected"
+    ]
+    if not rows:
+        return []
+
+    profiles = _load_profiles(rows)
+    threshold = _setting("THRESHOLD")
+    factors = {}
+
+    scores, flagged, passed = [], [], []
+    for lot, supplier_id, route_id, values in rows:
+        supplier_profile = profiles.get((SUPPLIER, supplier_id))
+        route_profile = profiles.get((ROUTE, route_id)) if route_id else None
+        supplier_score = _score(supplier_profile, factors, values)
+        route_score = _score(route_profile, factors, values)
+        score = LotScore(lot.pk, supplier_score, route_score, flagged=False)
+
+        if supplier_score is not None and supplier_score > threshold:
+            score.reason = (
+                f"Quality unlike this supplier's milk (score {supplier_score:.1f}): "
+                f"{_furthest_feature(supplier_profile, values)}"
+            )
+        elif route_score is not None and route_score > threshold:
+            score.reason = (
+                f"Quality unlike this route's milk (score {route_score:.1f}): "
+                f"{_furthest_feature(route_profile, values)}"
+            )
+
+        if score.reason:
+            score.flagged = True
+            lot.needs_retest = True
+            lot.retest_reason = score.reason[:255]
+            flagged.append(lot)
+        else:
+            passed.append(lot)
+        for key, key_score in (((SUPPLIER, supplier_id), supplier_score), ((ROUTE, route_id), route_score)):
+            if key[1]:
+                profile = profiles.get(key) or profiles.setdefault(key, _empty(*key))
+                _fold(profile, values, key_score)
+        lot.anomaly_score = max((s for s in (supplier_score, route_score) if s is not None), default=None)
+        scores.append(score)
+
+    if save:
+        MilkLot.objects.bulk_update(flagged, ["needs_retest", "retest_reason", "anomaly_score"], batch_size=500)
+        MilkLot.objects.bulk_update(passed, ["anomaly_score"], batch_size=500)
+    _save_profiles(profiles)
+    return scores
+
+
+def _with_routes(lots: Iterable[MilkLot]) -> Iterable[Tuple[MilkLot, Optional[int]]]:
+    """Pair each lot with its supplier's current route, looked up in one query."""
+    lots = list(lots)
+    routes = dict(
+        Supplier.objects.filter(pk__in={lot.supplier_id for lot in lots}).values_list("pk", "route_id")
+    )
+    return [(lot, routes.get(lot.supplier_id)) for lot in lots]
+
+
+def _load_profiles(rows) -> Dict[Tuple[str, int], QualityProfile]:
+    supplier_ids = {supplier_id for _, supplier_id, _, _ in rows}
+    route_ids = {route_id for _, _, route_id, _ in rows if route_id}
+    profiles = QualityProfile.objects.select_for_update().filter(
+        Q(scope=SUPPLIER, scope_id__in=supplier_ids) | Q(scope=ROUTE, scope_id__in=route_ids)
+    )
+    return {(profile.scope, profile.scope_id): profile for profile in profiles}
+
+
+def _save_profiles(profiles: Dict[Tuple[str, int], QualityProfile]) -> None:
+    # One upsert for new and existing profiles: far cheaper than a bulk_update,
+    # which builds a CASE per field per row. A profile another batch created
+    # since _load_profiles is updated instead of failing on the unique constraint.
+    QualityProfile.objects.bulk_create(
+        profiles.values(),
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=["scope", "scope_id"],
+        update_fields=["count", "mean", "covariance", "updated_at"],
+    )
+
+
+@transaction.atomic
+def rebuild() -> int:
+    """Replay every non-rejected lot in delivery order; returns the number of profiles."""
+    QualityProfile.objects.all().delete()
+    profiles = {}
+    lots = (
+        MilkLot.objects.exclude(status="rejected")
+        .order_by("date_created", "pk")
+        .values_list("supplier_id", "supplier__route_id", *FEATURES)
+    )
+    for supplier_id, route_id, *values in lots.iterator(chunk_size=2000):
+        values = [float(value or 0.0) for value in values]
+        for key in ((SUPPLIER, supplier_id), (ROUTE, route_id)):
+            if key[1]:
+                profile = profiles.get(key) or profiles.setdefault(key, _empty(*key))
+                _fold(profile, values, _score(profile, {}, values))
+    QualityProfile.objects.bulk_create(profiles.values(), batch_size=500)
+    return len(profiles)
@@ -0,0 +1,245 @@
+"""
+Daily milk supply forecasts per supplier and per route.
+
+Every supplier and route keeps an additive Holt-Winters state
+(SupplyForecast): a level, a damped trend and seven weekday offsets, fitted
+on the litres of non-rejected MilkLots delivered each day. A day without
+deliveries counts as 0 L, so a supplier who stops delivering fades out of the
+forecast. Routes are fitted on their current suppliers' deliveries.
+
+``refresh`` folds in every day after the states' ``last_date`` up to
+yesterday, reading those days with one aggregate query, so the nightly run
+(``manage.py refresh_supply_forecasts``) only touches one day of lots.
+``refresh(refit=True)`` replays the whole history from scratch; each state
+update is a handful of float operations, so a year of history for thousands
+of suppliers refits in seconds without NumPy.
+
+Lots dated on or before ``last_date`` are never read by ``refresh``. Whatever
+back-dates lots (the milk lot CSV import) calls ``refit_suppliers``, which
+replays the whole history of just those suppliers and their routes.
+
+``forecast`` predicts the days after a state's ``last_date``.
+``plant_forecast`` sums a plant's routes and ``silo_fill_forecast`` compares
+that intake with the plant's silo and processing capacity.
+"""
+from dataclasses import dataclass
+from datetime import date, timedelta
+from itertools import groupby
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import Max, Q, Sum
+from django.utils import timezone
+
+from dairy_project.conf import AppSettings
+from plants.models import Plant, Silo
+
+from .models import MilkLot, Supplier, SupplyForecast
+
+SUPPLIER = "supplier"
+ROUTE = "route"
+
+DEFAULTS = {
+    "LEVEL_SMOOTHING": 0.3,
+    "TREND_SMOOTHING": 0.05,
+    "SEASONAL_SMOOTHING": 0.2,
+    "TREND_DAMPING": 0.9,
+}
+
+
+_setting = AppSettings("SUPPLY_FORECAST", DEFAULTS)
+
+
+@dataclass
+class ForecastDay:
+    date: date
+    volume_l: float
+
+
+@dataclass
+class SiloFillDay:
+    date: date
+    volume_l: float
+    silo_capacity_l: float
+    fill_percent: Optional[float]
+    processing_capacity_l: float
+
+
+def _daily_volumes(
+    since: Optional[date], until: date, supplier_ids: Optional[Iterable[int]] = None
+) -> Iterator[Tuple[date, Dict[Tuple[str, int], float]]]:
+    """(day, {(scope, id): litres}) for each day with deliveries in (since, until], of ``supplier_ids`` if given."""
+    lots = MilkLot.objects.exclude(status="rejected").filter(date_created__lte=until)
+    if since:
+        lots = lots.filter(date_created__gt=since)
+    if supplier_ids is not None:
+        lots = lots.filter(supplier_id__in=supplier_ids)
+    rows = (
+        lots.values("date_created", "supplier_id", "supplier__route_id")
+        .annotate(volume=Sum("volume_l"))
+        .order_by("date_created")
+        .values_list("date_created", "supplier_id", "supplier__route_id", "volume")
+    )
+    for day, day_rows in groupby(rows.iterator(), key=lambda row: row[0]):
+        volumes = {}
+        for _, supplier_id, route_id, volume in day_rows:
+            volumes[(SUPPLIER, supplier_id)] = volume
+            if route_id:
+                volumes[(ROUTE, route_id)] = volumes.get((ROUTE, route_id), 0.0) + volume
+        yield day, volumes
+
+
+def _step(state: SupplyForecast, day: date, volume: float) -> None:
+    """Advance ``state`` by one day's delivered volume."""
+    alpha = _setting("LEVEL_SMOOTHING")
+    beta = _setting("TREND_SMOOTHING")
+    gamma = _setting("SEASONAL_SMOOTHING")
+    phi = _setting("TREND_DAMPING")
+
+    weekday = day.weekday()
+    season = state.seasonal[weekday]
+    level = alpha * (volume - season) + (1 - alpha) * (state.level + phi * state.trend)
+    state.trend = beta * (level - state.level) + (1 - beta) * phi * state.trend
+    state.seasonal[weekday] = gamma * (volume - level) + (1 - gamma) * season
+    state.level = level
+    state.last_date = day
+    state.observations += 1
+
+
+def _start(scope: str, scope_id: int, day: date, volume: float) -> SupplyForecast:
+    return SupplyForecast(
+        scope=scope,
+        scope_id=scope_id,
+        level=volume,
+        trend=0.0,
+        seasonal=[0.0] * 7,
+        first_date=day,
+        last_date=day,
+        observations=1,
+    )
+
+
+def _fold(states: Dict[Tuple[str, int], SupplyForecast], daily_volumes, until: date) -> None:
+    """Step ``states`` through ``daily_volumes`` and on to ``until``, starting states for new keys."""
+
+    def advance_to(day):
+        for state in states.values():
+            while state.last_date < day:
+                _step(state, state.last_date + timedelta(days=1), 0.0)
+
+    for day, volumes in daily_volumes:
+        advance_to(day - timedelta(days=1))
+        for key, volume in volumes.items():
+            state = states.get(key)
+            if state is None:
+                states[key] = _start(*key, day, volume)
+            elif state.last_date < day:
+                _step(state, day, volume)
+    advance_to(until)
+
+
+@transaction.atomic
+def refresh(until: Optional[date] = None, refit: bool = False) -> Dict[str, int]:
+    """
+    Fold every day up to ``until`` (default: yesterday) into the stored states.
+    Returns how many states were updated and created.
+    """
+    until = until or timezone.localdate() - timedelta(days=1)
+    if refit:
+        SupplyForecast.objects.all().delete()
+    states = {(state.scope, state.scope_id): state for state in SupplyForecast.objects.select_for_update()}
+    existing = set(states)
+    since = min((state.last_date for state in states.values()), default=None)
+
+    _fold(states, _daily_volumes(since, until), until)
+
+    updated = [state for key, state in states.items() if key in existing]
+    created = [state for key, state in states.items() if key not in existing]
+    SupplyForecast.objects.bulk_update(
+        updated, ["level", "trend", "seasonal", "last_date", "observations"], batch_size=500
+    )
+    SupplyForecast.objects.bulk_create(created, batch_size=500)
+    return {"updated": len(updated), "created": len(created)}
+
+
+@transaction.atomic
+def refit_suppliers(supplier_ids: Iterable[int], since: date) -> int:
+    """
+    Rebuild the states of ``supplier_ids`` and of their routes from all
+    history, up to the day the stored states have reached, after lots dated
+    ``since`` or later were added behind ``refresh``'s back. A route is fitted
+    on all of its suppliers, so their states are rebuilt with it. Returns how
+    many states were rebuilt.
+    """
+    until = SupplyForecast.objects.aggregate(last=Max("last_date"))["last"]
+    if until is None or since > until:
+        return 0  # the next refresh reads those days anyway
+
+    supplier_ids = set(supplier_ids)
+    route_ids = set(
+        Supplier.objects.filter(pk__in=supplier_ids, route__isnull=False).values_list("route_id", flat=True)
+    )
+    supplier_ids |= set(Supplier.objects.filter(route_id__in=route_ids).values_list("pk", flat=True))
+    SupplyForecast.objects.filter(
+        Q(scope=SUPPLIER, scope_id__in=supplier_ids) | Q(scope=ROUTE, scope_id__in=route_ids)
+    ).delete()
+
+    states = {}
+    _fold(states, _daily_volumes(None, until, supplier_ids), until)
+    SupplyForecast.objects.bulk_create(states.values(), batch_size=500)
+    return len(states)
+
+
+def forecast(state: SupplyForecast, days: int = 7, start: Optional[date] = None) -> List[ForecastDay]:
+    """Predicted litres for ``days`` days from ``start`` (default: the day after ``last_date``)."""
+    phi = _setting("TREND_DAMPING")
+    start = start or state.last_date + timedelta(days=1)
+    predictions = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        horizon = (day - state.last_date).days
+        damped = sum(phi ** step for step in range(1, horizon + 1))
+        volume = state.level + damped * state.trend + state.seasonal[day.weekday()]
+        predictions.append(ForecastDay(day, max(volume, 0.0)))
+    return predictions
+
+
+def scope_forecast(scope: str, scope_id: int, days: int = 7) -> List[ForecastDay]:
+    """Forecast from tomorrow for one supplier or route; empty without history."""
+    state = SupplyForecast.objects.filter(scope=scope, scope_id=scope_id).first()
+    if state is None:
+        return []
+    return forecast(state, days, timezone.localdate() + timedelta(days=1))
+
+
+def plant_forecast(plant_id: int, days: int = 7) -> List[ForecastDay]:
+    """Sum of the forecasts of the plant's routes, from tomorrow."""
+    start = timezone.localdate() + timedelta(days=1)
+    totals = [ForecastDay(start + timedelta(days=offset), 0.0) for offset in range(days)]
+    states = SupplyForecast.objects.filter(
+        scope=ROUTE, scope_id__in=Plant.objects.filter(pk=plant_id).values("routes")
+    )
+    for state in states:
+        for total, day in zip(totals, forecast(state, days, start)):
+            total.volume_l += day.volume_l
+    return totals
+
+
+def silo_fill_forecast(plant_id: int, days: int = 7) -> List[SiloFillDay]:
+    """Forecast daily intake against the capacity of the plant's latest silo generation."""
+    plant = Plant.objects.get(pk=plant_id)
+    plant_silos = Silo.objects.filter(plant_id=plant_id)
+    latest_day = plant_silos.order_by("-collection_day").values_list("collection_day", flat=True).first()
+    silo_capacity = float(
+        plant_silos.filter(collection_day=latest_day).aggregate(total=Sum("capacity_liters"))["total"] or 0
+    )
+    return [
+        SiloFillDay(
+            date=day.date,
+            volume_l=day.volume_l,
+            silo_capacity_l=silo_capacity,
+            fill_percent=day.volume_l * 100 / silo_capacity if silo_capacity else None,
+            processing_capacity_l=float(plant.capacity),
+        )
+        for day in plant_forecast(plant_id, days)
+    ]
@@ -0,0 +1,519 @@
+"""
+Bulk CSV import of suppliers (with their user accounts), milk lots and
+composite-sample lab results.
+
+A file is read as a stream of lines and handled CHUNK_SIZE rows at a time.
+Each chunk's cells are parsed and checked against COLUMNS, its references
+(usernames, routes, suppliers, samples) are resolved with one query per kind,
+and the valid rows are written with ``bulk_create`` / ``bulk_update``. Memory
+depends on the chunk size, not the file.
+
+An import is all or nothing. It runs in one transaction that is rolled back
+if any row fails or when ``dry_run`` is set. A dry run therefore writes
+exactly what the real import would, database constraints included, and then
+reports row-level errors without keeping anything. After the first error the
+remaining chunks are only validated, so the report still covers the whole
+file.
+
+Imported rows get the same treatment as rows entered one by one. Lots are
+priced with the pricing version in force on their date and screened by
+suppliers.anomaly, and back-dated lots refit their suppliers' supply
+forecasts. Approved or rejected lab results approve or reject the
+lots in the sampled vessel, and are checked against the vessel's predicted
+blend.
+"""
+import csv
+import logging
+from abc import ABC, abstractmethod
+import secrets
+import time
+from dataclasses import dataclass, field
+from datetime import date
+from decimal import Decimal
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX
+from django.contrib.auth.models import User
+from django.db import DatabaseError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from dairy_project.conf import AppSettings, chunked
+from distribution.models import Route
+from milk import blending, pricing, pricing_history
+from milk.models import CompositeSample, MilkPricingConfig
+from plants.models import Employee
+
+from . import anomaly, forecasting
+from .models import MilkLot, Supplier
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "CHUNK_SIZE": 2000,
+    "MAX_ERRORS": 500,
+    # Employee roles allowed to run each import besides staff; supplier imports create accounts, so staff only.
+    "ROLES": {"milk-lots": ["tester"], "lab-results": ["tester"]},
+}
+
+
+_setting = AppSettings("CSV_IMPORT", DEFAULTS)
+
+
+@dataclass
+class RowError:
+    row: int
+    column: str
+    message: str
+
+
+@dataclass
+class ImportReport:
+    kind: str
+    dry_run: bool
+    rows: int = 0
+    written: int = 0
+    error_count: int = 0
+    errors: List[RowError] = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def committed(self) -> bool:
+        return not self.dry_run and not self.error_count
+
+    def error(self, row: int, column: str, message: str) -> None:
+        self.error_count += 1
+        if len(self.errors) < _setting("MAX_ERRORS"):
+            self.errors.append(RowError(row, column, message))
+
+    def as_dict(self) -> Dict:
+        return {
+            "kind": self.kind,
+            "dryRun": self.dry_run,
+            "committed": self.committed,
+            "rows": self.rows,
+            "written": self.written,
+            "errorCount": self.error_count,
+            "errors": [vars(error) for error in self.errors],
+            "seconds": round(self.seconds, 3),
+        }
+
+
+# ---------------- Cell parsers ----------------
+
+
+def _text(max_length: Optional[int] = None) -> Callable[[str], str]:
+    def parse(value):
+        if max_length and len(value) > max_length:
+            raise ValueError(f"at most {max_length} characters")
+        return value
+
+    return parse
+
+
+def _float(minimum: Optional[float] = None, maximum: Optional[float] = None) -> Callable[[str], float]:
+    def parse(value):
+        try:
+            number = float(value)
+        except ValueError:
+            raise ValueError(f"{value!r} is not a number")
+        if minimum is not None and number < minimum:
+            raise ValueError(f"must be at least {minimum:g}")
+        if maximum is not None and number > maximum:
+            raise ValueError(f"must be at most {maximum:g}")
+        return number
+
+    return parse
+
+
+def _integer(value: str) -> int:
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"{value!r} is not a whole number")
+    if number < 0:
+        raise ValueError("must not be negative")
+    return number
+
+
+def _boolean(value: str) -> bool:
+    if value.lower() in ("1", "true", "yes", "y"):
+        return True
+    if value.lower() in ("0", "false", "no", "n"):
+        return False
+    raise ValueError(f"{value!r} is not yes or no")
+
+
+def _date(value: str) -> date:
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if day is None:
+        raise ValueError(f"{value!r} is not a YYYY-MM-DD date")
+    return day
+
+
+def _datetime(value: str):
+    try:
+        moment = parse_datetime(value)
+    except ValueError:
+        moment = None
+    if moment is None:
+        raise ValueError(f"{value!r} is not a date and time")
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def _choice(*choices: str) -> Callable[[str], str]:
+    def parse(value):
+        if value not in choices:
+            raise ValueError(f"must be one of {', '.join(choices)}")
+        return value
+
+    return parse
+
+
+# ---------------- Importers ----------------
+
+
+class Importer(ABC):
+    """One kind of import: its COLUMNS as name -> (parser, required, default) and how a chunk is written."""
+
+    COLUMNS: Dict[str, Tuple[Callable[[str], object], bool, object]] = {}
+
+    def __init__(self, report: ImportReport, header: List[str]):
+        self.report = report
+        self.header = header
+
+    def clean(self, number: int, raw: Dict[str, str]) -> Optional[Dict]:
+        """Parsed values of one row, or None after reporting its errors."""
+        values, valid = {}, True
+        for column, (parse, required, default) in self.COLUMNS.items():
+            cell = (raw.get(column) or "").strip()
+            if not cell:
+                if required:
+                    self.report.error(number, column, "is required")
+                    valid = False
+                else:
+                    values[column] = default
+                continue
+            try:
+                values[column] = parse(cell)
+            except ValueError as e:
+                self.report.error(number, column, str(e))
+                valid = False
+        return values if valid else None
+
+    def resolve(self, rows: List[Tuple[int, Dict]]) -> List[Tuple[int, Dict]]:
+        """Check the chunk's references; returns the rows that can be written."""
+        return rows
+
+    @abstractmethod
+    def write(self, rows: List[Tuple[int, Dict]]) -> int:
+        """Save the chunk's resolved rows; returns how many were written."""
+
+    def finish(self, dry_run: bool) -> None:
+        """Side effects that should only happen once the import is kept."""
+
+
+class SupplierImporter(Importer):
+    COLUMNS = {
+        "username": (_text(150), True, None),
+        "first_name": (_text(150), False, ""),
+        "last_name": (_text(150), False, ""),
+        "email": (_text(254), False, None),
+        "phone_number": (_text(15), True, None),
+        "address": (_text(), False, ""),
+        "daily_capacity": (_float(0), True, None),
+        "total_dairy_cows": (_integer, True, None),
+        "annual_output": (_float(0), False, 0.0),
+        "distance_from_plant": (_float(0), False, 0.0),
+        "latitude": (_float(-90, 90), False, None),
+        "longitude": (_float(-180, 180), False, None),
+        "aadhar_number": (_text(12), False, ""),
+        "bank_account_number": (_text(30), False, ""),
+        "bank_name": (_text(100), False, ""),
+        "ifsc_code": (_text(11), False, ""),
+        "route": (_text(100), False, None),
+    }
+
+    def __init__(self, report, header):
+        super().__init__(report, header)
+        self.usernames = set()
+
+    def resolve(self, rows):
+        names = [values["username"] for _, values in rows]
+        taken = set(User.objects.filter(username__in=names).values_list("username", flat=True))
+        self.routes = dict(
+            Route.objects.filter(name__in={values.get("route") for _, values in rows if values.get("route")})
+            .values_list("name", "pk")
+        )
+        resolved = []
+        for number, values in rows:
+            username, route = values["username"], values.get("route")
+            if username in taken:
+                self.report.error(number, "username", f"user {username!r} already exists")
+            elif username in self.usernames:
+                self.report.error(number, "username", f"{username!r} appears more than once in the file")
+            elif route and route not in self.routes:
+                self.report.error(number, "route", f"no route named {route!r}")
+            else:
+                resolved.append((number, values))
+            self.usernames.add(username)
+        return resolved
+
+    def write(self, rows):
+        users = User.objects.bulk_create(
+            User(
+                username=values["username"],
+                first_name=values["first_name"],
+                last_name=values["last_name"],
+                email=values.get("email") or "",
+                # Same form as make_password(None); suppliers set a password when they first sign in.
+                password=UNUSABLE_PASSWORD_PREFIX + secrets.token_urlsafe(30),
+            )
+            for _, values in rows
+        )
+        supplier_fields = [
+            column for column in self.COLUMNS if column not in ("username", "first_name", "last_name", "route")
+        ]
+        Supplier.objects.bulk_create(
+            Supplier(
+                user=user,
+                route_id=self.routes.get(values["route"]),
+                **{column: values[column] for column in supplier_fields},
+            )
+            for user, (_, values) in zip(users, rows)
+        )
+        return len(users)
+
+
+class MilkLotImporter(Importer):
+    COLUMNS = {
+        "supplier": (_text(150), True, None),
+        "date": (_date, False, None),
+        "volume_l": (_float(0), False, 50.0),
+        "fat_percent": (_float(0, 100), True, None),
+        "protein_percent": (_float(0, 100), True, None),
+        "lactose_percent": (_float(0, 100), True, None),
+        "total_solids": (_float(0, 100), True, None),
+        "snf": (_float(0, 100), True, None),
+        "urea_nitrogen": (_float(0), True, None),
+        "bacterial_count": (_integer, True, None),
+        "added_water_percent": (_float(0, 100), False, 0.0),
+    }
+
+    def __init__(self, report, header):
+        super().__init__(report, header)
+        self.terms = {}
+        self.priced_routes = set(MilkPricingConfig.objects.values_list("route_id", flat=True))
+        self.lots = []
+        self.back_dated = {}
+
+    def resolve(self, rows):
+        self.suppliers = {
+            username: (supplier_id, route_id)
+            for supplier_id, username, route_id in Supplier.objects.filter(
+                user__username__in={values["supplier"] for _, values in rows}
+            ).values_list("pk", "user__username", "route_id")
+        }
+        resolved = []
+        for number, values in rows:
+            supplier = self.suppliers.get(values["supplier"])
+            if supplier is None:
+                self.report.error(number, "supplier", f"no supplier with username {values['supplier']!r}")
+            elif supplier[1] is None:
+                self.report.error(number, "supplier", "the supplier is not on a route")
+            elif supplier[1] not in self.priced_routes:
+                self.report.error(number, "supplier", "the supplier's route has no milk pricing configuration")
+            elif (values.get("date") or timezone.localdate()) > timezone.localdate():
+                self.report.error(number, "date", "must not be in the future")
+            else:
+                resolved.append((number, values))
+        return resolved
+
+    def _terms(self, route_id: int, day: date):
+        key = (route_id, day)
+        if key not in self.terms:
+            self.terms[key] = pricing_history.config_on(route_id, day)
+        return self.terms[key]
+
+    def write(self, rows):
+        today = timezone.localdate()
+        lots, days = [], {}
+        for _, values in rows:
+            supplier_id, route_id = self.suppliers[values.pop("supplier")]
+            day = values.pop("date") or today
+            lot = MilkLot(supplier_id=supplier_id, **values)
+            price = pricing.price_per_litre(
+                self._terms(route_id, day),
+                lot.fat_percent,
+                lot.snf,
+                lot.protein_percent,
+                lot.urea_nitrogen,
+                lot.bacterial_count,
+                lot.added_water_percent,
+            )
+            if price is None:
+                lot.status = "rejected"
+                lot.price_per_litre = lot.total_price = Decimal("0.00")
+            else:
+                lot.price_per_litre = price
+                lot.total_price = pricing.lot_total(lot.volume_l, price)
+            lots.append(lot)
+            days.setdefault(day, []).append(lot)
+            if day != today:
+                self.back_dated[supplier_id] = min(day, self.back_dated.get(supplier_id, day))
+
+        # Scored before the insert, so the scores and retest flags are part of it.
+        anomaly.screen(lots, save=False)
+        MilkLot.objects.bulk_create(lots)
+        # date_created is auto_now_add, so back-dated lots are moved in one update per day.
+        for day, day_lots in days.items():
+            if day != today:
+                MilkLot.objects.filter(pk__in=[lot.pk for lot in day_lots]).update(date_created=day)
+        return len(lots)
+
+    def finish(self, dry_run):
+        # The nightly forecast refresh only reads days after the ones it has
+        # folded in, so lots dated into those days are replayed here.
+        if dry_run or not self.back_dated:
+            return
+        forecasting.refit_suppliers(self.back_dated, min(self.back_dated.values()))
+
+
+class LabResultImporter(Importer):
+    """Results for existing composite samples; empty cells and missing columns keep the stored value."""
+
+    COLUMNS = {
+        "sample": (_integer, True, None),
+        "received_at_lab": (_datetime, False, None),
+        "fat_percent": (_float(0, 100), False, None),
+        "snf_percent": (_float(0, 100), False, None),
+        "protein_percent": (_float(0, 100), False, None),
+        "bacterial_count": (_integer, False, None),
+        "antibiotic_residue": (_boolean, False, None),
+        "added_water_percent": (_float(0, 100), False, None),
+        "cob_test": (_boolean, False, None),
+        "alcohol_test": (_boolean, False, None),
+        "ph_value": (_float(0, 14), False, None),
+        "mbtr_quick": (_integer, False, None),
+        "passed": (_choice("pending", "approved", "rejected"), False, None),
+        "remark": (_text(), False, None),
+    }
+
+    def __init__(self, report, header):
+        super().__init__(report, header)
+        self.fields = [column for column in self.COLUMNS if column in header and column != "sample"]
+        self.updated = []
+
+    def clean(self, number, raw):
+        values = super().clean(number, raw)
+        if values is None:
+            return None
+        return {column: value for column, value in values.items() if column == "sample" or (raw.get(column) or "").strip()}
+
+    def resolve(self, rows):
+        self.samples = CompositeSample.objects.in_bulk([values["sample"] for _, values in rows])
+        resolved = []
+        for number, values in rows:
+            if values["sample"] not in self.samples:
+                self.report.error(number, "sample", f"no composite sample {values['sample']}")
+            else:
+                resolved.append((number, values))
+        return resolved
+
+    def write(self, rows):
+        samples = []
+        for _, values in rows:
+            sample = self.samples[values["sample"]]
+            for column in self.fields:
+                if column in values:
+                    setattr(sample, column, values[column])
+            samples.append(sample)
+        if self.fields:
+            CompositeSample.objects.bulk_update(samples, self.fields)
+
+        # What CompositeSample.save does for one sample, once per outcome;
+        # rejected lots are no longer paid for.
+        outcomes = {
+            "approved": {"status": "approved"},
+            "rejected": {"status": "rejected", "price_per_litre": Decimal("0.00"), "total_price": Decimal("0.00")},
+        }
+        for outcome, fields in outcomes.items():
+            vessels = Q(pk__in=[])
+            for sample in samples:
+                if sample.passed == outcome and sample.bulk_cooler_id:
+                    vessels |= Q(bulk_cooler_id=sample.bulk_cooler_id)
+                if sample.passed == outcome and sample.on_farm_tank_id:
+                    vessels |= Q(on_farm_tank_id=sample.on_farm_tank_id)
+            MilkLot.objects.filter(vessels).update(**fields)
+
+        self.updated.extend(samples)
+        return len(samples)
+
+    def finish(self, dry_run):
+        if dry_run:
+            return
+        for sample in self.updated:
+            blending.flag_sample(sample)
+
+
+IMPORTERS = {
+    "suppliers": SupplierImporter,
+    "milk-lots": MilkLotImporter,
+    "lab-results": LabResultImporter,
+}
+
+
+def can_import(user, kind: str) -> bool:
+    """Staff may run any import; employees only the kinds their role is listed for in ROLES."""
+    if user.is_staff:
+        return True
+    roles = _setting("ROLES").get(kind, [])
+    return bool(roles) and Employee.objects.filter(user=user, role__name__in=roles).exists()
+
+
+def run(kind: str, lines: Iterable[str], dry_run: bool = False) -> ImportReport:
+    """Import the CSV text ``lines`` (header first) as ``kind``; see IMPORTERS."""
+    started = time.perf_counter()
+    report = ImportReport(kind=kind, dry_run=dry_run)
+    reader = csv.DictReader(lines)
+    header = [name.strip() for name in reader.fieldnames or []]
+    reader.fieldnames = header
+    importer = IMPORTERS[kind](report, header)
+
+    missing = [column for column, (_, required, _) in importer.COLUMNS.items() if required and column not in header]
+    if missing:
+        report.error(1, ", ".join(missing), "missing column")
+        report.seconds = time.perf_counter() - started
+        return report
+
+    with transaction.atomic():
+        # Data starts on line 2, after the header.
+        for chunk in chunked(enumerate(reader, start=2), _setting("CHUNK_SIZE")):
+            report.rows += len(chunk)
+            cleaned = [(number, values) for number, raw in chunk if (values := importer.clean(number, raw))]
+            if not cleaned:
+                continue
+            resolved = importer.resolve(cleaned)
+            if report.error_count or not resolved:
+                # Nothing will be kept; keep validating without writing.
+                continue
+            try:
+                with transaction.atomic():
+                    report.written += importer.write(resolved)
+            except DatabaseError as e:
+                logger.warning("CSV import of %s failed at rows %s-%s: %s", kind, chunk[0][0], chunk[-1][0], e)
+                report.error(chunk[0][0], "", f"rows {chunk[0][0]}-{chunk[-1][0]} could not be saved: {e}")
+        if not report.committed:
+            transaction.set_rollback(True)
+
+    if report.committed:
+        importer.finish(dry_run)
+    report.errors.sort(key=lambda error: error.row)
+    report.seconds = time.perf_counter() - started
+    return report
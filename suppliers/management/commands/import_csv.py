@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from suppliers.imports import IMPORTERS, run
+
+
+class Command(BaseCommand):
+    help = (
+        "Import suppliers, milk lots or composite-sample lab results from a CSV file with a header row. "
+        "Nothing is saved unless every row is valid."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=sorted(IMPORTERS), help="What the file contains.")
+        parser.add_argument("path", help="CSV file, UTF-8 (with or without BOM).")
+        parser.add_argument("--dry-run", action="store_true", help="Validate and report errors without saving.")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["path"], encoding="utf-8-sig", newline="") as csv_file:
+                report = run(options["kind"], csv_file, dry_run=options["dry_run"])
+        except OSError as e:
+            raise CommandError(f"Cannot read {options['path']}: {e}")
+
+        for error in report.errors:
+            column = f" {error.column}" if error.column else ""
+            self.stderr.write(f"row {error.row}{column}: {error.message}")
+        if report.error_count > len(report.errors):
+            self.stderr.write(f"... and {report.error_count - len(report.errors)} more errors")
+
+        summary = f"{report.rows} rows checked in {report.seconds:.2f}s"
+        if report.committed:
+            self.stdout.write(self.style.SUCCESS(f"Imported {report.written} {report.kind}; {summary}."))
+        elif report.error_count:
+            errors = "1 error" if report.error_count == 1 else f"{report.error_count} errors"
+            raise CommandError(f"{errors}, nothing imported; {summary}.")
+        else:
+            self.stdout.write(f"Dry run: {report.written} {report.kind} would be imported; {summary}.")
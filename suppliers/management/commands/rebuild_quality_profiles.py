@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from suppliers.anomaly import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the supplier and route quality profiles used to screen incoming milk lots "
+        "by replaying all non-rejected lots. Run once after deploying, or after changing "
+        "QUALITY_SCREENING['DECAY']; new lots keep the profiles current afterwards."
+    )
+
+    def handle(self, *args, **options):
+        count = rebuild()
+        self.stdout.write(f"Rebuilt {count} quality profiles.")
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from suppliers.forecasting import refresh
+
+
+class Command(BaseCommand):
+    help = (
+        "Fold the milk lots delivered since the last run into the supplier and route supply "
+        "forecasts. Run nightly (cron / Render cron job); use --refit to rebuild from all history."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--until", help="ISO date of the last day to include (default: yesterday).")
+        parser.add_argument("--refit", action="store_true", help="Discard the fitted states and replay all history.")
+
+    def handle(self, *args, **options):
+        until = None
+        if options["until"]:
+            until = parse_date(options["until"])
+            if until is None:
+                raise CommandError(f"Invalid --until date: {options['until']}")
+
+        result = refresh(until=until, refit=options["refit"])
+        self.stdout.write(f"Updated {result['updated']} and created {result['created']} forecasts.")
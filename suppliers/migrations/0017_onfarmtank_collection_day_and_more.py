@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-19 16:38
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+
+def backfill_collection_day(apps, schema_editor):
+    OnFarmTank = apps.get_model("suppliers", "OnFarmTank")
+    OnFarmTank.objects.update(collection_day=TruncDate("created_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('suppliers', '0016_alter_onfarmtanklog_unique_together_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='onfarmtank',
+            name='collection_day',
+            field=models.DateField(default=django.utils.timezone.localdate, help_text='Collection day this vessel record belongs to; one generation per day.'),
+        ),
+        migrations.RunPython(backfill_collection_day, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='onfarmtank',
+            index=models.Index(fields=['supplier', 'collection_day'], name='onfarmtank_supplier_day_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-19 16:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('suppliers', '0017_onfarmtank_collection_day_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='milklot',
+            name='needs_retest',
+            field=models.BooleanField(default=False, help_text='Set when the vessel holding this lot had a cold-chain breach.'),
+        ),
+        migrations.AddField(
+            model_name='milklot',
+            name='retest_reason',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
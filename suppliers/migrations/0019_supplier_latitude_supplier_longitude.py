@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('suppliers', '0018_milklot_needs_retest_milklot_retest_reason'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='supplier',
+            name='latitude',
+            field=models.FloatField(blank=True, help_text='Farm location, used for route planning', null=True),
+        ),
+        migrations.AddField(
+            model_name='supplier',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
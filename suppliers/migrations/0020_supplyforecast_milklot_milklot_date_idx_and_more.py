@@ -0,0 +1,37 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collection_center', '0009_bulkcoolerlogrollup'),
+        ('plants', '0011_plant_latitude_plant_longitude'),
+        ('suppliers', '0019_supplier_latitude_supplier_longitude'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SupplyForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('supplier', 'Supplier'), ('route', 'Route')], max_length=10)),
+                ('scope_id', models.PositiveIntegerField()),
+                ('level', models.FloatField(default=0.0)),
+                ('trend', models.FloatField(default=0.0)),
+                ('seasonal', models.JSONField(default=list, help_text='Seven weekday offsets in litres, Monday first.')),
+                ('first_date', models.DateField()),
+                ('last_date', models.DateField(help_text='Last day folded into the model.')),
+                ('observations', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='milklot',
+            index=models.Index(fields=['date_created'], name='milklot_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='supplyforecast',
+            constraint=models.UniqueConstraint(fields=('scope', 'scope_id'), name='supplyforecast_scope_uniq'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('suppliers', '0020_supplyforecast_milklot_milklot_date_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='milklot',
+            name='anomaly_score',
+            field=models.FloatField(blank=True, help_text="Squared Mahalanobis distance from the supplier's or route's quality profile, if screened.", null=True),
+        ),
+        migrations.AlterField(
+            model_name='milklot',
+            name='needs_retest',
+            field=models.BooleanField(default=False, help_text="Set when the vessel holding this lot had a cold-chain breach, or the lot's quality is unlike its supplier's or route's usual milk."),
+        ),
+        migrations.CreateModel(
+            name='QualityProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('supplier', 'Supplier'), ('route', 'Route')], max_length=10)),
+                ('scope_id', models.PositiveIntegerField()),
+                ('count', models.PositiveIntegerField(default=0, help_text='Lots folded into the profile.')),
+                ('mean', models.JSONField(default=list)),
+                ('covariance', models.JSONField(default=list, help_text='5 x 5 matrix, rows in suppliers.anomaly.FEATURES order.')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('scope', 'scope_id'), name='qualityprofile_scope_uniq')],
+            },
+        ),
+    ]
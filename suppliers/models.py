@@ -1,9 +1,11 @@
 from django.db import models
-from decimal import Decimal, ROUND_HALF_UP
+from django.utils import timezone
+from decimal import Decimal
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
-from django.apps import apps
+
+from dairy_project.cache import request_memoize
 
 
 class Supplier(models.Model):
@@ -22,6 +24,8 @@ class Supplier(models.Model):
     distance_from_plant = models.FloatField(
         help_text="Kilometres from supplier farm to the plant"
     )
+    latitude = models.FloatField(null=True, blank=True, help_text="Farm location, used for route planning")
+    longitude = models.FloatField(null=True, blank=True)
 
     # Identity and Bank Details
     aadhar_number = models.CharField(
@@ -42,6 +46,12 @@ class Supplier(models.Model):
         return f"{self.user.username} ({self.phone_number})"
 
 
+@request_memoize
+def supplier_route_id(supplier_id):
+    """The supplier's route id, looked up once per request however many lots are priced."""
+    return Supplier.objects.filter(pk=supplier_id).values_list("route_id", flat=True).first()
+
+
 class MilkLot(models.Model):
     """
     One 50 L (or other volume) can of milk supplied by a supplier.
@@ -121,6 +131,23 @@ class MilkLot(models.Model):
         blank=True,
     )
 
+    needs_retest = models.BooleanField(
+        default=False,
+        help_text="Set when the vessel holding this lot had a cold-chain breach, or the lot's quality "
+        "is unlike its supplier's or route's usual milk.",
+    )
+    retest_reason = models.CharField(max_length=255, blank=True)
+    anomaly_score = models.FloatField(
+        null=True,
+        blank=True,
+        help_text="Squared Mahalanobis distance from the supplier's or route's quality profile, if screened.",
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["date_created"], name="milklot_date_idx"),
+        ]
+
     def clean(self):
         storage_links = [self.bulk_cooler, self.can_collection, self.on_farm_tank]
         if sum(1 for link in storage_links if link is not None) > 1:
@@ -135,39 +162,33 @@ class MilkLot(models.Model):
         super().save(*args, **kwargs)
 
     def evaluate_and_price(self):
-        try:
-            MilkPricingConfig = apps.get_model("milk", "MilkPricingConfig")
-            config = MilkPricingConfig.objects.get(route=self.supplier.route)
-        except MilkPricingConfig.DoesNotExist:
+        from milk.pricing import current_config, lot_total, price_per_litre
+
+        if MilkLot.supplier.is_cached(self):
+            route_id = self.supplier.route_id
+        else:
+            route_id = supplier_route_id(self.supplier_id)
+        config = current_config(route_id) if route_id else None
+        if config is None:
             raise ValidationError("No milk pricing configuration set. Please configure pricing first.")
 
-        bonus = Decimal("0.00")
-
-        if self.fat_percent >= config.fat_min:
-            bonus += config.fat_bonus
-        if self.snf >= config.snf_min:
-            bonus += config.snf_bonus
-        if self.protein_percent >= config.protein_min:
-            bonus += config.protein_bonus
-        if self.urea_nitrogen <= config.urea_max:
-            bonus += config.urea_bonus
-        if self.bacterial_count <= config.bacteria_max:
-            bonus += config.bacteria_bonus
-
-        if self.added_water_percent > config.added_water_max:
+        price = price_per_litre(
+            config,
+            self.fat_percent,
+            self.snf,
+            self.protein_percent,
+            self.urea_nitrogen,
+            self.bacterial_count,
+            self.added_water_percent,
+        )
+        if price is None:
             self.status = "rejected"
             self.price_per_litre = Decimal("0.00")
             self.total_price = Decimal("0.00")
             return self.total_price
-        elif self.added_water_percent > 0.0:
-            bonus -= config.water_penalty_per_percent * Decimal(str(self.added_water_percent))
-
-        final_price_per_litre = config.base_price + bonus
-        if final_price_per_litre < Decimal("0.00"):
-            final_price_per_litre = Decimal("0.00")
 
-        self.price_per_litre = final_price_per_litre.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-        self.total_price = (Decimal(self.volume_l) * self.price_per_litre).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+        self.price_per_litre = price
+        self.total_price = lot_total(self.volume_l, price)
         return self.total_price
 
     
@@ -238,38 +259,37 @@ class OnFarmTank(models.Model):
     created_at = models.DateTimeField(
         auto_now_add=True, help_text="Date and time when the tank record was created."
     )
+    collection_day = models.DateField(
+        default=timezone.localdate,
+        help_text="Collection day this vessel record belongs to; one generation per day."
+    )
 
-    def add_lots(self, *milk_lots):
-        already_in_this_tank = [
-            lot for lot in milk_lots if lot.on_farm_tank_id == self.id
+    class Meta:
+        indexes = [
+            models.Index(fields=["supplier", "collection_day"], name="onfarmtank_supplier_day_idx"),
         ]
-        if already_in_this_tank:
+
+    def add_lots(self, *milk_lots):
+        from suppliers.storage import LotsAlreadyAssignedError, StorageCapacityError, assign_lots
+
+        try:
+            assignment = assign_lots(self, [lot.pk for lot in milk_lots])
+        except LotsAlreadyAssignedError as e:
             raise ValueError(
-                f"Cannot add {len(already_in_this_tank)} milk lots: "
+                f"Cannot add {e.count} milk lots: "
                 "they are already assigned to this On-Farm Tank."
             )
-
-        candidates = [
-            lot
-            for lot in milk_lots
-            if lot.status == "pending" and lot.on_farm_tank_id is None
-        ]
-
-        proposed_volume = sum(lot.volume_l for lot in candidates)
-        if self.current_volume_liters + proposed_volume > self.capacity_liters:
+        except StorageCapacityError as e:
             raise ValueError(
-                f"Cannot add {proposed_volume} liters. "
+                f"Cannot add {e.proposed_volume} liters. "
                 f"Tank capacity {self.capacity_liters}L exceeded "
-                f"(current volume: {self.current_volume_liters}L)."
+                f"(current volume: {e.current_volume}L)."
             )
 
-        for lot in candidates:
-            lot.on_farm_tank = self
-        MilkLot.objects.bulk_update(candidates, ["on_farm_tank"])
-
-        self.current_volume_liters += proposed_volume
-        self.save(update_fields=["current_volume_liters"])
-        return len(candidates)
+        for lot in milk_lots:
+            if lot.pk in assignment.claimed_ids:
+                lot.on_farm_tank = self
+        return assignment.count
 
     def __str__(self):
         return f"{self.name} ({self.supplier.user.username})"
@@ -296,31 +316,76 @@ class CanCollection(models.Model):
     emptied_at = models.DateTimeField(null=True, blank=True)
 
     def add_lots(self, *milk_lots):
-        already_in_this_collection = [
-            lot for lot in milk_lots if lot.can_collection_id == self.id
-        ]
-        if already_in_this_collection:
+        from suppliers.storage import LotsAlreadyAssignedError, assign_lots
+
+        try:
+            assignment = assign_lots(self, [lot.pk for lot in milk_lots])
+        except LotsAlreadyAssignedError as e:
             raise ValidationError(
-                f"Cannot add {len(already_in_this_collection)} milk lots: "
+                f"Cannot add {e.count} milk lots: "
                 "they are already assigned to this can collection."
             )
 
-        candidates = [
-            lot
-            for lot in milk_lots
-            if lot.status == "pending" and lot.can_collection_id is None
-        ]
-        total_volume = 0
-        for lot in candidates:
-            total_volume += lot.volume_l
-            lot.can_collection = self
-        MilkLot.objects.bulk_update(candidates, ["can_collection"])
+        for lot in milk_lots:
+            if lot.pk in assignment.claimed_ids:
+                lot.can_collection = self
+        return assignment.count
+
+    def __str__(self):
+        return f"Can Collection - {self.name} {self.created_at} ({self.route.name})"
+
 
-        self.total_volume_liters += total_volume
-        self.save(update_fields=["total_volume_liters"])
 
-        return len(candidates)
+class SupplyForecast(models.Model):
+    """
+    Fitted state of a supplier's or route's daily delivery model: level, damped
+    trend and one additive factor per weekday (Monday first), advanced one day
+    at a time by suppliers.forecasting up to ``last_date``.
+    """
+
+    SCOPES = [
+        ("supplier", "Supplier"),
+        ("route", "Route"),
+    ]
+
+    scope = models.CharField(max_length=10, choices=SCOPES)
+    scope_id = models.PositiveIntegerField()
+    level = models.FloatField(default=0.0)
+    trend = models.FloatField(default=0.0)
+    seasonal = models.JSONField(default=list, help_text="Seven weekday offsets in litres, Monday first.")
+    first_date = models.DateField()
+    last_date = models.DateField(help_text="Last day folded into the model.")
+    observations = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["scope", "scope_id"], name="supplyforecast_scope_uniq"),
+        ]
 
     def __str__(self):
-        return f"Can Collection - {self.name} {self.created_at} ({self.route.name})"
+        return f"{self.scope} {self.scope_id} forecast to {self.last_date}"
+
+
+class QualityProfile(models.Model):
+    """
+    Exponentially weighted mean and covariance of a supplier's or route's lot
+    quality (fat, SNF, lactose, total solids, added water), kept up to date by
+    suppliers.anomaly as lots pass screening.
+    """
 
+    SCOPES = SupplyForecast.SCOPES
+
+    scope = models.CharField(max_length=10, choices=SCOPES)
+    scope_id = models.PositiveIntegerField()
+    count = models.PositiveIntegerField(default=0, help_text="Lots folded into the profile.")
+    mean = models.JSONField(default=list)
+    covariance = models.JSONField(default=list, help_text="5 x 5 matrix, rows in suppliers.anomaly.FEATURES order.")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["scope", "scope_id"], name="qualityprofile_scope_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.scope_id} quality profile ({self.count} lots)"
@@ -8,7 +8,7 @@ from channels.layers import get_channel_layer
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.db import transaction
-from django.db.models import Max
+from django.db.models import OuterRef, Subquery
 from django.utils.timezone import make_aware
 from graphql import GraphQLError
 from strawberry.permission import BasePermission
@@ -17,6 +17,7 @@ from strawberry_django import field
 
 from accounts.schema import UserType
 from accounts.utils import get_authenticated_user
+from collection_center import cold_chain
 from collection_center.schema import AssignLotsPayload
 from dairy_project.graphql_types.billing import PaymentBillType
 from dairy_project.graphql_types.collection import (
@@ -25,8 +26,9 @@ from dairy_project.graphql_types.collection import (
     OnFarmTankType,
 )
 from dairy_project.graphql_types.milk import MilkLotType
-from dairy_project.graphql_types.suppliers import SupplierType
+from dairy_project.graphql_types.suppliers import ForecastDayType, SupplierType
 from distribution.models import Route
+from suppliers import anomaly, forecasting
 from suppliers.models import CanCollection, MilkLot, OnFarmTank, PaymentBill, Supplier
 
 class IsAuthenticated(BasePermission):
@@ -103,6 +105,18 @@ class Query:
     def users(self) -> List[UserType]:
         return User.objects.all()
 
+    @strawberry.field
+    def supply_forecast(self, scope: str, scope_id: int, days: int = 7) -> List[ForecastDayType]:
+        if not 1 <= days <= 31:
+            raise GraphQLError("days must be between 1 and 31.")
+        if scope == "plant":
+            predictions = forecasting.plant_forecast(scope_id, days)
+        elif scope in (forecasting.SUPPLIER, forecasting.ROUTE):
+            predictions = forecasting.scope_forecast(scope, scope_id, days)
+        else:
+            raise GraphQLError(f"Unknown forecast scope: {scope}")
+        return [ForecastDayType(**vars(day)) for day in predictions]
+
     @field
     def suppliers(self) -> List[SupplierType]:
         return Supplier.objects.all()
@@ -191,20 +205,21 @@ class Query:
     
     @strawberry.field
     def onfarm_tanks_by_route(self, route_id: int) -> List[OnFarmTankType]:
-        latest_datetime = (
-        OnFarmTank.objects
-        .filter(supplier__route_id=route_id)
-        .aggregate(latest=Max('created_at'))['latest']
-    )
-
-        if not latest_datetime:
-            return []  
-
-        latest_date = latest_datetime.date()  
-
+        # The route's latest collection day is taken per supplier, so both it and
+        # the tanks of that day are seeks on onfarmtank_supplier_day_idx instead
+        # of a sort over every tank the route ever had.
+        supplier_latest_day = (
+            OnFarmTank.objects.filter(supplier=OuterRef('pk')).order_by('-collection_day').values('collection_day')[:1]
+        )
+        latest_day = (
+            Supplier.objects.filter(route_id=route_id)
+            .annotate(latest_day=Subquery(supplier_latest_day))
+            .filter(latest_day__isnull=False)
+            .order_by('-latest_day')
+            .values('latest_day')[:1]
+        )
         tanks = OnFarmTank.objects.filter(
-            supplier__route_id=route_id,
-            created_at__date=latest_date  
+            supplier__route_id=route_id, collection_day=Subquery(latest_day)
         ).order_by('-created_at')
 
         return tanks
@@ -255,20 +270,10 @@ class Query:
     ) -> List[CanCollectionType]:
         try:
             route = Route.objects.get(id=route_id)
-            collections = CanCollection.objects.filter(
+            return CanCollection.objects.filter(
                 route=route,
                 created_at__date=created_date
             )
-            return [
-                CanCollectionType(
-                    id=c.id,
-                    route=c.route,
-                    name=c.name,
-                    total_volume_liters=c.total_volume_liters,
-                    created_at=c.created_at
-                )
-                for c in collections
-            ]
         except Route.DoesNotExist:
             raise GraphQLError("Route not found")
 
@@ -346,6 +351,8 @@ class Mutation:
 
         milk_lot.evaluate_and_price()
         milk_lot.save()
+        if not lot_id:
+            anomaly.screen([milk_lot])
         
         channel_layer = get_channel_layer()
         async_to_sync(channel_layer.group_send)(
@@ -441,7 +448,13 @@ class Mutation:
             if last_serviced_at:
                 tank.last_serviced_at = last_serviced_at
 
-            tank.save()
+            # current_volume_liters is maintained by add_lots with F() updates;
+            # writing the in-memory copy back would undo concurrent assignments.
+            tank.save(update_fields=[
+                "temperature_celsius", "last_cleaned_at", "last_sanitized_at",
+                "last_calibration_date", "service_interval_days", "last_serviced_at",
+            ])
+            cold_chain.process(cold_chain.ONFARM_TANK, [(tank.id, datetime.now(timezone.utc), temperature_celsius)])
 
             return AssignLotsPayload(
                 success=True,
@@ -527,7 +540,7 @@ class Mutation:
 
             already_exists = OnFarmTank.objects.filter(
                 supplier=supplier,
-                created_at__date=today,
+                collection_day=today,
                 name=processed_tank.name,
             ).exists()
 
@@ -0,0 +1,107 @@
+from dataclasses import dataclass, field
+from typing import List
+
+from django.db import transaction
+from django.db.models import F
+
+from distribution.traceability import record_lots
+from milk import blending
+from suppliers.models import MilkLot
+
+# vessel model label -> (MilkLot foreign key, volume column, capacity column or None)
+STORAGE_FIELDS = {
+    "collection_center.bulkcooler": ("bulk_cooler", "current_volume_liters", "capacity_liters"),
+    "suppliers.onfarmtank": ("on_farm_tank", "current_volume_liters", "capacity_liters"),
+    "suppliers.cancollection": ("can_collection", "total_volume_liters", None),
+}
+
+# Lots that can be pooled. A lot flagged for retest (cold chain or quality
+# screening) is held back until its retest settles it.
+UNASSIGNED = {
+    "status": "pending",
+    "needs_retest": False,
+    "bulk_cooler__isnull": True,
+    "on_farm_tank__isnull": True,
+    "can_collection__isnull": True,
+}
+
+
+class LotsAlreadyAssignedError(ValueError):
+    def __init__(self, count):
+        self.count = count
+        super().__init__(f"{count} milk lots are already assigned to this vessel.")
+
+
+class StorageCapacityError(ValueError):
+    def __init__(self, vessel, proposed_volume, current_volume, capacity):
+        self.proposed_volume = proposed_volume
+        self.current_volume = current_volume
+        self.capacity = capacity
+        super().__init__(
+            f"Cannot add {proposed_volume} liters to {vessel}: capacity {capacity}L "
+            f"exceeded (current volume: {current_volume}L)."
+        )
+
+
+@dataclass
+class StorageAssignment:
+    claimed_ids: List[int] = field(default_factory=list)
+    volume: float = 0.0
+
+    @property
+    def count(self):
+        return len(self.claimed_ids)
+
+
+def assign_lots(vessel, lot_ids) -> StorageAssignment:
+    """
+    Move pending, unassigned lots that are not held for retest into
+    ``vessel`` without lost updates.
+
+    Inside one transaction: lock the lots that are still pending and unassigned
+    with ``SELECT ... FOR UPDATE`` (in id order, so concurrent collectors
+    cannot deadlock), reserve their volume on the vessel with a conditional
+    ``UPDATE ... SET volume = volume + x WHERE volume + x <= capacity`` and
+    claim exactly the locked lots. A lot another collector is claiming is
+    waited for and, once that claim commits, no longer matches the lock
+    query, so every lot is counted by one transaction only. The reserve holds
+    the vessel's row lock until commit, so only writers to the same vessel wait.
+    Claimed lots are added to the traceability index and the vessel's quality
+    blend in the same transaction.
+    Returns the ids and volume actually claimed.
+    """
+    lot_field, volume_field, capacity_field = STORAGE_FIELDS[vessel._meta.label_lower]
+    vessel_model = type(vessel)
+    lot_ids = list({int(lot_id) for lot_id in lot_ids})
+
+    with transaction.atomic():
+        already_assigned = MilkLot.objects.filter(pk__in=lot_ids, **{lot_field: vessel.pk}).count()
+        if already_assigned:
+            raise LotsAlreadyAssignedError(already_assigned)
+
+        claimed = list(
+            MilkLot.objects.select_for_update()
+            .filter(pk__in=lot_ids, **UNASSIGNED)
+            .order_by("pk")
+            .values_list("pk", "volume_l")
+        )
+        claimed_ids = [pk for pk, _ in claimed]
+        claimed_volume = sum(volume for _, volume in claimed)
+        if not claimed_volume:
+            return StorageAssignment()
+
+        reserve = vessel_model.objects.filter(pk=vessel.pk)
+        if capacity_field:
+            reserve = reserve.filter(
+                **{f"{volume_field}__lte": F(capacity_field) - claimed_volume}
+            )
+        if not reserve.update(**{volume_field: F(volume_field) + claimed_volume}):
+            current = vessel_model.objects.filter(pk=vessel.pk).values_list(volume_field, flat=True).first()
+            raise StorageCapacityError(vessel, claimed_volume, current, getattr(vessel, capacity_field))
+
+        MilkLot.objects.filter(pk__in=claimed_ids).update(**{lot_field: vessel.pk})
+        record_lots(lot_field, vessel.pk, claimed_ids)
+        blending.add_lots(lot_field, vessel.pk, claimed_ids)
+
+    vessel.refresh_from_db(fields=[volume_field])
+    return StorageAssignment(claimed_ids=claimed_ids, volume=claimed_volume)
@@ -1,3 +1,501 @@
-from django.test import TestCase
+import json
+import random
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.utils import create_refresh_token
+from collection_center.models import BulkCooler
+from distribution.models import MilkLotTrace, Route
+from plants.models import Plant, Silo
+from milk.models import CompositeSample
+from milk.pricing import price_per_litre
+from milk.pricing_history import record_version
+from plants.models import Employee, Role
+
+from . import anomaly, forecasting, imports
+from .models import MilkLot, OnFarmTank, QualityProfile, Supplier, SupplyForecast
+from .storage import LotsAlreadyAssignedError, StorageCapacityError, assign_lots
+
+QUALITY = {
+    "fat_percent": 4.0,
+    "protein_percent": 3.3,
+    "lactose_percent": 4.7,
+    "total_solids": 12.8,
+    "snf": 8.6,
+    "urea_nitrogen": 12.0,
+    "bacterial_count": 50000,
+}
+
+
+def make_supplier(username, route=None):
+    return Supplier.objects.create(
+        user=User.objects.create(username=username),
+        address="",
+        phone_number="9800000000",
+        daily_capacity=100.0,
+        total_dairy_cows=5,
+        annual_output=36000.0,
+        distance_from_plant=10.0,
+        aadhar_number="",
+        bank_account_number="",
+        bank_name="",
+        ifsc_code="",
+        route=route,
+    )
+
+
+def make_lots(supplier, count, volume_l=50.0, **fields):
+    return MilkLot.objects.bulk_create(
+        MilkLot(supplier=supplier, volume_l=volume_l, **{**QUALITY, **fields}) for _ in range(count)
+    )
+
+
+class AssignLotsTests(TestCase):
+    def setUp(self):
+        self.route = Route.objects.create(name="North")
+        self.supplier = make_supplier("farmer", self.route)
+        self.cooler = BulkCooler.objects.create(route=self.route, name="Cooler-1", capacity_liters=1000)
+
+    def test_claims_pending_unassigned_lots(self):
+        lots = make_lots(self.supplier, 3)
+
+        assignment = assign_lots(self.cooler, [lot.pk for lot in lots])
+
+        self.assertEqual(sorted(assignment.claimed_ids), sorted(lot.pk for lot in lots))
+        self.assertEqual(assignment.volume, 150.0)
+        self.assertEqual(self.cooler.current_volume_liters, 150.0)
+        self.assertEqual(MilkLot.objects.filter(bulk_cooler=self.cooler).count(), 3)
+        self.assertEqual(MilkLotTrace.objects.filter(node_type="bulk_cooler", node_id=self.cooler.pk).count(), 3)
+
+    def test_skips_lots_that_are_not_pending_and_unassigned(self):
+        other = BulkCooler.objects.create(route=self.route, name="Cooler-2", capacity_liters=1000)
+        elsewhere, approved, pending = make_lots(self.supplier, 3)
+        MilkLot.objects.filter(pk=elsewhere.pk).update(bulk_cooler=other)
+        MilkLot.objects.filter(pk=approved.pk).update(status="approved")
+
+        assignment = assign_lots(self.cooler, [elsewhere.pk, approved.pk, pending.pk])
+
+        self.assertEqual(assignment.claimed_ids, [pending.pk])
+        self.assertEqual(self.cooler.current_volume_liters, 50.0)
+        self.assertEqual(MilkLotTrace.objects.filter(node_type="bulk_cooler", node_id=self.cooler.pk).count(), 1)
+
+    def test_lots_held_for_retest_are_not_pooled(self):
+        held, pending = make_lots(self.supplier, 2)
+        MilkLot.objects.filter(pk=held.pk).update(needs_retest=True, retest_reason="Cold chain breach")
+
+        assignment = assign_lots(self.cooler, [held.pk, pending.pk])
+
+        self.assertEqual(assignment.claimed_ids, [pending.pk])
+        self.assertFalse(MilkLot.objects.filter(pk=held.pk, bulk_cooler=self.cooler).exists())
+
+    def test_lots_claimed_by_another_vessel_are_not_counted_again(self):
+        other = BulkCooler.objects.create(route=self.route, name="Cooler-2", capacity_liters=1000)
+        lot_ids = [lot.pk for lot in make_lots(self.supplier, 2)]
+        assign_lots(other, lot_ids)
+
+        assignment = assign_lots(self.cooler, lot_ids)
+
+        self.assertEqual(assignment.count, 0)
+        self.assertEqual(self.cooler.current_volume_liters, 0.0)
+        self.assertFalse(MilkLotTrace.objects.filter(node_type="bulk_cooler", node_id=self.cooler.pk).exists())
+
+    def test_assigning_the_same_lots_twice_raises(self):
+        lot_ids = [lot.pk for lot in make_lots(self.supplier, 2)]
+        assign_lots(self.cooler, lot_ids)
+
+        with self.assertRaises(LotsAlreadyAssignedError):
+            assign_lots(self.cooler, lot_ids)
+
+    def test_over_capacity_assigns_nothing(self):
+        lot_ids = [lot.pk for lot in make_lots(self.supplier, 3, volume_l=400.0)]
+
+        with self.assertRaises(StorageCapacityError):
+            assign_lots(self.cooler, lot_ids)
+
+        self.cooler.refresh_from_db()
+        self.assertEqual(self.cooler.current_volume_liters, 0.0)
+        self.assertFalse(MilkLot.objects.filter(bulk_cooler=self.cooler).exists())
+
+
+def quality_lots(supplier, count, seed=0):
+    """Unsaved lots whose quality varies around QUALITY the way one herd's milk does."""
+    rng = random.Random(seed)
+    lots = []
+    for _ in range(count):
+        fat = rng.gauss(4.0, 0.15)
+        snf = rng.gauss(8.6, 0.1)
+        lots.append(
+            MilkLot(
+                supplier=supplier,
+                volume_l=50.0,
+                **{
+                    **QUALITY,
+                    "fat_percent": fat,
+                    "snf": snf,
+                    "lactose_percent": rng.gauss(4.7, 0.08),
+                    "total_solids": fat + snf + rng.gauss(0.0, 0.05),
+                    "added_water_percent": abs(rng.gauss(0.0, 0.2)),
+                },
+            )
+        )
+    return lots
+
+
+class ScreenTests(TestCase):
+    def setUp(self):
+        self.route = Route.objects.create(name="North")
+        self.supplier = make_supplier("farmer", self.route)
+        self.history = MilkLot.objects.bulk_create(quality_lots(self.supplier, 40))
+
+    def _profile(self, scope, scope_id):
+        return QualityProfile.objects.get(scope=scope, scope_id=scope_id)
+
+    def _watered(self):
+        return MilkLot.objects.create(
+            supplier=self.supplier,
+            volume_l=50.0,
+            **{**QUALITY, "fat_percent": 3.6, "snf": 7.9, "total_solids": 11.5, "added_water_percent": 6.0},
+        )
+
+    def test_lots_are_not_scored_before_min_lots(self):
+        scores = anomaly.screen(self.history[:10])
+
+        self.assertTrue(all(score.supplier_score is None and not score.flagged for score in scores))
+        self.assertEqual(self._profile(anomaly.SUPPLIER, self.supplier.pk).count, 10)
+        self.assertEqual(self._profile(anomaly.ROUTE, self.route.pk).count, 10)
+
+    def test_flags_a_lot_unlike_the_suppliers_milk(self):
+        anomaly.screen(self.history)
+        [usual] = MilkLot.objects.bulk_create(quality_lots(self.supplier, 1, seed=1))
+        watered = self._watered()
+
+        scores = anomaly.screen([usual, watered])
+
+        self.assertEqual([score.flagged for score in scores], [False, True])
+        watered.refresh_from_db()
+        self.assertTrue(watered.needs_retest)
+        self.assertTrue(watered.retest_reason.startswith("Quality unlike this supplier's milk"))
+        self.assertGreater(watered.anomaly_score, anomaly.DEFAULTS["THRESHOLD"])
+
+    def test_a_flagged_lot_barely_moves_the_profile(self):
+        anomaly.screen(self.history)
+        before = self._profile(anomaly.SUPPLIER, self.supplier.pk).mean
+
+        anomaly.screen([self._watered()])
+
+        after = self._profile(anomaly.SUPPLIER, self.supplier.pk).mean
+        water = anomaly.FEATURES.index("added_water_percent")
+        self.assertLess(after[water] - before[water], 0.1)
+
+    def test_rejected_lots_are_skipped(self):
+        self.history[0].status = "rejected"
+
+        scores = anomaly.screen(self.history[:5])
+
+        self.assertEqual([score.lot_id for score in scores], [lot.pk for lot in self.history[1:5]])
+        self.assertEqual(self._profile(anomaly.SUPPLIER, self.supplier.pk).count, 4)
+
+    def test_save_false_leaves_the_lots_unsaved_but_saves_the_profiles(self):
+        anomaly.screen(self.history)
+        watered = self._watered()
+
+        anomaly.screen([watered], save=False)
+
+        self.assertTrue(watered.needs_retest)
+        watered.refresh_from_db()
+        self.assertFalse(watered.needs_retest)
+        self.assertEqual(self._profile(anomaly.SUPPLIER, self.supplier.pk).count, 41)
+
+    def test_screening_in_batches_matches_a_rebuild(self):
+        for start in range(0, 40, 15):
+            anomaly.screen(self.history[start:start + 15])
+        screened = self._profile(anomaly.SUPPLIER, self.supplier.pk)
+
+        anomaly.rebuild()
+
+        rebuilt = self._profile(anomaly.SUPPLIER, self.supplier.pk)
+        self.assertEqual(rebuilt.count, screened.count)
+        for rebuilt_mean, screened_mean in zip(rebuilt.mean, screened.mean):
+            self.assertAlmostEqual(rebuilt_mean, screened_mean)
+
+
+def csv_lines(header, *rows):
+    return [",".join(header)] + [",".join(str(cell) for cell in row) for row in rows]
+
+
+LOT_HEADER = ["supplier", "date", "volume_l", *QUALITY, "added_water_percent"]
+
+
+@override_settings(CSV_IMPORT={"CHUNK_SIZE": 2})
+class ImportTests(TestCase):
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.route = Route.objects.create(name="North")
+        self.supplier = make_supplier("farmer", self.route)
+        self.first = record_version(self.route.pk, {}, effective_from=self.today - timedelta(days=20))
+
+    def _lot(self, day="", water=0.0, supplier="farmer"):
+        return [supplier, day, 40.0, *QUALITY.values(), water]
+
+    def test_imports_suppliers_with_unusable_passwords(self):
+        report = imports.run(
+            "suppliers",
+            csv_lines(
+                ["username", "phone_number", "daily_capacity", "total_dairy_cows", "route"],
+                ["ravi", "9811111111", 120, 8, "North"],
+                ["meena", "9822222222", 80, 5, ""],
+            ),
+        )
+
+        self.assertTrue(report.committed)
+        self.assertEqual(report.written, 2)
+        ravi = Supplier.objects.select_related("user").get(user__username="ravi")
+        self.assertEqual(ravi.route_id, self.route.pk)
+        self.assertFalse(ravi.user.has_usable_password())
+        self.assertIsNone(Supplier.objects.get(user__username="meena").route_id)
+
+    def test_dry_run_writes_nothing(self):
+        report = imports.run("milk-lots", csv_lines(LOT_HEADER, *[self._lot()] * 5), dry_run=True)
+
+        self.assertFalse(report.committed)
+        self.assertEqual((report.rows, report.written, report.error_count), (5, 5, 0))
+        self.assertFalse(MilkLot.objects.exists())
+        self.assertFalse(QualityProfile.objects.exists())
+
+    def test_one_bad_row_keeps_nothing_and_every_error_is_reported(self):
+        report = imports.run(
+            "milk-lots",
+            csv_lines(LOT_HEADER, self._lot(), self._lot(supplier="nobody"), self._lot(), self._lot(water="lots")),
+        )
+
+        self.assertFalse(report.committed)
+        self.assertEqual(
+            [(error.row, error.column) for error in report.errors], [(3, "supplier"), (5, "added_water_percent")]
+        )
+        self.assertFalse(MilkLot.objects.exists())
+
+    def test_missing_required_column(self):
+        report = imports.run("milk-lots", csv_lines(["supplier", "volume_l"], ["farmer", 40.0]))
+
+        self.assertEqual(report.error_count, 1)
+        self.assertEqual(report.errors[0].message, "missing column")
+        self.assertEqual(report.rows, 0)
+
+    def test_back_dated_lots_are_priced_with_the_terms_of_their_day(self):
+        record_version(self.route.pk, {"base_price": Decimal("30.00"), "added_water_max": 1.0})
+        back_dated = self.today - timedelta(days=10)
+
+        report = imports.run(
+            "milk-lots",
+            csv_lines(LOT_HEADER, self._lot(back_dated, water=2.0), self._lot(water=2.0)),
+        )
+
+        self.assertTrue(report.committed)
+        old, new = MilkLot.objects.order_by("pk")
+        self.assertEqual(old.date_created, back_dated)
+        self.assertEqual(new.date_created, self.today)
+        self.assertEqual(
+            old.price_per_litre,
+            price_per_litre(
+                self.first,
+                QUALITY["fat_percent"],
+                QUALITY["snf"],
+                QUALITY["protein_percent"],
+                QUALITY["urea_nitrogen"],
+                QUALITY["bacterial_count"],
+                2.0,
+            ),
+        )
+        self.assertEqual(old.total_price, old.price_per_litre * 40)
+        self.assertEqual((new.status, new.total_price), ("rejected", Decimal("0.00")))
+
+    def test_lab_results_keep_stored_values_for_empty_cells_and_approve_the_vessel(self):
+        cooler = BulkCooler.objects.create(route=self.route, name="Cooler-1", capacity_liters=1000)
+        sample = CompositeSample.objects.create(bulk_cooler=cooler, fat_percent=4.2)
+        [lot] = make_lots(self.supplier, 1, bulk_cooler=cooler)
+
+        report = imports.run(
+            "lab-results",
+            csv_lines(["sample", "fat_percent", "snf_percent", "passed"], [sample.pk, "", 8.7, "approved"]),
+        )
+
+        self.assertTrue(report.committed)
+        sample.refresh_from_db()
+        self.assertEqual((sample.fat_percent, sample.snf_percent, sample.passed), (4.2, 8.7, "approved"))
+        lot.refresh_from_db()
+        self.assertEqual(lot.status, "approved")
+
+    def test_rejected_lab_results_reject_and_zero_the_vessels_lots(self):
+        tank = OnFarmTank.objects.create(supplier=self.supplier, name="Tank-1", capacity_liters=500)
+        sample = CompositeSample.objects.create(on_farm_tank=tank)
+        [lot] = make_lots(
+            self.supplier, 1, on_farm_tank=tank, price_per_litre=Decimal("30.00"), total_price=Decimal("1500.00")
+        )
+
+        report = imports.run("lab-results", csv_lines(["sample", "passed"], [sample.pk, "rejected"]))
+
+        self.assertTrue(report.committed)
+        lot.refresh_from_db()
+        self.assertEqual(
+            (lot.status, lot.price_per_litre, lot.total_price), ("rejected", Decimal("0.00"), Decimal("0.00"))
+        )
+
+
+class ImportViewTests(TestCase):
+    def _post(self, user, kind):
+        self.client.cookies["refresh_token"] = create_refresh_token(user)
+        upload = SimpleUploadedFile("data.csv", b"sample,passed\n")
+        return self.client.post(reverse("import_csv", args=[kind]), {"file": upload, "dry_run": "1"})
+
+    def _employee(self, username, role):
+        user = User.objects.create(username=username)
+        Employee.objects.create(user=user, employee_id=username, role=Role.objects.create(name=role))
+        return user
+
+    def test_suppliers_cannot_import(self):
+        response = self._post(make_supplier("farmer").user, "lab-results")
+        self.assertEqual(response.status_code, 403)
+
+    def test_testers_may_import_lab_results_but_not_suppliers(self):
+        tester = self._employee("tester1", "tester")
+        self.assertEqual(self._post(tester, "lab-results").status_code, 200)
+        self.assertEqual(self._post(tester, "suppliers").status_code, 403)
+
+    def test_staff_may_run_any_import(self):
+        staff = User.objects.create(username="admin", is_staff=True)
+        self.assertNotEqual(self._post(staff, "suppliers").status_code, 403)
+
+
+class OnFarmTanksByRouteTests(TestCase):
+    def test_only_the_routes_latest_collection_day_is_listed(self):
+        route = Route.objects.create(name="North")
+        today = timezone.localdate()
+        farmers = [make_supplier(f"farmer{number}", route) for number in range(3)]
+        make_supplier("no-tank", route)
+        for supplier, days_ago in ((farmers[0], 2), (farmers[0], 1), (farmers[1], 1), (farmers[2], 3)):
+            OnFarmTank.objects.create(
+                supplier=supplier, name="Tank-1", capacity_liters=2000, collection_day=today - timedelta(days=days_ago)
+            )
+        OnFarmTank.objects.create(
+            supplier=make_supplier("elsewhere"), name="Tank-1", capacity_liters=2000, collection_day=today
+        )
+        self.client.force_login(User.objects.create_superuser("admin", "", "password"))
+
+        query = "query($routeId: Int!) { onfarmTanksByRoute(routeId: $routeId) { supplier { user { username } } } }"
+        response = self.client.post(
+            "/graphql/",
+            json.dumps({"query": query, "variables": {"routeId": route.pk}}),
+            content_type="application/json",
+        )
+
+        usernames = [tank["supplier"]["user"]["username"] for tank in response.json()["data"]["onfarmTanksByRoute"]]
+        self.assertEqual(sorted(usernames), ["farmer0", "farmer1"])
+
+
+class ForecastingTests(TestCase):
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.start = self.today - timedelta(days=28)
+        self.plant = Plant.objects.create(name="Main", location="", capacity=Decimal("5000.00"))
+        self.route = Route.objects.create(name="North", plant=self.plant)
+        self.suppliers = [make_supplier(f"farmer{number}", self.route) for number in range(2)]
+
+    def _deliver(self, supplier, day, volume):
+        [lot] = make_lots(supplier, 1, volume_l=volume)
+        MilkLot.objects.filter(pk=lot.pk).update(date_created=day)
+
+    def _deliver_history(self, days):
+        rng = random.Random(7)
+        for offset in range(days):
+            for supplier in self.suppliers:
+                self._deliver(supplier, self.start + timedelta(days=offset), rng.uniform(40.0, 60.0))
+
+    def _states(self):
+        return {
+            (state.scope, state.scope_id): (
+                state.last_date, state.observations, state.level, state.trend, state.seasonal
+            )
+            for state in SupplyForecast.objects.all()
+        }
+
+    def assertStatesEqual(self, first, second):
+        self.assertEqual(set(first), set(second))
+        for key, (last_date, observations, level, trend, seasonal) in first.items():
+            other = second[key]
+            self.assertEqual((last_date, observations), other[:2])
+            for value, other_value in zip([level, trend, *seasonal], [other[2], other[3], *other[4]]):
+                self.assertAlmostEqual(value, other_value)
+
+    def test_nightly_refreshes_match_a_refit(self):
+        self._deliver_history(21)
+        for offset in (6, 13, 20):
+            forecasting.refresh(until=self.start + timedelta(days=offset))
+        incremental = self._states()
+
+        forecasting.refresh(until=self.start + timedelta(days=20), refit=True)
+
+        self.assertEqual(len(incremental), 3)
+        self.assertStatesEqual(incremental, self._states())
+
+    def test_days_without_deliveries_count_as_zero(self):
+        stopped, regular = self.suppliers
+        for offset in range(14):
+            self._deliver(regular, self.start + timedelta(days=offset), 50.0)
+            if offset < 7:
+                self._deliver(stopped, self.start + timedelta(days=offset), 50.0)
+
+        forecasting.refresh(until=self.start + timedelta(days=13))
+
+        faded = SupplyForecast.objects.get(scope=forecasting.SUPPLIER, scope_id=stopped.pk)
+        steady = SupplyForecast.objects.get(scope=forecasting.SUPPLIER, scope_id=regular.pk)
+        self.assertEqual((faded.observations, faded.last_date), (14, self.start + timedelta(days=13)))
+        self.assertLess(sum(day.volume_l for day in forecasting.forecast(faded)), 7 * 25.0)
+        self.assertAlmostEqual(forecasting.forecast(steady, days=1)[0].volume_l, 50.0)
+
+    def test_silo_fill_without_silos_has_no_fill_percent(self):
+        self._deliver_history(28)
+        forecasting.refresh()
+
+        days = forecasting.silo_fill_forecast(self.plant.pk, days=3)
+
+        self.assertEqual(len(days), 3)
+        self.assertTrue(all(day.silo_capacity_l == 0.0 and day.fill_percent is None for day in days))
+        self.assertTrue(all(day.volume_l > 0 for day in days))
+
+    def test_silo_fill_uses_the_latest_silo_generation(self):
+        self._deliver_history(28)
+        forecasting.refresh()
+        for code, day, capacity in (("S-1", self.today - timedelta(days=1), 100), ("S-2", self.today, 400)):
+            Silo.objects.create(
+                plant=self.plant, name=code, code=code, capacity_liters=Decimal(capacity), collection_day=day
+            )
+
+        [day] = forecasting.silo_fill_forecast(self.plant.pk, days=1)
+
+        self.assertEqual(day.silo_capacity_l, 400.0)
+        self.assertAlmostEqual(day.fill_percent, day.volume_l / 4)
+
+    def test_importing_back_dated_lots_refits_their_suppliers(self):
+        record_version(self.route.pk, {}, effective_from=self.start)
+        self._deliver_history(28)
+        bystander = make_supplier("bystander", Route.objects.create(name="South"))
+        self._deliver(bystander, self.start, 50.0)
+        forecasting.refresh()
+        untouched = self._states()[(forecasting.SUPPLIER, bystander.pk)]
+
+        report = imports.run(
+            "milk-lots",
+            csv_lines(LOT_HEADER, ["farmer0", self.today - timedelta(days=3), 500.0, *QUALITY.values(), 0.0]),
+        )
+        self.assertTrue(report.committed)
+        refitted = self._states()
+
+        forecasting.refresh(refit=True)
+        self.assertStatesEqual(refitted, self._states())
+        self.assertEqual(refitted[(forecasting.SUPPLIER, bystander.pk)], untouched)
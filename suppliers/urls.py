@@ -1,6 +1,6 @@
 from django.urls import path
 from .views import create_supplier, supplier_list, create_milk_lot_view,milk_lot_result_list_view,\
-    edit_milk_lot,create_payment_bill, on_farm_bulk_pooling, canCollection, view_payment_bill, tanker_usage, bill_details_view
+    edit_milk_lot,create_payment_bill, on_farm_bulk_pooling, canCollection, view_payment_bill, tanker_usage, bill_details_view, import_view
 
 urlpatterns = [
     path('suppliers/', supplier_list, name='supplier_list'),
@@ -14,4 +14,5 @@ urlpatterns = [
     path('create-Payment-Bill/', create_payment_bill, name='create_payment_bill'),
     path("bills/<int:bill_id>/invoice/", view_payment_bill, name="view_payment_bill"),
     path("bill/<int:bill_id>/details/", bill_details_view, name="bill_details_view"),
+    path("imports/<slug:kind>/", import_view, name="import_csv"),
 ]
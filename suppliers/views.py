@@ -1,9 +1,16 @@
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
+from django.http import Http404, JsonResponse
+from django.views.decorators.http import require_POST
+import codecs
 import qrcode
 import base64
 from io import BytesIO
 
+from accounts.utils import jwt_login_required
+
+from . import imports
+
 @login_required
 def supplier_list(request):
     request._page_title = "Suppliers Record"
@@ -48,4 +55,27 @@ def view_payment_bill(request,bill_id):
     return render(request, "suppliers/payment_invoice.html",{"bill_id": bill_id, "qr_code": qr_base64})
 
 def bill_details_view(request, bill_id):
-    return render(request, "suppliers/bill_details.html", {"bill_id": bill_id})
\ No newline at end of file
+    return render(request, "suppliers/bill_details.html", {"bill_id": bill_id})
+
+
+@require_POST
+@jwt_login_required
+def import_view(request, kind):
+    """
+    Import the uploaded CSV ``file`` as ``kind`` (suppliers, milk-lots,
+    lab-results) and return the report as JSON; ``dry_run=1`` only validates.
+    """
+    if kind not in imports.IMPORTERS:
+        raise Http404("Unknown import")
+    if not imports.can_import(request.user, kind):
+        return JsonResponse({"error": "You are not allowed to run this import."}, status=403)
+    upload = request.FILES.get("file")
+    if upload is None:
+        return JsonResponse({"error": "Attach the CSV as 'file'."}, status=400)
+
+    dry_run = request.POST.get("dry_run", "").lower() in ("1", "true", "yes")
+    try:
+        report = imports.run(kind, codecs.iterdecode(upload, "utf-8-sig"), dry_run=dry_run)
+    except UnicodeDecodeError:
+        return JsonResponse({"error": "The file is not UTF-8 encoded."}, status=400)
+    return JsonResponse(report.as_dict(), status=400 if report.error_count else 200)